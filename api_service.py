@@ -0,0 +1,542 @@
+from __future__ import annotations
+import asyncio, hmac, json, os, re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from datetime import date
+from functools import partial
+from typing import Awaitable, Callable
+from urllib.parse import parse_qs
+
+from auth_service import signup
+from interactions_service import EVENT_WEIGHTS, get_user_interactions, log_interaction, log_interactions_bulk
+from metrics_service import histogram
+from recommender_service import TOP_N_PROPERTIES, produce_top_matches
+from resources_service import get_catalog_resources
+from sessions_service import get_current_user, login, logout
+from trending_service import WINDOWS
+from users_service import USER_FIELDS, User, get_user_by_id, update_user
+
+# Threads for CPU-bound work (PBKDF2, scoring) and for JSON file I/O
+CPU_WORKERS = int(os.environ.get("API_CPU_WORKERS", str(os.cpu_count() or 1)))
+IO_WORKERS = int(os.environ.get("API_IO_WORKERS", "8"))
+# Shared secret for service-to-service endpoints (batch recommendations); those endpoints are off when unset
+SERVICE_KEY = os.environ.get("API_SERVICE_KEY", "")
+
+MAX_BODY_BYTES = 1024 * 1024
+MAX_BATCH = 500
+# Accepted ranges of the numeric user fields
+MAX_GROUP_SIZE = 100
+MAX_BUDGET = 1_000_000
+
+"""
+A JSON HTTP API over the services, as a plain ASGI application (no web framework needed), so the auth, interaction
+and recommendation logic can run in API workers separate from the Streamlit UI. The workers keep no state of their
+own (everything lives in the data files and the per-process caches that follow them), so several can run side by side:
+
+    uvicorn api_service:app --workers 4      # or: python api_service.py --workers 4 (needs uvicorn)
+
+Routes (JSON in and out; 'auth' means an 'Authorization: Bearer <token>' header from POST /sessions):
+    GET    /health
+    POST   /users                      sign up              {email, first_name, last_name, password, ...preferences}
+    POST   /sessions                   log in               {email, password} -> {token, user_id}
+    GET    /sessions/me         auth   the current user
+    DELETE /sessions/me         auth   log out
+    GET    /users/me            auth   the current user
+    PATCH  /users/me            auth   update preferences   {group_size, budget_max, ...}
+    GET    /interactions        auth   the user's interactions
+    POST   /interactions        auth   log one              {property_id, event}
+    POST   /interactions/batch  auth   log several at once  {events: [{property_id, event}, ...]}
+    GET    /recommendations     auth   top picks            ?n=10&trending_window=24h&near=lat,lon
+    POST   /recommendations/batch      picks for many users {user_ids: [...], n} (needs 'X-Api-Key: API_SERVICE_KEY')
+
+Handlers never block the event loop: password hashing and scoring run on a CPU thread pool (API_CPU_WORKERS) and file
+access on an I/O pool (API_IO_WORKERS). Responses always carry Content-Length, so servers keep connections alive.
+Errors are JSON {"error": "..."} with 400 (invalid input), 401, 403, 404, 405, 413 or 500 (anything else, without
+details). Handlers raise HttpError for every expected error; an exception escaping a handler is a server bug.
+
+ApiClient calls the application in-process, for tests and scripts.
+"""
+
+_REQUEST_SECONDS = histogram("api_request_seconds", "API request latency by route and status", ("route", "status"))
+
+_cpu_pool = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="api-cpu")
+_io_pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="api-io")
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+class Request:
+    def __init__(self, scope: dict, body: bytes, params: dict[str, str]):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.params = params
+        self.query = {k: v[-1] for k, v in parse_qs(scope.get("query_string", b"").decode("latin-1")).items()}
+        self.headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        self._body = body
+
+    def json(self) -> dict:
+        """
+        Parse the body as a JSON object
+
+        :return: the object ({} for an empty body)
+        """
+        if not self._body:
+            return {}
+        try:
+            data = json.loads(self._body)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            raise HttpError(400, "Body must be JSON")
+        if not isinstance(data, dict):
+            raise HttpError(400, "Body must be a JSON object")
+        return data
+
+# ======================================================================================================================
+# HELPER FUNCTIONS (for internal use)
+# ======================================================================================================================
+
+Handler = Callable[[Request], Awaitable[tuple[int, object]]]
+_routes: list[tuple[str, re.Pattern, str, Handler]] = []
+
+def _route(method: str, pattern: str) -> Callable[[Handler], Handler]:
+    """
+    Register a handler for a method and path pattern ('{name}' matches one path segment)
+
+    :param method: the HTTP method
+    :param pattern: the path pattern
+    :return: the decorator
+    """
+    regex = re.compile("^" + re.sub(r"\{(\w+)\}", r"(?P<\1>[^/]+)", pattern) + "$")
+
+    def decorator(handler: Handler) -> Handler:
+        _routes.append((method, regex, pattern, handler))
+        return handler
+    return decorator
+
+async def _cpu(fn: Callable, *args, **kwargs):
+    """
+    Run CPU-bound work on the CPU pool
+
+    :param fn: the function
+    :return: its result
+    """
+    return await asyncio.get_running_loop().run_in_executor(_cpu_pool, partial(fn, *args, **kwargs))
+
+async def _io(fn: Callable, *args, **kwargs):
+    """
+    Run blocking file access on the I/O pool
+
+    :param fn: the function
+    :return: its result
+    """
+    return await asyncio.get_running_loop().run_in_executor(_io_pool, partial(fn, *args, **kwargs))
+
+def _public_user(user: User) -> dict:
+    """
+    Serialize a user without their password hash
+
+    :param user: the user
+    :return: the user's fields
+    """
+    out = asdict(user)
+    out.pop("password_hash", None)
+    return out
+
+def _number(name: str, value, lo: float, hi: float, integer: bool = False):
+    """
+    Check a numeric user field
+
+    :param name: the field name
+    :param value: the value (None clears the field)
+    :param lo: the minimum (inclusive)
+    :param hi: the maximum (inclusive)
+    :param integer: only accept integers
+    :return: the value
+    """
+    kinds = int if integer else (int, float)
+    if value is not None and (isinstance(value, bool) or not isinstance(value, kinds) or not lo <= value <= hi):
+        raise HttpError(400, f"{name} must be {'an integer' if integer else 'a number'} between {lo} and {hi}")
+    return value
+
+def _date(name: str, value) -> str | None:
+    """
+    Check a date user field
+
+    :param name: the field name
+    :param value: the value (None clears the field)
+    :return: the value
+    """
+    if value is None:
+        return None
+    try:
+        date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise HttpError(400, f"{name} must be a date (YYYY-MM-DD)")
+    return value
+
+def _preferences(data: dict, current: User | None = None) -> dict:
+    """
+    Pick the user fields out of a request body, rejecting unknown fields and invalid values
+
+    :param data: the body
+    :param current: the user being updated (their other fields are checked against the new values), if any
+    :return: the user fields
+    """
+    unknown = set(data) - USER_FIELDS
+    if unknown:
+        raise HttpError(400, f"Unknown fields: {', '.join(sorted(unknown))}")
+    for name in ("email", "first_name", "last_name"):
+        if name in data and (not isinstance(data[name], str) or not data[name].strip()):
+            raise HttpError(400, f"{name} must be a non-empty string")
+    if "email" in data and "@" not in data["email"]:
+        raise HttpError(400, "email must be an email address")
+    if data.get("preferred_env") is not None and not isinstance(data["preferred_env"], str):
+        raise HttpError(400, "preferred_env must be a string")
+    _number("group_size", data.get("group_size"), 1, MAX_GROUP_SIZE, integer=True)
+    for name in ("budget_min", "budget_max"):
+        _number(name, data.get(name), 0, MAX_BUDGET)
+    for name in ("travel_start", "travel_end"):
+        _date(name, data.get(name))
+
+    merged = {**(asdict(current) if current is not None else {}), **data}
+    low, high = merged.get("budget_min"), merged.get("budget_max")
+    if isinstance(low, (int, float)) and isinstance(high, (int, float)) and low > high:
+        raise HttpError(400, "budget_min must not exceed budget_max")
+    start, end = merged.get("travel_start"), merged.get("travel_end")
+    if isinstance(start, str) and isinstance(end, str) and start and end and end <= start:
+        raise HttpError(400, "travel_end must be after travel_start")
+    return data
+
+def _required(data: dict, *names: str) -> list:
+    """
+    Return required body fields
+
+    :param data: the body
+    :param names: the field names
+    :return: the values, in order
+    """
+    missing = [n for n in names if data.get(n) in (None, "")]
+    if missing:
+        raise HttpError(400, f"Missing fields: {', '.join(missing)}")
+    return [data[n] for n in names]
+
+async def _current_user(req: Request) -> User:
+    """
+    Return the user of the request's bearer token
+
+    :param req: the request
+    :return: the user
+    """
+    scheme, _, token = req.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HttpError(401, "Missing bearer token")
+    user = await _io(get_current_user, token.strip())
+    if user is None:
+        raise HttpError(401, "Invalid or expired token")
+    return user
+
+def _check_service_key(req: Request) -> None:
+    """
+    Require the service key for service-to-service endpoints
+
+    :param req: the request
+    :return: None
+    """
+    if not SERVICE_KEY:
+        raise HttpError(403, "Service endpoints are disabled (API_SERVICE_KEY is not set)")
+    if not hmac.compare_digest(req.headers.get("x-api-key", "").encode(), SERVICE_KEY.encode()):
+        raise HttpError(403, "Invalid service key")
+
+def _event(item: dict) -> tuple[str, str]:
+    """
+    Validate one interaction from a request body
+
+    :param item: {property_id, event}
+    :return: (property id, event)
+    """
+    if not isinstance(item, dict):
+        raise HttpError(400, "Each event must be an object")
+    property_id, event = _required(item, "property_id", "event")
+    if event not in EVENT_WEIGHTS:
+        raise HttpError(400, f"event must be one of {', '.join(EVENT_WEIGHTS)}")
+    return str(property_id), event
+
+def _pick_options(query: dict) -> dict:
+    """
+    Parse the options of produce_top_matches from a query string or body
+
+    :param query: the parameters
+    :return: keyword arguments for produce_top_matches
+    """
+    out = {}
+    try:
+        out["n"] = int(query.get("n", TOP_N_PROPERTIES))
+        if query.get("near"):
+            lat, lon = (float(v) for v in str(query["near"]).split(","))
+            out["near"] = (lat, lon)
+    except ValueError:
+        raise HttpError(400, "n must be an integer and near must be 'lat,lon'")
+    if not 1 <= out["n"] <= 100:
+        raise HttpError(400, "n must be between 1 and 100")
+    if query.get("trending_window"):
+        if query["trending_window"] not in WINDOWS:
+            raise HttpError(400, f"trending_window must be one of {', '.join(WINDOWS)}")
+        out["trending_window"] = query["trending_window"]
+    return out
+
+async def _read_body(receive: Callable) -> bytes:
+    """
+    Read the whole request body
+
+    :param receive: the ASGI receive callable
+    :return: the body
+    """
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise HttpError(400, "Client disconnected")
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            raise HttpError(413, "Request body too large")
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+async def _send_json(send: Callable, status: int, payload: object) -> None:
+    """
+    Send a JSON response
+
+    :param send: the ASGI send callable
+    :param status: the HTTP status
+    :param payload: the JSON-serializable body
+    :return: None
+    """
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+async def _lifespan(receive: Callable, send: Callable) -> None:
+    """
+    Handle the ASGI lifespan protocol (shut the pools down with the server)
+
+    :param receive: the ASGI receive callable
+    :param send: the ASGI send callable
+    :return: None
+    """
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            _cpu_pool.shutdown(wait=False)
+            _io_pool.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+# ======================================================================================================================
+# ROUTES
+# ======================================================================================================================
+
+@_route("GET", "/health")
+async def _health(req: Request):
+    return 200, {"status": "ok"}
+
+@_route("POST", "/users")
+async def _signup(req: Request):
+    data = req.json()
+    email, first_name, last_name, password = _required(data, "email", "first_name", "last_name", "password")
+    fields = _preferences({k: v for k, v in data.items() if k != "password"})
+    for name in ("email", "first_name", "last_name"):
+        fields.pop(name)
+    try:
+        user = await _cpu(signup, email=email, first_name=first_name, last_name=last_name, password=password,
+                          **fields)
+    except ValueError as e:
+        raise HttpError(400, str(e))
+    return 201, _public_user(user)
+
+@_route("POST", "/sessions")
+async def _login(req: Request):
+    email, password = _required(req.json(), "email", "password")
+    try:
+        token, user_id = await _cpu(login, email, password)
+    except ValueError:
+        raise HttpError(401, "Invalid email or password")
+    return 201, {"token": token, "user_id": user_id}
+
+@_route("GET", "/sessions/me")
+@_route("GET", "/users/me")
+async def _me(req: Request):
+    return 200, _public_user(await _current_user(req))
+
+@_route("DELETE", "/sessions/me")
+async def _logout(req: Request):
+    await _current_user(req)
+    token = req.headers["authorization"].partition(" ")[2].strip()
+    return 200, {"logged_out": await _io(logout, token)}
+
+@_route("PATCH", "/users/me")
+async def _update_me(req: Request):
+    user = await _current_user(req)
+    fields = _preferences(req.json(), current=user)
+    try:
+        return 200, _public_user(await _io(update_user, user.id, **fields))
+    except KeyError:
+        raise HttpError(404, "User not found")
+    except ValueError as e:
+        raise HttpError(400, str(e))
+
+@_route("GET", "/interactions")
+async def _interactions(req: Request):
+    user = await _current_user(req)
+    return 200, {"interactions": await _io(get_user_interactions, user.id)}
+
+@_route("POST", "/interactions")
+async def _log(req: Request):
+    user = await _current_user(req)
+    property_id, event = _event(req.json())
+    if property_id not in (await _io(get_catalog_resources)).index:
+        raise HttpError(400, f"unknown property {property_id}")
+    return 201, await _io(log_interaction, user.id, property_id, event)
+
+@_route("POST", "/interactions/batch")
+async def _log_batch(req: Request):
+    user = await _current_user(req)
+    items = req.json().get("events")
+    if not isinstance(items, list) or not 0 < len(items) <= MAX_BATCH:
+        raise HttpError(400, f"events must be a list of 1 to {MAX_BATCH} events")
+    events = [{"user_id": user.id, "property_id": pid, "event": event} for pid, event in map(_event, items)]
+    try:
+        return 201, {"interactions": await _io(log_interactions_bulk, events)}
+    except ValueError as e:
+        raise HttpError(400, str(e))
+
+@_route("GET", "/recommendations")
+async def _recommendations(req: Request):
+    user = await _current_user(req)
+    return 200, {"results": await _cpu(produce_top_matches, user, **_pick_options(req.query))}
+
+@_route("POST", "/recommendations/batch")
+async def _recommendations_batch(req: Request):
+    _check_service_key(req)
+    data = req.json()
+    user_ids = data.get("user_ids")
+    if not isinstance(user_ids, list) or not 0 < len(user_ids) <= MAX_BATCH:
+        raise HttpError(400, f"user_ids must be a list of 1 to {MAX_BATCH} ids")
+    options = _pick_options(data)
+
+    async def one(user_id: str):
+        user = await _io(get_user_by_id, str(user_id))
+        return None if user is None else await _cpu(produce_top_matches, user, **options)
+    results = await asyncio.gather(*(one(u) for u in user_ids))
+    return 200, {"results": dict(zip(map(str, user_ids), results))}
+
+# ======================================================================================================================
+# API-STYLE FUNCTIONS
+# ======================================================================================================================
+
+async def app(scope: dict, receive: Callable, send: Callable) -> None:
+    """
+    The ASGI application
+
+    :param scope: the connection scope
+    :param receive: the ASGI receive callable
+    :param send: the ASGI send callable
+    :return: None
+    """
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        raise RuntimeError(f"Unsupported ASGI scope type: {scope['type']}")
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    route = "unmatched"
+    try:
+        matched = [(m, r, p, h) for m, r, p, h in _routes if r.match(scope["path"])]
+        if not matched:
+            raise HttpError(404, "Not found")
+        for method, regex, pattern, handler in matched:
+            if method == scope["method"]:
+                route = pattern
+                req = Request(scope, await _read_body(receive), regex.match(scope["path"]).groupdict())
+                status, payload = await handler(req)
+                break
+        else:
+            raise HttpError(405, "Method not allowed")
+    except HttpError as e:
+        status, payload = e.status, {"error": str(e)}
+    except Exception:
+        status, payload = 500, {"error": "Internal server error"}
+    await _send_json(send, status, payload)
+    _REQUEST_SECONDS.observe(loop.time() - start, route=route, status=status)
+
+class ApiClient:
+    """
+    Calls the ASGI application in-process, for tests and scripts
+
+    Example:
+        client = ApiClient()
+        status, body = client.request("POST", "/sessions", {"email": ..., "password": ...})
+    """
+
+    def __init__(self, application: Callable = app):
+        self.application = application
+
+    def request(self, method: str, path: str, body: dict | None = None, headers: dict[str, str] | None = None,
+                token: str | None = None) -> tuple[int, object]:
+        """
+        Send one request
+
+        :param method: the HTTP method
+        :param path: the path, optionally with a query string
+        :param body: the JSON body
+        :param headers: extra headers
+        :param token: a session token to send as a bearer token
+        :return: (status, decoded JSON body)
+        """
+        return asyncio.run(self._request(method, path, body, headers, token))
+
+    async def _request(self, method, path, body, headers, token) -> tuple[int, object]:
+        path, _, query = path.partition("?")
+        headers = dict(headers or {})
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        raw = b"" if body is None else json.dumps(body).encode("utf-8")
+        scope = {
+            "type": "http", "method": method.upper(), "path": path, "query_string": query.encode("latin-1"),
+            "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()],
+        }
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": raw, "more_body": False}
+
+        async def send(message):
+            sent.append(message)
+
+        await self.application(scope, receive, send)
+        status = sent[0]["status"]
+        payload = b"".join(m.get("body", b"") for m in sent[1:])
+        return status, json.loads(payload) if payload else None
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve the JSON API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+    try:
+        import uvicorn
+    except ImportError:
+        raise RuntimeError("Serving the API needs an ASGI server: pip install uvicorn")
+    uvicorn.run("api_service:app", host=args.host, port=args.port, workers=args.workers)
@@ -4,6 +4,8 @@ from datetime import datetime
 from users_service import User, get_user_by_email, create_user, set_user_password_hash, get_user_by_id
 import hmac
 
+from metrics_service import histogram
+
 _ALGO = "pbkdf2_sha256"
 _ITER = 310000
 
@@ -23,6 +25,8 @@ Re-derive the hash with the provided plaintext: pbkdf2_hmac("sha256", provided_p
 Compare the derived password to the expected password
 """
 
+_HASH_SECONDS = histogram("password_hash_seconds", "Time spent deriving PBKDF2 password hashes", ("op",))
+
 # ======================================================================================================================
 # HELPERS
 # ======================================================================================================================
@@ -34,6 +38,7 @@ def _now_iso() -> str:
     """
     return datetime.isoformat(timespec="seconds")
 
+@_HASH_SECONDS.timed(op="hash")
 def _hash_password(plain_password: str) -> str:
     """
       Hashes the plain_password and returns the hash in the form 'pbkdf2_sha256$ITER$SALT_HEX$HASH_HEX'
@@ -47,6 +52,7 @@ def _hash_password(plain_password: str) -> str:
     dk = hashlib.pbkdf2_hmac("sha256", plain_password.encode("utf-8"), salt, _ITER)
     return f"{_ALGO}${_ITER}${binascii.hexlify(salt).decode()}${binascii.hexlify(dk).decode()}"
 
+@_HASH_SECONDS.timed(op="verify")
 def _verify_password(plain_password: str, stored_password: str) -> bool:
     """
       Checks if the plain password matches the stored password by hashing it
@@ -100,7 +106,6 @@ def verify_user_password(user_id: str, password: str) -> bool:
       :return: TRUE if the user if verified; FALSE otherwise
     """
     user = get_user_by_id(user_id)
-    print(user)
     if not user:
         raise ValueError(f"The user with user id {user_id} was not found")
     elif not user.password_hash:
@@ -0,0 +1,281 @@
+from __future__ import annotations
+import bisect, csv, json, threading
+from datetime import date
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Iterator
+
+from storage_service import atomic_write_text, file_lock
+
+if TYPE_CHECKING:
+    import numpy as np
+
+AVAILABILITY_PATH = Path(__file__).parent / "data" / "availability.json"
+
+# Reasons a listing can be unavailable
+KIND_BOOKED = "booked"
+KIND_BLOCKED = "blocked"
+KINDS = (KIND_BOOKED, KIND_BLOCKED)
+
+# Per-listing keys are offset by this many days so every listing's intervals sort into their own range
+_ROW_STRIDE = 10_000_000
+
+"""
+Availability calendars for listings. data/availability.json maps each property id to its unavailable intervals:
+    {"prop3": [{"start": "2025-07-01", "end": "2025-07-08", "kind": "booked"}, ...], ...}
+Intervals are half-open [start, end) in nights: a stay from 07-01 to 07-08 occupies the nights of the 1st through the
+7th, so another stay may start on the 8th. Listings without a calendar are always available.
+
+AvailabilityIndex turns the calendars into sorted arrays: every listing's intervals are merged (overlapping or touching
+intervals become one) and stored contiguously, sorted by start day. Because merged intervals do not overlap, their
+ends are sorted too, so a stay [s, e) conflicts with a listing iff the last interval starting before e ends after s:
+one binary search per listing. available_mask() runs that search for many listings at once with a single vectorized
+np.searchsorted over keys of the form row * _ROW_STRIDE + day.
+
+get_availability_index() returns a process-wide index rebuilt when the calendar file changes. Calendars are written
+under a file lock and replaced atomically; ingest_calendar() applies any number of intervals in one write.
+"""
+
+class AvailabilityIndex:
+    def __init__(self, calendars: dict[str, list[dict]]):
+        import numpy as np
+
+        self._rows: dict[str, int] = {}
+        starts: list[int] = []
+        ends: list[int] = []
+        offsets = [0]
+        for pid, intervals in calendars.items():
+            merged = _merge([(_day(i["start"]), _day(i["end"])) for i in intervals])
+            self._rows[pid] = len(offsets) - 1
+            starts += [s for s, _ in merged]
+            ends += [e for _, e in merged]
+            offsets.append(len(starts))
+
+        self._offsets = np.array(offsets, dtype=np.int64)
+        self._starts = np.array(starts, dtype=np.int64)
+        self._ends = np.array(ends, dtype=np.int64)
+        row_of = np.repeat(np.arange(len(offsets) - 1, dtype=np.int64), np.diff(self._offsets))
+        self._keys = row_of * _ROW_STRIDE + self._starts
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def is_available(self, property_id: str, start: str | date, end: str | date) -> bool:
+        """
+        Return whether a listing is free for every night of [start, end)
+
+        :param property_id: the property's id
+        :param start: the first night (ISO date or date)
+        :param end: the check-out day (ISO date or date)
+        :return: TRUE if no unavailable interval overlaps the stay; FALSE otherwise
+        """
+        s, e = _stay(start, end)
+        row = self._rows.get(property_id)
+        if row is None:
+            return True
+        lo, hi = int(self._offsets[row]), int(self._offsets[row + 1])
+        i = bisect.bisect_left(self._starts, e, lo, hi) - 1
+        return i < lo or int(self._ends[i]) <= s
+
+    def available_mask(self, property_ids: Iterable[str], start: str | date, end: str | date) -> np.ndarray:
+        """
+        Vectorized is_available over many listings
+
+        :param property_ids: the property ids
+        :param start: the first night (ISO date or date)
+        :param end: the check-out day (ISO date or date)
+        :return: a boolean array aligned with property_ids
+        """
+        import numpy as np
+
+        s, e = _stay(start, end)
+        rows = np.fromiter((self._rows.get(pid, -1) for pid in property_ids), dtype=np.int64)
+        known = rows >= 0
+        free = np.ones(len(rows), dtype=bool)
+        if not known.any() or not len(self._keys):
+            return free
+        r = rows[known]
+        i = np.searchsorted(self._keys, r * _ROW_STRIDE + e, side="left") - 1
+        has_prior = i >= self._offsets[r]
+        free[known] = ~has_prior | (self._ends[np.maximum(i, 0)] <= s)
+        return free
+
+    def available_ids(self, property_ids: Iterable[str], start: str | date, end: str | date) -> list[str]:
+        """
+        Return the listings that are free for [start, end)
+
+        :param property_ids: the property ids to check
+        :param start: the first night (ISO date or date)
+        :param end: the check-out day (ISO date or date)
+        :return: the available property ids, in the given order
+        """
+        ids = list(property_ids)
+        mask = self.available_mask(ids, start, end)
+        return [pid for pid, ok in zip(ids, mask.tolist()) if ok]
+
+# ======================================================================================================================
+# HELPER FUNCTIONS (for internal use)
+# ======================================================================================================================
+
+_index: AvailabilityIndex | None = None
+_index_fingerprint: tuple | None = None
+_index_lock = threading.Lock()
+
+def _day(value: str | date) -> int:
+    """
+    Convert an ISO date (or date) to a day number
+
+    :param value: the date
+    :return: the proleptic Gregorian ordinal
+    """
+    if isinstance(value, date):
+        return value.toordinal()
+    try:
+        return date.fromisoformat(str(value)[:10]).toordinal()
+    except ValueError:
+        raise ValueError(f"Invalid date: {value!r}")
+
+def _stay(start: str | date, end: str | date) -> tuple[int, int]:
+    """
+    Convert a stay to day numbers
+
+    :param start: the first night
+    :param end: the check-out day
+    :return: (start day, end day)
+    """
+    s, e = _day(start), _day(end)
+    if e <= s:
+        raise ValueError("end must be after start")
+    return s, e
+
+def _merge(intervals: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    """
+    Sort intervals and merge the ones that overlap or touch
+
+    :param intervals: (start day, end day) pairs
+    :return: disjoint intervals sorted by start
+    """
+    merged: list[list[int]] = []
+    for s, e in sorted(intervals):
+        if merged and s <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], e)
+        else:
+            merged.append([s, e])
+    return [(s, e) for s, e in merged]
+
+def _fingerprint() -> tuple:
+    """
+    Return a value that changes whenever the calendar file does
+
+    :return: (file size, modification time in ns)
+    """
+    try:
+        stat = AVAILABILITY_PATH.stat()
+        return stat.st_size, stat.st_mtime_ns
+    except FileNotFoundError:
+        return 0, 0
+
+def _interval(row: dict) -> tuple[str, dict]:
+    """
+    Validate one calendar row
+
+    :param row: a dictionary with property_id, start, end and optionally kind
+    :return: (property id, stored interval)
+    """
+    pid = str(row.get("property_id") or "").strip()
+    if not pid:
+        raise ValueError("Calendar rows need a property_id")
+    kind = row.get("kind") or KIND_BOOKED
+    if kind not in KINDS:
+        raise ValueError(f"Unknown calendar kind: {kind}")
+    s, e = _stay(row.get("start"), row.get("end"))
+    return pid, {"start": date.fromordinal(s).isoformat(), "end": date.fromordinal(e).isoformat(), "kind": kind}
+
+# ======================================================================================================================
+# API-STYLE FUNCTIONS
+# ======================================================================================================================
+
+def load_availability() -> dict[str, list[dict]]:
+    """
+    Load every listing's calendar
+
+    :return: property id -> unavailable intervals
+    """
+    try:
+        return json.loads(AVAILABILITY_PATH.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {}
+    except json.JSONDecodeError:
+        raise RuntimeError("Availability file is corrupted")
+
+def ingest_calendar(rows: Iterable[dict], replace: bool = False) -> int:
+    """
+    Add many unavailable intervals in one write
+
+    :param rows: dictionaries with property_id, start, end (ISO dates, end exclusive) and optionally kind
+    :param replace: replace the calendars of the listings present in rows instead of adding to them
+    :return: the number of intervals ingested
+    """
+    parsed: dict[str, list[dict]] = {}
+    for row in rows:
+        pid, interval = _interval(row)
+        parsed.setdefault(pid, []).append(interval)
+    if not parsed:
+        return 0
+    with file_lock(AVAILABILITY_PATH):
+        calendars = load_availability()
+        for pid, intervals in parsed.items():
+            existing = [] if replace else calendars.get(pid, [])
+            calendars[pid] = sorted(existing + intervals, key=lambda i: (i["start"], i["end"]))
+        atomic_write_text(AVAILABILITY_PATH, json.dumps(calendars))
+    return sum(len(v) for v in parsed.values())
+
+def block_dates(property_id: str, start: str | date, end: str | date, kind: str = KIND_BOOKED) -> None:
+    """
+    Mark a listing unavailable for [start, end)
+
+    :param property_id: the property's id
+    :param start: the first night
+    :param end: the first night the listing is free again
+    :param kind: 'booked' or 'blocked'
+    :return: None
+    """
+    ingest_calendar([{"property_id": property_id, "start": str(start), "end": str(end), "kind": kind}])
+
+def read_calendar_file(path: str | Path) -> Iterator[dict]:
+    """
+    Read calendar rows from a .csv (header: property_id,start,end[,kind]) or .jsonl file, for ingest_calendar
+
+    :param path: the file
+    :return: an iterator of rows
+    """
+    path = Path(path)
+    with path.open("r", encoding="utf-8", newline="") as f:
+        if path.suffix.lower() == ".csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def get_availability_index() -> AvailabilityIndex:
+    """
+    Return the process-wide index, rebuilt when the calendar file changes
+
+    :return: the index
+    """
+    global _index, _index_fingerprint
+    with _index_lock:
+        fingerprint = _fingerprint()
+        if _index is None or _index_fingerprint != fingerprint:
+            _index = AvailabilityIndex(load_availability())
+            _index_fingerprint = fingerprint
+        return _index
+
+def reset_availability_file() -> None:
+    """
+    Clear every calendar. For dev/testing purposes.
+
+    :return: None
+    """
+    with file_lock(AVAILABILITY_PATH):
+        atomic_write_text(AVAILABILITY_PATH, "{}")
@@ -0,0 +1,139 @@
+from __future__ import annotations
+import argparse, json, os, statistics, subprocess, sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+BASELINE_PATH = Path(__file__).parent / "import_time_baseline.json"
+
+MODULES = [
+    "users_service",
+    "auth_service",
+    "sessions_service",
+    "interactions_service",
+    "properties_service",
+    "recommender_service",
+    "visualization_service",
+]
+
+# Modules that must not be loaded just by importing a service
+HEAVY_MODULES = {"pandas", "numpy", "requests", "config_private"}
+
+DEFAULT_TOLERANCE = 0.25
+# Absolute slack so a few hundred microseconds of noise on tiny modules is never a regression
+SLACK_US = 2000
+DEFAULT_REPEATS = 5
+
+"""
+Measures the cold import cost of every service module with 'python -X importtime'. Each module is imported in a fresh
+interpreter several times and the median cumulative time is reported, together with any heavy dependency that was
+pulled in at import time.
+
+Usage (from the project root):
+    python benchmarks/import_time.py                    # report and compare against the baseline
+    python benchmarks/import_time.py --update-baseline  # record a new baseline
+
+Exits with status 1 if a module regressed by more than the tolerance or started importing a heavy dependency.
+Timings are machine-dependent; re-record the baseline when moving to different hardware.
+"""
+
+# ======================================================================================================================
+# HELPERS
+# ======================================================================================================================
+
+def _import_once(module: str) -> tuple[int, set[str]]:
+    """
+    Import a module in a fresh interpreter and parse the -X importtime report
+
+    :param module: the module name
+    :return: the cumulative import time in microseconds and the set of top-level packages imported
+    """
+    env = {**os.environ, "PYTHONPATH": str(ROOT), "PYTHONDONTWRITEBYTECODE": "1"}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr}")
+
+    cumulative = 0
+    imported: set[str] = set()
+    for line in proc.stderr.splitlines():
+        # Format: "import time: <self us> | <cumulative us> | <indented name>"
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            cum = int(parts[1])
+        except ValueError:
+            continue  # header row
+        name = parts[2].strip()
+        imported.add(name.split(".")[0])
+        if name == module:
+            cumulative = cum
+    return cumulative, imported
+
+def measure(modules: list[str], repeats: int = DEFAULT_REPEATS) -> dict[str, dict]:
+    """
+    Measure each module's median cold import time
+
+    :param modules: the modules to measure
+    :param repeats: the number of fresh interpreters per module
+    :return: a dictionary of module -> {"median_us", "heavy"}
+    """
+    results = {}
+    for module in modules:
+        times, heavy = [], set()
+        for _ in range(repeats):
+            us, imported = _import_once(module)
+            times.append(us)
+            heavy |= imported & HEAVY_MODULES
+        results[module] = {"median_us": int(statistics.median(times)), "heavy": sorted(heavy)}
+    return results
+
+def compare(results: dict[str, dict], baseline: dict[str, dict], tolerance: float) -> list[str]:
+    """
+    Compare results against a baseline
+
+    :param results: the new measurements
+    :param baseline: the recorded baseline
+    :param tolerance: the allowed relative slowdown (0.25 = 25%), on top of SLACK_US
+    :return: a list of human-readable regressions (empty if none)
+    """
+    problems = []
+    for module, res in results.items():
+        if res["heavy"]:
+            problems.append(f"{module} imports heavy dependencies at import time: {', '.join(res['heavy'])}")
+        base = baseline.get(module)
+        if base and res["median_us"] > base["median_us"] * (1 + tolerance) + SLACK_US:
+            problems.append(f"{module}: {res['median_us']}us vs baseline {base['median_us']}us")
+    return problems
+
+# ======================================================================================================================
+# ENTRY POINT
+# ======================================================================================================================
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure service module import times")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    results = measure(MODULES, args.repeats)
+    for module, res in results.items():
+        heavy = f"  (heavy: {', '.join(res['heavy'])})" if res["heavy"] else ""
+        print(f"{module:<24}{res['median_us'] / 1000:>8.1f} ms{heavy}")
+
+    if args.update_baseline:
+        BASELINE_PATH.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+        print(f"Baseline written to {BASELINE_PATH}")
+        return 0
+
+    baseline = json.loads(BASELINE_PATH.read_text(encoding="utf-8")) if BASELINE_PATH.exists() else {}
+    problems = compare(results, baseline, args.tolerance)
+    for p in problems:
+        print("REGRESSION:", p)
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
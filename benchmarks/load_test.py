@@ -0,0 +1,340 @@
+from __future__ import annotations
+import argparse, json, os, random, statistics, sys, tempfile, threading, time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+DEFAULT_PROCESSES = 1
+DEFAULT_THREADS = 8
+DEFAULT_ROUNDS = 5
+DEFAULT_LISTINGS = 500
+DEFAULT_SEED = 8431
+SEARCH_QUERIES = ["", "lake", "cabin", "tofino", "hot tub", "beach house", "whistler", "pool"]
+
+"""
+Load test for the service layer: simulates many concurrent users against the real service modules (same code the
+Streamlit pages call) and reports throughput, latency percentiles, errors, lost updates and time spent in JSON file
+I/O.
+
+Each virtual user runs a realistic script: sign up, log in, then for each round search the Explore index, view a
+listing, sometimes save one and open Top Picks, and finally log out. Users run as threads inside one or more
+processes (--processes x --threads virtual users), so both in-process and cross-process contention on the data files
+is exercised.
+
+Everything runs in a scratch data directory (--data-dir, or a temporary one) holding a synthetic catalog; the LLM is
+stubbed and never called. After the run the data files are checked against what the users were told succeeded:
+interactions, users and sessions that were acknowledged but are missing from disk are reported as lost updates.
+
+Usage (from the project root):
+    python benchmarks/load_test.py --processes 1 --threads 16
+    python benchmarks/load_test.py --processes 4 --threads 4 --rounds 10 --json results.json
+    python benchmarks/load_test.py --pbkdf2-iterations 1000   # make auth cheap to focus on storage
+"""
+
+# ======================================================================================================================
+# HELPERS
+# ======================================================================================================================
+
+def _configure(data_dir: Path, pbkdf2_iterations: int | None) -> None:
+    """
+    Point every service at the scratch data directory and stub the LLM (called in each worker process)
+
+    :param data_dir: the scratch data directory
+    :param pbkdf2_iterations: override the password hashing cost, or None to keep the real one
+    :return: None
+    """
+    os.environ["LLM_OFFLINE"] = "1"
+    import auth_service, availability_service, catalog_feed_service, interactions_service, parallel_scoring_service
+    import properties_service, recommender_service, sessions_service, users_service
+
+    properties_service.PROPERTIES_DATA_PATH = data_dir / "properties.json"
+    catalog_feed_service.CATALOG_FEED_PATH = data_dir / "catalog_changes.jsonl"
+    catalog_feed_service.CATALOG_VERSION_PATH = data_dir / "catalog_version.json"
+    users_service.USERS_DATA_PATH = data_dir / "users.json"
+    sessions_service.SESSIONS_PATH = data_dir / "sessions.json"
+    interactions_service.INTERACTIONS_PATH = data_dir / "interactions.json"
+    # Every acknowledged view must be a record on disk for the lost-update check
+    interactions_service.VIEW_DEDUP_SECONDS = 0
+    recommender_service.DATA_PATH = data_dir / "records.json"
+    availability_service.AVAILABILITY_PATH = data_dir / "availability.json"
+    parallel_scoring_service.SHARDS_DIR = data_dir / "score_shards"
+
+    def _no_llm(*args, **kwargs):
+        raise RuntimeError("The LLM must not be called during a load test")
+
+    properties_service.llm_generate_properties = _no_llm
+    properties_service.llm_stream_properties = _no_llm
+    if pbkdf2_iterations:
+        auth_service._ITER = pbkdf2_iterations
+
+def _prepare(data_dir: Path, listings: int, seed: int) -> None:
+    """
+    Create the scratch data files and a synthetic catalog
+
+    :param data_dir: the scratch data directory
+    :param listings: the catalog size
+    :param seed: the catalog seed
+    :return: None
+    """
+    from synthetic_properties_service import write_synthetic_catalog
+
+    data_dir.mkdir(parents=True, exist_ok=True)
+    for name in ("users.json", "sessions.json", "interactions.json"):
+        (data_dir / name).write_text("[]", encoding="utf-8")
+    write_synthetic_catalog(listings, seed=seed)
+
+def _virtual_user(index: int, rounds: int, seed: int, samples: list, acked: dict, lock: threading.Lock) -> None:
+    """
+    Run one virtual user's script, recording the latency and outcome of every step
+
+    :param index: the virtual user's number (unique across processes)
+    :param rounds: the number of explore rounds
+    :param seed: the run's random seed
+    :param samples: receives (operation, seconds, error type or None)
+    :param acked: receives counts of the writes the services acknowledged
+    :param lock: protects acked
+    :return: None
+    """
+    from auth_service import signup
+    from interactions_service import log_save, log_view
+    from recommender_service import produce_top_matches
+    from search_service import search_properties
+    from sessions_service import login, logout
+
+    rng = random.Random(seed * 100_003 + index)
+    email = f"load{index}@example.com"
+
+    def step(op: str, fn, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            samples.append((op, time.perf_counter() - start, type(e).__name__))
+            return None
+        samples.append((op, time.perf_counter() - start, None))
+        return result
+
+    def ack(key: str) -> None:
+        with lock:
+            acked[key] = acked.get(key, 0) + 1
+
+    user = step("signup", signup, email=email, first_name="Load", last_name=str(index), password="loadtest123",
+                preferred_env=rng.choice(["lake", "beach", "mountain", "city", None]),
+                budget_min=0, budget_max=rng.choice([150, 200, 250, 350]))
+    if user is None:
+        return
+    ack("users")
+    session = step("login", login, email, "loadtest123")
+    if session is None:
+        return
+    ack("sessions")
+    token = session[0]
+
+    for _ in range(rounds):
+        page = step("search", search_properties, rng.choice(SEARCH_QUERIES), page_size=20)
+        results = (page or {}).get("results") or []
+        if not results:
+            continue
+        pid = rng.choice(results)["property_id"]
+        if step("log_view", log_view, user.id, pid) is not None:
+            ack("interactions")
+        if rng.random() < 0.3:
+            if step("log_save", log_save, user.id, pid) is not None:
+                ack("interactions")
+        if rng.random() < 0.5:
+            step("top_picks", produce_top_matches, user)
+
+    step("logout", logout, token)
+
+def _run_worker(data_dir: str, first: int, threads: int, rounds: int, seed: int, pbkdf2_iterations: int | None) -> dict:
+    """
+    Run a group of virtual users as threads in this process
+
+    :param data_dir: the scratch data directory
+    :param first: the number of the group's first virtual user
+    :param threads: the number of virtual users in the group
+    :param rounds: the explore rounds per user
+    :param seed: the run's random seed
+    :param pbkdf2_iterations: see _configure
+    :return: the samples, acknowledged writes and storage metrics of this process
+    """
+    _configure(Path(data_dir), pbkdf2_iterations)
+    from metrics_service import reset_metrics, snapshot
+
+    reset_metrics()
+    samples: list = []
+    acked: dict = {}
+    lock = threading.Lock()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = [pool.submit(_virtual_user, first + i, rounds, seed, samples, acked, lock) for i in range(threads)]
+        for f in futures:
+            f.result()
+    storage = [
+        {"labels": r["labels"], "count": r["count"], "sum": r["sum"]}
+        for r in snapshot() if r["name"] == "storage_seconds"
+    ]
+    return {"samples": samples, "acked": acked, "storage": storage}
+
+def _percentile(values: list[float], q: float) -> float:
+    """
+    Return the q-th percentile of a non-empty list (nearest rank)
+
+    :param values: the values
+    :param q: the percentile in [0, 100]
+    :return: the percentile
+    """
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+def _count_on_disk(data_dir: Path) -> dict[str, int]:
+    """
+    Count the records that actually reached the data files
+
+    :param data_dir: the scratch data directory
+    :return: file key -> records (-1 if the file is unreadable)
+    """
+    out = {}
+    for key, name in (("users", "users.json"), ("sessions", "sessions.json"), ("interactions", "interactions.json")):
+        try:
+            out[key] = len(json.loads((data_dir / name).read_text(encoding="utf-8")))
+        except (FileNotFoundError, json.JSONDecodeError):
+            out[key] = -1
+    return out
+
+def run(processes: int, threads: int, rounds: int, listings: int, seed: int, data_dir: Path,
+        pbkdf2_iterations: int | None = None) -> dict:
+    """
+    Run the load test and summarize it
+
+    :param processes: the number of worker processes (1 runs in this process)
+    :param threads: the virtual users per process
+    :param rounds: the explore rounds per user
+    :param listings: the synthetic catalog size
+    :param seed: the random seed
+    :param data_dir: the scratch data directory
+    :param pbkdf2_iterations: see _configure
+    :return: the report
+    """
+    _configure(data_dir, pbkdf2_iterations)
+    _prepare(data_dir, listings, seed)
+
+    start = time.perf_counter()
+    if processes <= 1:
+        results = [_run_worker(str(data_dir), 0, threads, rounds, seed, pbkdf2_iterations)]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = [
+                pool.submit(_run_worker, str(data_dir), p * threads, threads, rounds, seed, pbkdf2_iterations)
+                for p in range(processes)
+            ]
+            results = [f.result() for f in futures]
+    elapsed = time.perf_counter() - start
+
+    samples = [s for r in results for s in r["samples"]]
+    operations = {}
+    for op in sorted({s[0] for s in samples}):
+        times = [t for o, t, _ in samples if o == op]
+        errors: dict[str, int] = {}
+        for o, _, err in samples:
+            if o == op and err:
+                errors[err] = errors.get(err, 0) + 1
+        operations[op] = {
+            "count": len(times),
+            "errors": errors,
+            "p50_ms": _percentile(times, 50) * 1000,
+            "p95_ms": _percentile(times, 95) * 1000,
+            "p99_ms": _percentile(times, 99) * 1000,
+            "max_ms": max(times) * 1000,
+            "mean_ms": statistics.fmean(times) * 1000,
+        }
+
+    acked: dict[str, int] = {}
+    for r in results:
+        for key, n in r["acked"].items():
+            acked[key] = acked.get(key, 0) + n
+    on_disk = _count_on_disk(data_dir)
+    lost = {key: max(acked.get(key, 0) - on_disk[key], 0) if on_disk[key] >= 0 else None for key in on_disk}
+
+    storage: dict[str, dict] = {}
+    for r in results:
+        for row in r["storage"]:
+            key = f"{row['labels']['file']}:{row['labels']['op']}"
+            entry = storage.setdefault(key, {"count": 0, "seconds": 0.0})
+            entry["count"] += row["count"]
+            entry["seconds"] += row["sum"]
+    for entry in storage.values():
+        entry["mean_ms"] = entry["seconds"] / entry["count"] * 1000 if entry["count"] else 0.0
+
+    return {
+        "config": {"processes": max(processes, 1), "threads": threads, "rounds": rounds, "listings": listings,
+                   "seed": seed, "pbkdf2_iterations": pbkdf2_iterations},
+        "elapsed_s": elapsed,
+        "operations_total": len(samples),
+        "throughput_ops_s": len(samples) / elapsed if elapsed else 0.0,
+        "errors_total": sum(1 for s in samples if s[2]),
+        "operations": operations,
+        "acknowledged": acked,
+        "on_disk": on_disk,
+        "lost_updates": lost,
+        "storage": dict(sorted(storage.items(), key=lambda kv: -kv[1]["seconds"])),
+    }
+
+def _print_report(report: dict) -> None:
+    """
+    Print a report as tables
+
+    :param report: the report returned by run()
+    :return: None
+    """
+    cfg = report["config"]
+    print(f"{cfg['processes']} process(es) x {cfg['threads']} thread(s), {cfg['rounds']} rounds, "
+          f"{cfg['listings']} listings")
+    print(f"{report['operations_total']} operations in {report['elapsed_s']:.2f} s "
+          f"= {report['throughput_ops_s']:.1f} ops/s, {report['errors_total']} errors\n")
+
+    print(f"{'operation':<12}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}  errors")
+    for op, s in report["operations"].items():
+        errors = ", ".join(f"{k}={v}" for k, v in s["errors"].items()) or "-"
+        print(f"{op:<12}{s['count']:>7}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}"
+              f"{s['max_ms']:>10.1f}  {errors}")
+
+    print(f"\n{'records':<14}{'acked':>8}{'on disk':>9}{'lost':>7}")
+    for key, lost in report["lost_updates"].items():
+        disk = report["on_disk"][key]
+        print(f"{key:<14}{report['acknowledged'].get(key, 0):>8}{disk if disk >= 0 else 'corrupt':>9}"
+              f"{lost if lost is not None else '?':>7}")
+
+    print(f"\n{'file I/O':<24}{'ops':>7}{'total s':>10}{'mean ms':>10}")
+    for key, s in report["storage"].items():
+        print(f"{key:<24}{s['count']:>7}{s['seconds']:>10.2f}{s['mean_ms']:>10.2f}")
+
+# ======================================================================================================================
+# ENTRY POINT
+# ======================================================================================================================
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Concurrent multi-user load test for the service layer")
+    parser.add_argument("--processes", type=int, default=DEFAULT_PROCESSES)
+    parser.add_argument("--threads", type=int, default=DEFAULT_THREADS, help="virtual users per process")
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS, help="explore rounds per virtual user")
+    parser.add_argument("--listings", type=int, default=DEFAULT_LISTINGS)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--pbkdf2-iterations", type=int, default=None)
+    parser.add_argument("--data-dir", type=Path, default=None, help="scratch directory (default: a temporary one)")
+    parser.add_argument("--json", type=Path, default=None, help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="loadtest-") as tmp:
+        data_dir = args.data_dir or Path(tmp)
+        report = run(args.processes, args.threads, args.rounds, args.listings, args.seed, data_dir,
+                     pbkdf2_iterations=args.pbkdf2_iterations)
+    _print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
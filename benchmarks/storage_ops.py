@@ -0,0 +1,252 @@
+from __future__ import annotations
+import argparse, json, random, statistics, sys, tempfile, time, tracemalloc, uuid
+from pathlib import Path
+from typing import Callable
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+BASELINE_PATH = Path(__file__).parent / "storage_baseline.json"
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+DEFAULT_REPEATS = 5
+DEFAULT_SEED = 8431
+
+# Allowed relative slowdown / allocation growth before an operation counts as a regression
+DEFAULT_TOLERANCE = 0.5
+# Absolute slack so sub-millisecond noise on small datasets is never a regression
+SLACK_US = 1000
+SLACK_KIB = 64
+
+"""
+Micro-benchmarks for the data layer: the cost of each storage operation as the data files grow.
+
+For every dataset size, users.json, sessions.json and interactions.json are generated with that many records in a
+scratch directory, and each operation is measured:
+  - cold: the first call, with the in-process caches (e.g. the interaction buffer) dropped
+  - warm: the median of --repeats further calls, reported as µs and ops/s
+  - peak allocations: the tracemalloc peak of one more warm call (measured separately so tracing does not distort
+    the timings)
+Results are compared against benchmarks/storage_baseline.json; an operation regresses when its warm time or peak
+allocations grow by more than the tolerance (plus a small absolute slack).
+
+Usage (from the project root):
+    python benchmarks/storage_ops.py                                  # default sizes, compare against the baseline
+    python benchmarks/storage_ops.py --sizes 1000,10000,100000,1000000
+    python benchmarks/storage_ops.py --update-baseline                # record a new baseline
+
+Exits with status 1 if an operation regressed. Timings are machine-dependent; re-record the baseline when moving to
+different hardware.
+"""
+
+# ======================================================================================================================
+# HELPERS
+# ======================================================================================================================
+
+def _configure(data_dir: Path) -> None:
+    """
+    Point the storage services at the scratch data directory
+
+    :param data_dir: the scratch data directory
+    :return: None
+    """
+    import interactions_service, sessions_service, snapshot_service, users_service
+
+    users_service.USERS_DATA_PATH = data_dir / "users.json"
+    sessions_service.SESSIONS_PATH = data_dir / "sessions.json"
+    interactions_service.INTERACTIONS_PATH = data_dir / "interactions.json"
+    # log_interaction repeats one view; measure the write, not the deduplication that would absorb it
+    interactions_service.VIEW_DEDUP_SECONDS = 0
+    snapshot_service.SNAPSHOTS_DIR = data_dir / "snapshots"
+
+def _generate(data_dir: Path, n: int, seed: int) -> dict:
+    """
+    Write n users, n sessions and n interactions
+
+    :param data_dir: the scratch data directory
+    :param n: the number of records per file
+    :param seed: the random seed
+    :return: the ids and tokens the operations use (a user and sessions from the middle of the files on)
+    """
+    rng = random.Random(seed)
+    users = [
+        {
+            "id": str(uuid.UUID(int=rng.getrandbits(128))), "email": f"user{i}@example.com", "first_name": "Bench",
+            "last_name": str(i), "group_size": rng.randint(1, 8), "preferred_env": rng.choice(["lake", "beach", None]),
+            "budget_min": 0, "budget_max": rng.choice([150, 250, 400]), "travel_start": None, "travel_end": None,
+            "password_hash": "pbkdf2_sha256$1$00$00",
+        }
+        for i in range(n)
+    ]
+    sessions = [
+        {"session_id": str(uuid.UUID(int=rng.getrandbits(128))), "user_id": users[i]["id"],
+         "token": f"token-{i}", "active": True, "created_at": "2026-01-01T00:00:00Z", "expires_at": None}
+        for i in range(n)
+    ]
+    active_users = max(n // 10, 1)
+    interactions = []
+    for _ in range(n):
+        event = "save" if rng.random() < 0.2 else "view"
+        interactions.append({
+            "ts": f"2026-01-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:00:00.{rng.randrange(10**6):06d}Z",
+            "user_id": users[rng.randrange(active_users)]["id"],
+            "property_id": f"P{rng.randrange(5000)}", "event": event, "weight": 3 if event == "save" else 1,
+        })
+    for name, rows in (("users.json", users), ("sessions.json", sessions), ("interactions.json", interactions)):
+        (data_dir / name).write_text(json.dumps(rows, indent=2), encoding="utf-8")
+    middle = n // 2
+    return {"user": users[middle], "token": sessions[middle]["token"],
+            "logout_tokens": iter([s["token"] for s in sessions[middle + 1:]] + [sessions[middle]["token"]] * n),
+            "active_user_id": users[min(middle, active_users - 1)]["id"]}
+
+def _drop_caches() -> None:
+    """
+    Drop the in-process caches, so the next call starts cold
+
+    :return: None
+    """
+    import interactions_service
+
+    interactions_service._buffer = None
+    interactions_service._buffer_stamp = None
+
+def _operations(ctx: dict) -> dict[str, Callable[[], object]]:
+    """
+    Build the operations to measure
+
+    :param ctx: the ids and tokens returned by _generate
+    :return: operation name -> a function performing it once
+    """
+    from interactions_service import get_user_interactions, log_interaction
+    from sessions_service import create_session, get_current_user, logout
+    from users_service import create_user, get_user_by_email, update_user
+
+    user = ctx["user"]
+    counter = iter(range(10**9))
+    return {
+        "create_user": lambda: create_user(email=f"new{next(counter)}@example.com", first_name="New", last_name="User"),
+        "get_user_by_email": lambda: get_user_by_email(user["email"]),
+        "update_user": lambda: update_user(user["id"], budget_max=300),
+        "create_session": lambda: create_session(user["id"]),
+        "get_current_user": lambda: get_current_user(ctx["token"]),
+        "logout": lambda: logout(next(ctx["logout_tokens"])),
+        "log_interaction": lambda: log_interaction(ctx["active_user_id"], "P1", "view"),
+        "get_user_interactions": lambda: get_user_interactions(ctx["active_user_id"]),
+    }
+
+def _measure(fn: Callable[[], object], repeats: int) -> dict:
+    """
+    Measure one operation: a cold call, warm calls, then one traced call
+
+    :param fn: the operation
+    :param repeats: the number of warm calls
+    :return: cold_us, warm_us, ops_per_s and peak_kib
+    """
+    _drop_caches()
+    start = time.perf_counter()
+    fn()
+    cold = time.perf_counter() - start
+
+    warm = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        warm.append(time.perf_counter() - start)
+    median = statistics.median(warm)
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "cold_us": int(cold * 1e6),
+        "warm_us": int(median * 1e6),
+        "ops_per_s": round(1 / median, 1) if median else None,
+        "peak_kib": peak // 1024,
+    }
+
+def run(sizes: list[int], repeats: int = DEFAULT_REPEATS, seed: int = DEFAULT_SEED) -> dict[str, dict]:
+    """
+    Benchmark every operation at every size
+
+    :param sizes: the dataset sizes
+    :param repeats: the number of warm calls per operation
+    :param seed: the random seed
+    :return: '<operation>@<size>' -> measurements
+    """
+    results = {}
+    for n in sizes:
+        with tempfile.TemporaryDirectory(prefix="storage-bench-") as tmp:
+            data_dir = Path(tmp)
+            _configure(data_dir)
+            ctx = _generate(data_dir, n, seed)
+            for name, fn in _operations(ctx).items():
+                results[f"{name}@{n}"] = _measure(fn, repeats)
+                print(f"{name:<24}{n:>9}  {_format(results[f'{name}@{n}'])}", flush=True)
+    return results
+
+def _format(res: dict) -> str:
+    """
+    Format one measurement for the report
+
+    :param res: the measurement
+    :return: the text
+    """
+    return (f"cold {res['cold_us'] / 1000:>9.2f} ms  warm {res['warm_us'] / 1000:>9.2f} ms  "
+            f"{res['ops_per_s'] or 0:>10.1f} ops/s  peak {res['peak_kib']:>9} KiB")
+
+def compare(results: dict[str, dict], baseline: dict[str, dict], tolerance: float) -> list[str]:
+    """
+    Compare results against a baseline
+
+    :param results: the new measurements
+    :param baseline: the recorded baseline
+    :param tolerance: the allowed relative growth (0.5 = 50%), on top of SLACK_US / SLACK_KIB
+    :return: a list of human-readable regressions (empty if none)
+    """
+    problems = []
+    for key, res in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        if res["warm_us"] > base["warm_us"] * (1 + tolerance) + SLACK_US:
+            problems.append(f"{key}: warm {res['warm_us']}us vs baseline {base['warm_us']}us")
+        if res["peak_kib"] > base["peak_kib"] * (1 + tolerance) + SLACK_KIB:
+            problems.append(f"{key}: peak {res['peak_kib']}KiB vs baseline {base['peak_kib']}KiB")
+    return problems
+
+# ======================================================================================================================
+# ENTRY POINT
+# ======================================================================================================================
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the storage operations of the service layer")
+    parser.add_argument("--sizes", default=",".join(str(n) for n in DEFAULT_SIZES),
+                        help="comma-separated record counts per data file")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--json", type=Path, default=None, help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    results = run([int(n) for n in args.sizes.split(",") if n.strip()], args.repeats, args.seed)
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+
+    if args.update_baseline:
+        BASELINE_PATH.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+        print(f"Baseline written to {BASELINE_PATH}")
+        return 0
+
+    baseline = json.loads(BASELINE_PATH.read_text(encoding="utf-8")) if BASELINE_PATH.exists() else {}
+    problems = compare(results, baseline, args.tolerance)
+    for p in problems:
+        print("REGRESSION:", p)
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
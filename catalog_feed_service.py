@@ -0,0 +1,177 @@
+from __future__ import annotations
+import json, threading
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+
+from storage_service import atomic_write_text, file_lock
+
+CATALOG_FEED_PATH = Path(__file__).parent / "data" / "catalog_changes.jsonl"
+CATALOG_VERSION_PATH = Path(__file__).parent / "data" / "catalog_version.json"
+
+# Change operations recorded in the feed
+OP_UPSERT = "upsert"
+OP_DELETE = "delete"
+OP_RESET = "reset"
+
+"""
+Owns the catalog version and its change feed. It does not read or write properties itself (properties_service does
+that and records every change here).
+
+Every committed change to the catalog gets the next version number (monotonically increasing, shared by all processes)
+and is appended to data/catalog_changes.jsonl as one line per changed property:
+    {"version": 7, "ts": "...", "op": "upsert", "property_id": "prop3", "property": {...}}
+    {"version": 8, "ts": "...", "op": "delete", "property_id": "prop9"}
+    {"version": 9, "ts": "...", "op": "reset"}
+A 'reset' means the whole catalog was replaced; consumers must rebuild from scratch. Everything before a reset is
+dropped from the feed.
+
+Caches and indexes can either subscribe() to changes committed by this process, or remember the version they were
+built from and call changes_since() to catch up on changes made by any process.
+"""
+
+_subscribers: list[Callable[[list[dict]], None]] = []
+_subscribers_lock = threading.Lock()
+
+# ======================================================================================================================
+# HELPERS
+# ======================================================================================================================
+
+def _now_iso() -> str:
+    """
+      Returns the ISO 8601 formatted datetime string
+
+      :return: the datetime string
+    """
+    return datetime.now().isoformat(timespec="seconds") + "Z"
+
+def _read_version() -> int:
+    """
+      Read the current version from disk (0 if the catalog has never been versioned)
+
+      :return: the version
+    """
+    try:
+        return int(json.loads(CATALOG_VERSION_PATH.read_text(encoding="utf-8")).get("version", 0))
+    except (FileNotFoundError, json.JSONDecodeError, ValueError):
+        return 0
+
+def _notify(changes: list[dict]) -> None:
+    """
+      Pass committed changes to every subscriber. A failing subscriber does not affect the others.
+
+      :param changes: the committed change records
+      :return: None
+    """
+    with _subscribers_lock:
+        subscribers = list(_subscribers)
+    for callback in subscribers:
+        try:
+            callback(changes)
+        except Exception:
+            pass
+
+# ======================================================================================================================
+# API-STYLE FUNCTIONS
+# ======================================================================================================================
+
+def get_catalog_version() -> int:
+    """
+      Return the current catalog version
+
+      :return: the version
+    """
+    return _read_version()
+
+def record_changes(changes: list[dict]) -> int:
+    """
+      Commit a batch of changes under a new version and notify subscribers
+
+      :param changes: dictionaries with 'op' and (for upsert/delete) 'property_id' and (for upsert) 'property'
+      :return: the new version
+    """
+    if not changes:
+        return get_catalog_version()
+    for change in changes:
+        if change.get("op") not in (OP_UPSERT, OP_DELETE, OP_RESET):
+            raise ValueError(f"Unknown catalog change op: {change.get('op')}")
+
+    with file_lock(CATALOG_VERSION_PATH):
+        version = _read_version() + 1
+        ts = _now_iso()
+        records = [{"version": version, "ts": ts, **change} for change in changes]
+        lines = "".join(json.dumps(r) + "\n" for r in records)
+        if any(r["op"] == OP_RESET for r in records):
+            # A reset supersedes everything before it
+            atomic_write_text(CATALOG_FEED_PATH, lines)
+        else:
+            CATALOG_FEED_PATH.parent.mkdir(parents=True, exist_ok=True)
+            with CATALOG_FEED_PATH.open("a", encoding="utf-8") as f:
+                f.write(lines)
+        atomic_write_text(CATALOG_VERSION_PATH, json.dumps({"version": version, "updated_at": ts}))
+
+    _notify(records)
+    return version
+
+def changes_since(version: int) -> list[dict]:
+    """
+      Return the changes committed after the given version, oldest first. If the feed no longer reaches back that far,
+      a single reset record is returned so the caller rebuilds.
+
+      :param version: the version the caller is up to date with
+      :return: the change records
+    """
+    current = get_catalog_version()
+    if version >= current:
+        return []
+    out = []
+    oldest = None
+    try:
+        with CATALOG_FEED_PATH.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if oldest is None:
+                    oldest = rec["version"]
+                if rec["version"] > version:
+                    out.append(rec)
+    except FileNotFoundError:
+        pass
+    if oldest is None or oldest > version + 1:
+        if not out or out[0]["op"] != OP_RESET:
+            return [{"version": current, "op": OP_RESET}]
+    return out
+
+def subscribe(callback: Callable[[list[dict]], None]) -> None:
+    """
+      Register a callback that receives the change records of every commit made by this process
+
+      :param callback: a function taking a list of change records
+      :return: None
+    """
+    with _subscribers_lock:
+        if callback not in _subscribers:
+            _subscribers.append(callback)
+
+def unsubscribe(callback: Callable[[list[dict]], None]) -> None:
+    """
+      Remove a registered callback
+
+      :param callback: the callback
+      :return: None
+    """
+    with _subscribers_lock:
+        if callback in _subscribers:
+            _subscribers.remove(callback)
+
+def reset_catalog_feed() -> None:
+    """
+      Clear the change feed and version. For dev/testing purposes.
+
+      :return: None
+    """
+    with file_lock(CATALOG_VERSION_PATH):
+        atomic_write_text(CATALOG_FEED_PATH, "")
+        atomic_write_text(CATALOG_VERSION_PATH, json.dumps({"version": 0}))
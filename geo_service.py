@@ -0,0 +1,242 @@
+from __future__ import annotations
+import math, threading
+from typing import TYPE_CHECKING
+
+from catalog_feed_service import get_catalog_version
+from properties_service import load_properties_from_disk
+
+if TYPE_CHECKING:
+    import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+DEFAULT_CELL_DEG = 0.25
+
+"""
+Spatial queries over the property catalog: everything within R km of a point, everything in a bounding box, and the
+k listings nearest to a point or to another listing.
+
+Listings are bucketed into a fixed lat/lon grid (DEFAULT_CELL_DEG degrees per cell). Positions are sorted by cell, so
+each cell is a contiguous slice of the coordinate arrays and a query only touches the cells overlapping its bounding
+box. Candidates from those cells are then filtered exactly with a vectorized haversine distance. k-nearest queries
+search a growing radius until k listings are found within it, which makes the answer exact.
+
+NumPy is imported when an index is built. get_geo_index() returns a process-wide index rebuilt whenever the catalog
+version changes (a rebuild is a single vectorized sort).
+"""
+
+class GeoIndex:
+    def __init__(self, props: list[dict], cell_deg: float = DEFAULT_CELL_DEG):
+        import numpy as np
+
+        rows = [p for p in props if isinstance(p.get("lat"), (int, float)) and isinstance(p.get("lon"), (int, float))]
+        self.cell_deg = cell_deg
+        self.version = 0
+        lat = np.fromiter((p["lat"] for p in rows), dtype=float, count=len(rows))
+        lon = np.fromiter((p["lon"] for p in rows), dtype=float, count=len(rows))
+        ids = np.array([str(p.get("property_id")) for p in rows], dtype=object)
+
+        keys = self._cell_keys(lat, lon)
+        order = np.argsort(keys, kind="stable")
+        self.lat, self.lon, self.ids, keys = lat[order], lon[order], ids[order], keys[order]
+        self._cells, starts = np.unique(keys, return_index=True)
+        self._starts = np.append(starts, len(keys))
+        self._pos = {pid: i for i, pid in enumerate(self.ids.tolist())}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _cell_keys(self, lat, lon):
+        """
+        Return one integer key per (row, col) grid cell
+
+        :param lat: latitudes
+        :param lon: longitudes
+        :return: the cell keys
+        """
+        import numpy as np
+
+        row = np.floor((np.asarray(lat) + 90.0) / self.cell_deg).astype(np.int64)
+        col = np.floor((np.asarray(lon) + 180.0) / self.cell_deg).astype(np.int64)
+        return row * 100_000 + col
+
+    def _candidates(self, min_lat: float, max_lat: float, min_lon: float, max_lon: float):
+        """
+        Return the positions of every listing in a grid cell overlapping the box. Longitudes beyond ±180° wrap around,
+        so a box crossing the antimeridian covers the cells on both sides.
+
+        :param min_lat: southern edge
+        :param max_lat: northern edge
+        :param min_lon: western edge (may be below -180)
+        :param max_lon: eastern edge (may be above 180)
+        :return: an array of positions
+        """
+        import numpy as np
+
+        min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0)
+        if max_lon - min_lon >= 360.0:
+            spans = [(-180.0, 180.0)]
+        elif min_lon < -180.0:
+            spans = [(min_lon + 360.0, 180.0), (-180.0, max_lon)]
+        elif max_lon > 180.0:
+            spans = [(min_lon, 180.0), (-180.0, max_lon - 360.0)]
+        else:
+            spans = [(min_lon, max_lon)]
+
+        rows = np.arange(math.floor((min_lat + 90.0) / self.cell_deg), math.floor((max_lat + 90.0) / self.cell_deg) + 1)
+        cols = np.concatenate([
+            np.arange(math.floor((lo + 180.0) / self.cell_deg), math.floor((hi + 180.0) / self.cell_deg) + 1)
+            for lo, hi in spans
+        ])
+        # A box covering more cells than there are listings is cheaper to answer with a full scan
+        if len(rows) * len(cols) > len(self.ids):
+            return np.arange(len(self.ids))
+        wanted = (rows[:, None] * 100_000 + cols[None, :]).ravel()
+        hit = np.searchsorted(self._cells, wanted)
+        hit = hit[(hit < len(self._cells)) & (self._cells[np.minimum(hit, len(self._cells) - 1)] == wanted)]
+        if not len(hit):
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([np.arange(self._starts[i], self._starts[i + 1]) for i in hit])
+
+    def within_radius(self, lat: float, lon: float, radius_km: float) -> list[tuple[str, float]]:
+        """
+        Return the listings within radius_km of a point
+
+        :param lat: the point's latitude
+        :param lon: the point's longitude
+        :param radius_km: the radius in kilometres
+        :return: (property_id, distance_km) pairs, nearest first
+        """
+        import numpy as np
+
+        if not len(self.ids):
+            return []
+        dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+        coslat = max(math.cos(math.radians(min(abs(lat) + dlat, 90.0))), 1e-6)
+        dlon = min(math.degrees(radius_km / (EARTH_RADIUS_KM * coslat)), 180.0)
+        cand = self._candidates(lat - dlat, lat + dlat, lon - dlon, lon + dlon)
+        dist = haversine_km(lat, lon, self.lat[cand], self.lon[cand])
+        keep = dist <= radius_km
+        cand, dist = cand[keep], dist[keep]
+        order = np.argsort(dist, kind="stable")
+        return list(zip(self.ids[cand[order]].tolist(), dist[order].tolist()))
+
+    def in_bbox(self, min_lat: float, max_lat: float, min_lon: float, max_lon: float) -> list[str]:
+        """
+        Return the listings inside a bounding box
+
+        :param min_lat: southern edge
+        :param max_lat: northern edge
+        :param min_lon: western edge (may be below -180 to cross the antimeridian)
+        :param max_lon: eastern edge (may be above 180 to cross the antimeridian)
+        :return: the property ids
+        """
+        if not len(self.ids):
+            return []
+        cand = self._candidates(min_lat, max_lat, min_lon, max_lon)
+        la, lo = self.lat[cand], self.lon[cand]
+        # Measured eastwards from the western edge, so a box crossing ±180° keeps the listings on both sides
+        keep = (la >= min_lat) & (la <= max_lat) & ((lo - min_lon) % 360.0 <= max_lon - min_lon)
+        return self.ids[cand[keep]].tolist()
+
+    def nearest(self, lat: float, lon: float, k: int, exclude: str | None = None) -> list[tuple[str, float]]:
+        """
+        Return the k listings nearest to a point
+
+        :param lat: the point's latitude
+        :param lon: the point's longitude
+        :param k: the number of listings
+        :param exclude: a property id to leave out (e.g. the listing the point came from)
+        :return: (property_id, distance_km) pairs, nearest first
+        """
+        want = k + (1 if exclude is not None else 0)
+        radius = self.cell_deg * 111.0
+        while True:
+            found = self.within_radius(lat, lon, radius)
+            if len(found) >= want or len(found) >= len(self.ids) or radius > math.pi * EARTH_RADIUS_KM:
+                return [f for f in found if f[0] != exclude][:k]
+            radius *= 2
+
+    def nearest_to_listing(self, property_id: str, k: int) -> list[tuple[str, float]]:
+        """
+        Return the k listings nearest to another listing
+
+        :param property_id: the listing's id
+        :param k: the number of listings
+        :return: (property_id, distance_km) pairs, nearest first
+        """
+        pos = self._pos.get(property_id)
+        if pos is None:
+            raise KeyError(f"Property with id {property_id} not found")
+        return self.nearest(float(self.lat[pos]), float(self.lon[pos]), k, exclude=property_id)
+
+# ======================================================================================================================
+# HELPER FUNCTIONS (for internal use)
+# ======================================================================================================================
+
+_index: GeoIndex | None = None
+_index_lock = threading.Lock()
+
+# ======================================================================================================================
+# API-STYLE FUNCTIONS
+# ======================================================================================================================
+
+def haversine_km(lat: float, lon: float, lats, lons) -> np.ndarray:
+    """
+    Vectorized great-circle distance from one point to many
+
+    :param lat: the point's latitude
+    :param lon: the point's longitude
+    :param lats: array-like of latitudes
+    :param lons: array-like of longitudes
+    :return: an array of distances in kilometres
+    """
+    import numpy as np
+
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lat2 = np.radians(np.asarray(lats, dtype=float))
+    lon2 = np.radians(np.asarray(lons, dtype=float))
+    a = np.sin((lat2 - lat1) / 2.0) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.0) ** 2
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def get_geo_index() -> GeoIndex:
+    """
+    Return the process-wide spatial index, rebuilt when the catalog version changes
+
+    :return: the index
+    """
+    global _index
+    with _index_lock:
+        version = get_catalog_version()
+        if _index is None or _index.version != version:
+            _index = GeoIndex(load_properties_from_disk())
+            _index.version = version
+        return _index
+
+def properties_within_radius(lat: float, lon: float, radius_km: float) -> list[tuple[str, float]]:
+    """
+    Return the listings within radius_km of a point, nearest first
+
+    :param lat: the point's latitude
+    :param lon: the point's longitude
+    :param radius_km: the radius in kilometres
+    :return: (property_id, distance_km) pairs
+    """
+    return get_geo_index().within_radius(lat, lon, radius_km)
+
+def properties_in_bbox(min_lat: float, max_lat: float, min_lon: float, max_lon: float) -> list[str]:
+    """
+    Return the listings inside a bounding box
+
+    :return: the property ids
+    """
+    return get_geo_index().in_bbox(min_lat, max_lat, min_lon, max_lon)
+
+def nearest_properties(property_id: str, k: int = 5) -> list[tuple[str, float]]:
+    """
+    Return the k listings nearest to another listing
+
+    :param property_id: the listing's id
+    :param k: the number of listings
+    :return: (property_id, distance_km) pairs, nearest first
+    """
+    return get_geo_index().nearest_to_listing(property_id, k)
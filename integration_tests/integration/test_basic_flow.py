@@ -1,10 +1,17 @@
-import json
+import json, os, sys, time
 import pytest
 
 # Services under test
+import availability_service as avail_svc
+import catalog_feed_service as feed_svc
+import interactions_service as inter_svc
+import metrics_service as metrics_svc
 import properties_service as props_svc
 import users_service as users_svc
+import picks_scheduler_service as sched_svc
 import recommender_service as rec_svc
+import resources_service as res_svc
+import trending_service as trend_svc
 
 
 @pytest.fixture(autouse=True)
@@ -13,8 +20,18 @@ def isolate_data_paths(tmp_path, monkeypatch):
     Redirect all file I/O to a temporary folder.
     """
     monkeypatch.setattr(props_svc, "PROPERTIES_DATA_PATH", tmp_path / "properties.json")
+    monkeypatch.setattr(feed_svc, "CATALOG_FEED_PATH", tmp_path / "catalog_changes.jsonl")
+    monkeypatch.setattr(feed_svc, "CATALOG_VERSION_PATH", tmp_path / "catalog_version.json")
+    monkeypatch.setattr(inter_svc, "INTERACTIONS_PATH", tmp_path / "interactions.json")
+    monkeypatch.setattr(inter_svc, "VIEW_DEDUP_SECONDS", 0)
+    monkeypatch.setattr(inter_svc, "_deduper", None)
     monkeypatch.setattr(users_svc, "USERS_DATA_PATH", tmp_path / "users.json")
     monkeypatch.setattr(rec_svc, "DATA_PATH", tmp_path / "records.json")
+    monkeypatch.setattr(res_svc, "_resources", None)
+    monkeypatch.setattr(rec_svc, "_segments", None)
+    monkeypatch.setattr(trend_svc, "_counters", None)
+    monkeypatch.setattr(avail_svc, "AVAILABILITY_PATH", tmp_path / "availability.json")
+    monkeypatch.setattr(avail_svc, "_index", None)
 
     # Start with empty users/properties files
     (tmp_path / "users.json").write_text("[]", encoding="utf-8")
@@ -71,4 +88,462 @@ def test_end_to_end_minimal(stub_llm):
     # Recommender writes a JSON records file; confirm it matches
     records_path = rec_svc.DATA_PATH
     saved = json.loads(records_path.read_text(encoding="utf-8"))
-    assert saved == out
\ No newline at end of file
+    assert saved == out
+
+
+def test_proximity_component_favours_nearby(stub_llm):
+    props_svc.ensure_properties()
+    user = users_svc.create_user(
+        email="b@example.com", first_name="B", last_name="User",
+        budget_min=0, budget_max=300, preferred_env=None,
+    )
+    # Without an anchor the cheaper Tofino cabin wins; near Kelowna the Kelowna condo does
+    assert rec_svc.produce_top_matches(user, n=1)[0]["property_id"] == "P1"
+    assert rec_svc.produce_top_matches(user, n=1, near=(49.887, -119.496))[0]["property_id"] == "P2"
+
+
+def test_cold_start_segment_matches_full_scoring(stub_llm):
+    props_svc.ensure_properties()
+    user = users_svc.create_user(
+        email="c@example.com", first_name="C", last_name="User", budget_max=250, preferred_env="lake",
+    )
+    assert rec_svc.segment_key(user) == ("lake", 250, 0)
+    assert rec_svc.produce_top_matches(user, n=2) == rec_svc.run_vectorization(user, 2)
+
+    # Group size excludes listings that are too small, in both paths
+    big = users_svc.update_user(user.id, group_size=4)
+    assert [r["property_id"] for r in rec_svc.produce_top_matches(big, n=2)] == ["P1"]
+    inter_svc.log_view(big.id, "P1")
+    assert [r["property_id"] for r in rec_svc.produce_top_matches(big, n=2)] == ["P1"]
+
+
+def test_segments_use_exact_group_size_and_budget(stub_llm):
+    props_svc.ensure_properties()
+    for pid, capacity in (("P3", 6), ("P4", 8)):
+        props_svc.upsert_property(dict(stub_llm[0], property_id=pid, capacity=capacity))
+    user = users_svc.create_user(
+        email="s@example.com", first_name="S", last_name="User", budget_max=262, preferred_env="lake", group_size=7,
+    )
+    # A group of 7 is never offered a listing that sleeps 6, and a $262 budget is not scored as $250
+    segment = rec_svc.produce_top_matches(user, n=3)
+    assert [r["property_id"] for r in segment] == ["P4"]
+    assert segment == rec_svc.run_vectorization(user, 3)
+
+    user = users_svc.update_user(user.id, group_size=None)
+    assert rec_svc.produce_top_matches(user, n=4) == rec_svc.run_vectorization(user, 4)
+
+
+def test_trending_windows_slide_and_follow_the_stream(stub_llm):
+    counters = trend_svc.TrendingCounters()
+    now = 1_700_000_000.0
+    counters.add("P1", "view", now - 2 * 86400)
+    counters.add("P2", "save", now - 7200)
+    counters.add("P2", "view", now - 60)
+    counters.add("P1", "view", now - 30, count=2)
+    assert counters.counts("1h", now) == {"P1": (2, 0), "P2": (1, 0)}
+    assert [t["property_id"] for t in counters.trending("24h", now=now)] == ["P2", "P1"]
+    assert counters.popularity("7d", now) == {"P1": 3.0, "P2": 4.0}
+    assert counters.counts("1h", now + 3 * 3600) == {}
+
+    props_svc.ensure_properties()
+    user = users_svc.create_user(email="t@example.com", first_name="T", last_name="User", budget_max=300)
+    inter_svc.log_save(user.id, "P2")
+    assert trend_svc.trending_properties("1h")[0]["property_id"] == "P2"
+    inter_svc.log_save(user.id, "P1")
+    inter_svc.log_view(user.id, "P1")
+    assert trend_svc.popularity_scores("1h") == {"P1": 1.0, "P2": 0.75}
+
+    out = rec_svc.produce_top_matches(user, n=2, trending_window="1h")
+    assert [r["property_id"] for r in out] == ["P1", "P2"]
+
+
+def test_availability_index_and_travel_date_filter(stub_llm, tmp_path):
+    calendar = tmp_path / "calendar.csv"
+    calendar.write_text(
+        "property_id,start,end,kind\n"
+        "P1,2025-07-01,2025-07-05,booked\n"
+        "P1,2025-07-05,2025-07-08,blocked\n"
+        "P2,2025-08-01,2025-08-03,booked\n",
+        encoding="utf-8",
+    )
+    assert avail_svc.ingest_calendar(avail_svc.read_calendar_file(calendar)) == 3
+    index = avail_svc.get_availability_index()
+    assert not index.is_available("P1", "2025-07-07", "2025-07-10")
+    assert index.is_available("P1", "2025-07-08", "2025-07-10")
+    assert index.is_available("P1", "2025-06-25", "2025-07-01")
+    assert index.available_mask(["P1", "P2", "P9"], "2025-07-02", "2025-08-02").tolist() == [False, False, True]
+    with pytest.raises(ValueError):
+        index.is_available("P1", "2025-07-10", "2025-07-10")
+
+    props_svc.ensure_properties()
+    user = users_svc.create_user(
+        email="d@example.com", first_name="D", last_name="User", budget_max=300,
+        travel_start="2025-07-03", travel_end="2025-07-06",
+    )
+    assert [r["property_id"] for r in rec_svc.produce_top_matches(user, n=2)] == ["P2"]
+    avail_svc.block_dates("P2", "2025-07-06", "2025-07-09")
+    assert [r["property_id"] for r in rec_svc.produce_top_matches(user, n=2)] == ["P2"]
+
+    # A travel date that does not parse means no dates, rather than a string comparison or an error
+    user.travel_end = "2025-13-45"
+    assert rec_svc.travel_dates(user) is None
+    assert len(rec_svc.produce_top_matches(user, n=2)) == 2
+
+
+def test_picks_scheduler_debounces_and_recomputes(stub_llm):
+    props_svc.ensure_properties()
+    user = users_svc.create_user(email="s@example.com", first_name="S", last_name="User", budget_max=300)
+    calls = []
+
+    def compute(u):
+        calls.append(u.budget_max)
+        return rec_svc.produce_top_matches(u, n=2)
+
+    scheduler = sched_svc.PicksScheduler(compute=compute, debounce_seconds=0.05, sweep_interval_seconds=60)
+    scheduler.start()
+    try:
+        for _ in range(3):
+            inter_svc.log_view(user.id, "P1")
+        assert scheduler.is_pending(user.id)
+        assert scheduler.wait_idle(5)
+        assert len(calls) == 1 and len(scheduler.latest(user.id).picks) == 2
+
+        users_svc.update_user(user.id, budget_max=180)
+        assert scheduler.wait_idle(5)
+        assert calls == [300, 180] and not scheduler.is_pending(user.id)
+    finally:
+        scheduler.stop()
+
+
+def test_scheduler_keeps_the_newest_result_and_is_bounded(stub_llm):
+    props_svc.ensure_properties()
+    scheduler = sched_svc.PicksScheduler(compute=lambda u: [], max_results=2)
+    older, newer = next(scheduler._sequence), next(scheduler._sequence)
+    scheduler._store("U1", ["new"], sequence=newer)
+    assert scheduler._store("U1", ["old"], sequence=older).picks == ["new"]
+    assert scheduler.latest("U1").picks == ["new"]
+
+    scheduler._store("U2", [])
+    scheduler._store("U3", [])
+    assert scheduler.latest("U1") is None and scheduler.latest("U3") is not None
+
+    # Concurrent writers never leave a partial records file
+    import threading
+    user = users_svc.create_user(email="r@example.com", first_name="R", last_name="User", budget_max=300)
+    threads = [threading.Thread(target=rec_svc.produce_top_matches, args=(user, 2)) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(json.loads(rec_svc.DATA_PATH.read_text(encoding="utf-8"))) == 2
+
+
+def test_metrics_record_and_export(monkeypatch, tmp_path):
+    import auth_service as auth_svc
+    import sessions_service as sess_svc
+
+    monkeypatch.setattr(sess_svc, "SESSIONS_PATH", tmp_path / "sessions.json")
+    metrics_svc.reset_metrics()
+
+    auth_svc.signup(email="m@example.com", first_name="M", last_name="User", password="secret123")
+    sess_svc.login("m@example.com", "secret123")
+    with pytest.raises(ValueError):
+        sess_svc.login("m@example.com", "wrong-password")
+
+    rows = {(r["name"], tuple(r["labels"].values())): r for r in metrics_svc.snapshot()}
+    assert rows[("logins_total", ("ok",))]["value"] == 1
+    assert rows[("logins_total", ("bad_password",))]["value"] == 1
+    assert rows[("password_hash_seconds", ("verify",))]["count"] == 2
+    assert rows[("storage_seconds", ("users", "load"))]["count"] > 0
+
+    text = metrics_svc.render_prometheus()
+    assert "# TYPE password_hash_seconds histogram" in text
+    assert 'password_hash_seconds_count{op="verify"} 2' in text
+    assert 'logins_total{result="ok"} 1' in text
+    assert metrics_svc.write_prometheus(tmp_path / "m.prom").read_text(encoding="utf-8") == text
+
+    monkeypatch.setattr(metrics_svc, "_enabled", False)
+    sess_svc.login("m@example.com", "secret123")
+    assert 'logins_total{result="ok"} 1' in metrics_svc.render_prometheus()
+
+
+def test_profiling_captures_sampled_calls(monkeypatch, tmp_path):
+    import profiling_service as prof_svc
+
+    monkeypatch.setattr(prof_svc, "PROFILES_DIR", tmp_path / "profiles")
+    monkeypatch.setattr(prof_svc, "MAX_CAPTURES", 2)
+    monkeypatch.setattr(prof_svc, "_enabled", False)
+
+    inter_svc.log_view("U1", "P1")
+    assert prof_svc.list_captures() == []
+
+    prof_svc.set_profiling(True, sample_rate=1.0)
+    try:
+        for pid in ("P1", "P2", "P3"):
+            inter_svc.log_view("U1", pid)
+    finally:
+        prof_svc.set_profiling(False, sample_rate=prof_svc.DEFAULT_SAMPLE_RATE)
+
+    captures = prof_svc.list_captures()
+    assert len(captures) == 2 and {c["entry"] for c in captures} == {"log_interaction"}
+    files = {p.name.split(".", 1)[1]: p for p in captures[0]["files"]}
+    assert set(files) == {"cpu.folded", "mem.folded", "prof"}
+    cpu = files["cpu.folded"].read_text(encoding="utf-8").splitlines()
+    assert any("interactions_service.py:log_interaction" in line for line in cpu)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in cpu)
+    assert len(inter_svc.load_interactions()) == 4
+
+    # tracemalloc started by someone else is left running
+    import tracemalloc
+    tracemalloc.start()
+    prof_svc.set_profiling(True, sample_rate=1.0)
+    try:
+        inter_svc.log_view("U1", "P4")
+        assert tracemalloc.is_tracing()
+    finally:
+        prof_svc.set_profiling(False, sample_rate=prof_svc.DEFAULT_SAMPLE_RATE)
+        tracemalloc.stop()
+
+
+def test_interaction_buffer_round_trips_and_stays_compact():
+    user = users_svc.create_user(email="c@example.com", first_name="C", last_name="User")
+    assert not hasattr(user, "__dict__")
+
+    for pid in ("P1", "P2", "P1"):
+        inter_svc.log_view(user.id, pid)
+    inter_svc.log_save("someone-else", "P2")
+
+    rows = inter_svc.load_interactions()
+    buffer = inter_svc.get_interaction_buffer()
+    assert list(buffer) == rows
+    assert inter_svc.get_user_interactions(user.id) == [r for r in rows if r["user_id"] == user.id]
+    assert inter_svc.has_interactions(user.id) and not inter_svc.has_interactions("nobody")
+    assert [(pid, event) for pid, event, _ in buffer.since(0)] == [(r["property_id"], r["event"]) for r in rows]
+
+    odd = [{"ts": "not a time", "user_id": "u", "property_id": "p", "event": "view", "weight": 7, "count": 2}]
+    assert list(inter_svc.InteractionBuffer(odd)) == odd
+
+    tz = os.environ.get("TZ")
+    os.environ["TZ"] = "America/New_York"
+    time.tzset()
+    try:
+        lossy = [dict(rows[0], ts=ts) for ts in ("2024-01-01T00:00:00+00:00", "2024-03-10T02:30:00Z")]
+        assert list(inter_svc.InteractionBuffer(lossy)) == lossy
+    finally:
+        if tz is None:
+            del os.environ["TZ"]
+        else:
+            os.environ["TZ"] = tz
+        time.tzset()
+
+    many = [dict(rows[i % len(rows)], user_id=f"user-{i % 500}") for i in range(20_000)]
+    parsed = json.loads(json.dumps(many))
+    dict_bytes = sum(sys.getsizeof(r) + sum(sys.getsizeof(v) for v in r.values()) for r in parsed)
+    assert inter_svc.InteractionBuffer(parsed).nbytes() * 5 < dict_bytes
+
+
+def test_api_routes_in_process(stub_llm, monkeypatch, tmp_path):
+    import api_service as api_svc
+    import sessions_service as sess_svc
+
+    monkeypatch.setattr(sess_svc, "SESSIONS_PATH", tmp_path / "sessions.json")
+    monkeypatch.setattr(api_svc, "SERVICE_KEY", "k3y")
+    props_svc.ensure_properties()
+    client = api_svc.ApiClient()
+
+    status, user = client.request("POST", "/users", {"email": "api@example.com", "first_name": "A", "last_name": "P",
+                                                     "password": "secret123", "budget_max": 300})
+    assert status == 201 and "password_hash" not in user and user["budget_max"] == 300
+    assert client.request("POST", "/users", {"email": "x@example.com", "first_name": "A", "last_name": "P",
+                                             "password": "pw", "is_admin": True})[0] == 400
+    assert client.request("POST", "/sessions", {"email": "api@example.com", "password": "nope"})[0] == 401
+    status, session = client.request("POST", "/sessions", {"email": "api@example.com", "password": "secret123"})
+    token = session["token"]
+
+    assert client.request("GET", "/users/me")[0] == 401
+    assert client.request("PATCH", "/users/me", {"group_size": 2}, token=token) == (200, {**user, "group_size": 2})
+    users_svc.create_user(email="taken@example.com", first_name="T", last_name="U")
+    for bad in ({"email": "taken@example.com"}, {"group_size": "lots"}, {"budget_max": "x"}, {"group_size": 0},
+                {"budget_min": 500}, {"travel_start": "2026-13-01"}, {"first_name": ""}):
+        assert client.request("PATCH", "/users/me", bad, token=token)[0] == 400, bad
+    assert client.request("GET", "/recommendations?trending_window=1y", token=token)[0] == 400
+    assert client.request("POST", "/interactions", {"property_id": "P1", "event": "like"}, token=token)[0] == 400
+    assert client.request("POST", "/interactions", {"property_id": "P9", "event": "view"}, token=token)[0] == 400
+    assert client.request("POST", "/users", {"email": "api@example.com", "first_name": "A", "last_name": "P",
+                                             "password": "pw"})[0] == 400
+    status, body = client.request("POST", "/interactions/batch", {"events": [
+        {"property_id": "P1", "event": "view"}, {"property_id": "P2", "event": "save"}]}, token=token)
+    assert status == 201 and [r["event"] for r in body["interactions"]] == ["view", "save"]
+    assert len(client.request("GET", "/interactions", token=token)[1]["interactions"]) == 2
+
+    status, body = client.request("GET", "/recommendations?n=1", token=token)
+    assert status == 200 and len(body["results"]) == 1
+    assert client.request("POST", "/recommendations/batch", {"user_ids": [user["id"]]})[0] == 403
+    status, body = client.request("POST", "/recommendations/batch", {"user_ids": [user["id"], "ghost"], "n": 2},
+                                  headers={"X-Api-Key": "k3y"})
+    assert status == 200 and len(body["results"][user["id"]]) == 2 and body["results"]["ghost"] is None
+
+    # A user without a budget scores the same way once their interactions switch them to full scoring
+    client.request("POST", "/users", {"email": "nb@example.com", "first_name": "N", "last_name": "B",
+                                      "password": "secret123"})
+    other = client.request("POST", "/sessions", {"email": "nb@example.com", "password": "secret123"})[1]["token"]
+    assert client.request("GET", "/recommendations?n=2", token=other)[0] == 200
+    assert client.request("POST", "/interactions", {"property_id": "P1", "event": "view"}, token=other)[0] == 201
+    status, body = client.request("GET", "/recommendations?n=2", token=other)
+    assert status == 200 and len(body["results"]) == 2
+
+    assert client.request("DELETE", "/sessions/me", token=token) == (200, {"logged_out": True})
+    assert client.request("GET", "/sessions/me", token=token)[0] == 401
+    assert client.request("PUT", "/users/me")[0] == 405 and client.request("GET", "/nope")[0] == 404
+
+
+def test_bulk_interactions_validate_and_import(stub_llm, tmp_path):
+    props_svc.ensure_properties()
+    user = users_svc.create_user(email="b@example.com", first_name="B", last_name="User")
+    inter_svc.log_view(user.id, "P1")
+    buffer = inter_svc.get_interaction_buffer()
+    trending = trend_svc.get_trending()
+
+    with pytest.raises(ValueError, match="unknown property"):
+        inter_svc.log_interactions_bulk([{"user_id": user.id, "property_id": "P9", "event": "view"}])
+    logged = inter_svc.log_interactions_bulk([
+        {"user_id": user.id, "property_id": "P2", "event": "save", "ts": "2026-01-02T03:04:05"},
+        {"user_id": user.id, "property_id": "P1", "event": "view"},
+    ])
+    assert [r["ts"] for r in logged][0] == "2026-01-02T03:04:05Z"
+    assert trending.counts("7d")["P1"] == (2, 0)
+
+    events = tmp_path / "events.csv"
+    events.write_text("user_id,property_id,event,ts\n"
+                      f"{user.id},P1,view,2026-01-03T00:00:00\n"
+                      f"{user.id},P2,like,\n"
+                      f"ghost,P2,save,\n"
+                      f"{user.id},P2,save,\n", encoding="utf-8")
+    stats = inter_svc.import_interactions_file(events, chunk_size=2)
+    assert stats == {"read": 4, "logged": 2, "skipped": 2}
+
+    # Malformed lines and ids of the wrong type are skipped, not fatal
+    lines = tmp_path / "events.jsonl"
+    lines.write_text(json.dumps({"user_id": user.id, "property_id": "P1", "event": "view"}) + "\n{not json\n"
+                     + json.dumps({"user_id": [user.id], "property_id": "P1", "event": "view"}) + "\n"
+                     + json.dumps({"user_id": user.id, "property_id": "P2", "event": ["save"]}) + "\n", encoding="utf-8")
+    assert inter_svc.import_interactions_file(lines, chunk_size=1) == {"read": 4, "logged": 1, "skipped": 3}
+    with pytest.raises(ValueError, match="must be strings"):
+        inter_svc.log_interactions_bulk([{"user_id": {"a": 1}, "property_id": "P1", "event": "view"}])
+
+    # Appends keep the file in save_interactions' layout, and the buffer follows them without a reload
+    rows = inter_svc.load_interactions()
+    assert (tmp_path / "interactions.json").read_text(encoding="utf-8") == json.dumps(rows, indent=2)
+    assert inter_svc.get_interaction_buffer() is buffer and list(buffer) == rows and len(rows) == 6
+
+
+def test_repeated_views_are_coalesced(stub_llm, monkeypatch):
+    props_svc.ensure_properties()
+    user = users_svc.create_user(email="d@example.com", first_name="D", last_name="User")
+
+    deduper = inter_svc.ViewDeduper(window=60, buckets=6)
+    assert deduper.offer("U1", "P1", 1000.0) and not deduper.offer("U1", "P1", 1030.0)
+    assert deduper.offer("U1", "P2", 1030.0) and deduper.expire(1055.0) == []
+    [rec] = deduper.expire(1060.0)
+    assert (rec["property_id"], rec["count"]) == ("P1", 1) and len(deduper) == 1
+    assert deduper.drain() == [] and len(deduper) == 0
+
+    monkeypatch.setattr(inter_svc, "VIEW_DEDUP_SECONDS", 60)
+    trending = trend_svc.get_trending()
+    for pid in ("P1", "P2", "P1", "P1", "P2"):
+        inter_svc.log_view(user.id, pid)
+    inter_svc.log_save(user.id, "P1")
+    assert [(r["property_id"], r["event"]) for r in inter_svc.load_interactions()] == [
+        ("P1", "view"), ("P2", "view"), ("P1", "save")]
+
+    assert {(r["property_id"], r["count"]) for r in inter_svc.flush_views()} == {("P1", 2), ("P2", 1)}
+    assert len(inter_svc.load_interactions()) == 5 and inter_svc.flush_views() == []
+    assert trending.counts("1h") == {"P1": (3, 1), "P2": (2, 0)}
+    monkeypatch.setattr(trend_svc, "_counters", None)
+    assert trend_svc.get_trending().counts("1h") == {"P1": (3, 1), "P2": (2, 0)}
+
+    # Closed windows are written by the next read, without waiting for another logged interaction
+    inter_svc.log_view(user.id, "P2")
+    inter_svc.log_view(user.id, "P2")
+    assert len(inter_svc.get_user_interactions(user.id)) == 6
+    later = time.time() + 120
+    monkeypatch.setattr(time, "time", lambda: later)
+    assert inter_svc.get_user_interactions(user.id)[-1]["count"] == 1
+
+    # Coalesced views weigh per view by default, or once
+    counted = rec_svc.build_user_affinity(user.id)
+    monkeypatch.setattr(rec_svc, "AFFINITY_COUNT_REPEAT_VIEWS", False)
+    assert rec_svc.build_user_affinity(user.id) != counted
+
+
+def test_purge_removes_records_of_deleted_users(monkeypatch, tmp_path):
+    import purge_service as purge_svc
+    import sessions_service as sess_svc
+
+    monkeypatch.setattr(sess_svc, "SESSIONS_PATH", tmp_path / "sessions.json")
+    keep = users_svc.create_user(email="k@example.com", first_name="K", last_name="User")
+    gone = users_svc.create_user(email="g@example.com", first_name="G", last_name="User")
+    for user in (keep, gone, gone):
+        sess_svc.create_session(user.id)
+        inter_svc.log_view(user.id, "P1")
+    inter_svc.log_save(gone.id, "P2")
+    buffer = inter_svc.get_interaction_buffer()
+    assert purge_svc.purge_orphans()["interactions"] == {"rows": 0, "bytes": 0}
+    assert inter_svc.get_interaction_buffer() is buffer
+
+    deleted = []
+    users_svc.subscribe_user_deletions(deleted.append)
+    try:
+        assert users_svc.delete_user(gone.id)
+    finally:
+        users_svc.unsubscribe_user_deletions(deleted.append)
+    assert deleted == [gone.id]
+
+    before = (tmp_path / "interactions.json").stat().st_size
+    report = purge_svc.purge_orphans()
+    assert report["sessions"]["rows"] == 2 and report["interactions"]["rows"] == 3
+    assert report["interactions"]["bytes"] == before - (tmp_path / "interactions.json").stat().st_size > 0
+    assert purge_svc.last_purge_report() is report
+    assert {s["user_id"] for s in sess_svc._load_all_sessions()} == {keep.id}
+    assert {r["user_id"] for r in inter_svc.load_interactions()} == {keep.id}
+    assert inter_svc.get_interaction_buffer().user_ids() == {keep.id}
+    assert not inter_svc.has_interactions(gone.id)
+    report = purge_svc.purge_orphans()
+    assert report["sessions"] == {"rows": 0, "bytes": 0}
+
+    # The background job purges shortly after a deletion
+    monkeypatch.setattr(purge_svc, "PURGE_DELAY_SECONDS", 0.01)
+    purge_svc.start_purge(interval=60)
+    try:
+        sess_svc.create_session(keep.id)
+        assert users_svc.delete_user(keep.id)
+        for _ in range(500):
+            if purge_svc.last_purge_report() is not report:
+                break
+            time.sleep(0.01)
+        assert purge_svc.last_purge_report()["interactions"]["rows"] == 1
+        assert sess_svc._load_all_sessions() == [] and inter_svc.load_interactions() == []
+    finally:
+        purge_svc.stop_purge()
+
+    # Views of a deleted user still being counted are dropped, not written back after the purge
+    monkeypatch.setattr(inter_svc, "VIEW_DEDUP_SECONDS", 60)
+    first, second = (users_svc.create_user(email=f"{n}@example.com", first_name=n, last_name="User") for n in "ab")
+    for user in (first, first, second, second):
+        inter_svc.log_view(user.id, "P1")
+    assert users_svc.delete_user(first.id) and users_svc.delete_user(second.id)
+    assert inter_svc.forget_user_views(first.id) == 1
+    assert purge_svc.purge_orphans()["interactions"]["rows"] == 2
+    assert inter_svc.flush_views() == [] and inter_svc.load_interactions() == []
+
+
+def test_concurrent_user_writes_are_not_lost():
+    from concurrent.futures import ThreadPoolExecutor
+
+    def signup(i):
+        user = users_svc.create_user(email=f"u{i}@example.com", first_name="U", last_name=str(i))
+        return users_svc.update_user(user.id, budget_max=100 + i)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        created = list(pool.map(signup, range(24)))
+    assert {u.id: u.budget_max for u in users_svc.list_users()} == {u.id: u.budget_max for u in created}
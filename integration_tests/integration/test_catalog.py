@@ -0,0 +1,337 @@
+import json, os
+import pytest
+
+# Services under test
+import catalog_feed_service as feed_svc
+import geo_service as geo_svc
+import parallel_scoring_service as par_svc
+import properties_service as props_svc
+import recommender_service as rec_svc
+import resources_service as res_svc
+import search_service as search_svc
+import snapshot_service as snap_svc
+import synthetic_properties_service as syn_svc
+
+
+@pytest.fixture(autouse=True)
+def isolate_data_paths(tmp_path, monkeypatch):
+    """
+    Redirect all file I/O to a temporary folder.
+    """
+    monkeypatch.setattr(props_svc, "PROPERTIES_DATA_PATH", tmp_path / "properties.json")
+    monkeypatch.setattr(feed_svc, "CATALOG_FEED_PATH", tmp_path / "catalog_changes.jsonl")
+    monkeypatch.setattr(feed_svc, "CATALOG_VERSION_PATH", tmp_path / "catalog_version.json")
+    monkeypatch.setattr(search_svc, "_index", None)
+    monkeypatch.setattr(geo_svc, "_index", None)
+    monkeypatch.setattr(res_svc, "_resources", None)
+    monkeypatch.setattr(par_svc, "SHARDS_DIR", tmp_path / "score_shards")
+    monkeypatch.setattr(snap_svc, "SNAPSHOTS_DIR", tmp_path / "snapshots")
+    yield
+
+
+def _listing(pid, **overrides):
+    return {"property_id": pid, "location": "Tofino", "type": "cabin", "nightly_price": 150,
+            "features": ["wifi"], "tags": ["beach"], "capacity": 4, "lat": 49.1, "lon": -125.9, **overrides}
+
+
+def test_synthetic_catalog_is_deterministic_and_valid():
+    written = syn_svc.write_synthetic_catalog(1000, seed=3, chunk_size=300)
+    props = props_svc.load_properties_from_disk()
+    assert written == len(props) == 1000
+    assert len({p["property_id"] for p in props}) == 1000
+    assert all(props_svc._validate_property(p) == p for p in props)
+
+    again = [p for chunk in syn_svc.generate_catalog(1000, seed=3, chunk_size=300) for p in chunk]
+    assert json.dumps(again) == json.dumps(props)
+
+
+def test_interrupted_stream_leaves_no_partial_catalog(monkeypatch):
+    def interrupted():
+        yield _listing("P1")
+        raise ConnectionError("stream dropped")
+
+    monkeypatch.setattr(props_svc, "llm_stream_properties", interrupted)
+    with pytest.raises(ConnectionError):
+        props_svc.ensure_properties(stream=True)
+    assert not props_svc.PROPERTIES_DATA_PATH.exists()
+    assert list(props_svc.PROPERTIES_DATA_PATH.parent.glob("*.tmp")) == []
+
+    seen = []
+    monkeypatch.setattr(props_svc, "llm_stream_properties", lambda: iter([_listing("P1"), _listing("P2")]))
+    props = props_svc.ensure_properties(stream=True, on_listing=lambda prop, count: seen.append(count))
+    assert seen == [1, 2] and props_svc.load_properties_from_disk() == props
+
+
+def test_upsert_delete_and_change_feed():
+    received = []
+    feed_svc.subscribe(received.extend)
+    try:
+        props_svc.save_properties([_listing("P1"), _listing("P2")])
+        v1 = feed_svc.get_catalog_version()
+        v2 = props_svc.upsert_property(_listing("P1", nightly_price=99))
+        v3 = props_svc.upsert_property(_listing("P3"))
+        assert props_svc.delete_property("P2") and not props_svc.delete_property("nope")
+    finally:
+        feed_svc.unsubscribe(received.extend)
+
+    assert v1 < v2 < v3 < feed_svc.get_catalog_version()
+    assert [p["property_id"] for p in props_svc.load_properties_from_disk()] == ["P1", "P3"]
+    assert props_svc.get_property("P1")["nightly_price"] == 99
+
+    changes = feed_svc.changes_since(v1)
+    assert [(c["op"], c["property_id"]) for c in changes] == [("upsert", "P1"), ("upsert", "P3"), ("delete", "P2")]
+    assert [c["version"] for c in received] == [v1, v2, v3, v3 + 1]
+    assert feed_svc.changes_since(0)[0]["op"] == "reset"
+    with pytest.raises(ValueError):
+        props_svc.upsert_property({"property_id": "bad"})
+
+
+def test_search_prefix_filters_facets_and_feed():
+    props_svc.save_properties([
+        _listing("P1", type="cabin", tags=["lake", "quiet"], nightly_price=120),
+        _listing("P2", type="condo", location="Kelowna", tags=["lake"], nightly_price=220, capacity=2),
+        _listing("P3", type="cabin", location="Banff", tags=["mountain"], nightly_price=180, capacity=6),
+    ])
+    res = search_svc.search_properties("lak")
+    assert [p["property_id"] for p in res["results"]] == ["P1", "P2"]
+
+    res = search_svc.search_properties("", filters={"type": ["cabin"]}, price_range=(100, 200),
+                                       capacity_range=(5, None))
+    assert [p["property_id"] for p in res["results"]] == ["P3"]
+    # Facet counts for a field ignore that field's own filter
+    assert res["facets"]["type"] == {"cabin": 1}
+
+    res = search_svc.search_properties("", filters={"type": ["cabin"]})
+    assert res["facets"]["type"] == {"cabin": 2, "condo": 1} and res["total"] == 2
+
+    page = search_svc.search_properties("", page=2, page_size=2)
+    assert page["pages"] == 2 and len(page["results"]) == 1
+
+    # Incremental updates arrive through the change feed
+    index = search_svc.get_search_index()
+    props_svc.upsert_property(_listing("P4", location="Lake Louise", tags=["mountain"]))
+    props_svc.delete_property("P1")
+    assert search_svc.get_search_index() is index
+    assert [p["property_id"] for p in search_svc.search_properties("lake")["results"]] == ["P4", "P2"]
+
+
+def test_search_index_bulk_build_and_concurrent_changes():
+    import threading
+
+    props = [_listing(f"P{i}", nightly_price=300 - i, capacity=i % 7) for i in range(200)]
+    props.append(_listing("P5", nightly_price=999))
+    built = search_svc.PropertySearchIndex(props)
+    incremental = search_svc.PropertySearchIndex()
+    for prop in props:
+        incremental.add(prop)
+    assert built._ranges == {f: sorted(v) for f, v in built._ranges.items()}
+    query = {"price_range": (150, 1000), "capacity_range": (2, 5), "page_size": 500}
+    assert built.search("tof", **query)["results"] == incremental.search("tof", **query)["results"]
+
+    errors, stop = [], threading.Event()
+
+    def churn():
+        for i in range(300):
+            built.apply_changes([{"op": "upsert", "property": _listing(f"N{i}", location=f"Place{i}")},
+                                 {"op": "delete", "property_id": f"P{i % 200}"}])
+        stop.set()
+
+    def query_loop():
+        try:
+            while not stop.is_set():
+                built.search("pla", filters={"tags": ["beach"]})
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=churn), threading.Thread(target=query_loop)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == [] and built.search("place299")["total"] == 1
+
+
+def test_search_index_compacts_after_repeated_edits():
+    index = search_svc.PropertySearchIndex([_listing(f"P{i}", nightly_price=100 + i) for i in range(10)])
+    expected = index.search("tof", page_size=50)["results"]
+    for round_ in range(3 * search_svc.COMPACT_MIN_TOMBSTONES):
+        index.apply_changes([{"op": "upsert", "property": _listing(f"P{round_ % 10}", nightly_price=100 + round_ % 10)}])
+        index.apply_changes([{"op": "upsert", "property": _listing("TMP")}, {"op": "delete", "property_id": "TMP"}])
+    assert len(index) == 10 and len(index._docs) <= 10 + search_svc.COMPACT_MIN_TOMBSTONES
+    assert all(len(entries) == 10 for entries in index._ranges.values())
+    assert {r["property_id"] for r in index.search("tof", page_size=50)["results"]} == {r["property_id"] for r in expected}
+    assert index.search("", price_range=(105, 107))["total"] == 3 and index.get("TMP") is None
+
+
+def test_shared_resources_rebuild_on_change():
+    props_svc.save_properties([_listing("P1"), _listing("P2", tags=[" Lake "])])
+    res = res_svc.get_catalog_resources()
+    assert res_svc.get_catalog_resources() is res
+    assert res.label("P2") == "P2 — Tofino ($150)" and res.label("nope") == "nope"
+    assert res.tokens[res.index["P2"]] == ["wifi", "lake"]
+    assert list(res.frame["tokens"]) == res.tokens
+
+    props_svc.delete_property("P1")
+    fresh = res_svc.get_catalog_resources()
+    assert fresh is not res and fresh.get("P1") is None and len(fresh) == 1
+
+
+def test_shared_resources_are_not_stamped_with_a_later_fingerprint(monkeypatch):
+    props_svc.save_properties([_listing("P1")])
+    load = res_svc.load_properties_from_disk
+
+    def load_then_write():
+        props = load()
+        props_svc.upsert_property(_listing("P2"))  # lands after the load, before the resources are stamped
+        return props
+
+    monkeypatch.setattr(res_svc, "load_properties_from_disk", load_then_write)
+    stale = res_svc.get_catalog_resources()
+    assert stale.get("P2") is None
+    monkeypatch.setattr(res_svc, "load_properties_from_disk", load)
+    assert res_svc.get_catalog_resources().get("P2") is not None
+
+
+def test_sharded_scoring_matches_in_process_scoring():
+    syn_svc.write_synthetic_catalog(3000, seed=5, chunk_size=1000)
+    res = res_svc.get_catalog_resources()
+    prefs = rec_svc.UserPrefs(
+        180, "lake", weight_afford=10, weight_env=5, weight_prefs=3, weight_proximity=5, anchor=(49.9, -119.5),
+    )
+    prefs.normalize_weights()
+    affinity = {"hot tub": 1.0, "wifi": 0.25, "lake": 0.5}
+
+    frame = res.frame[res.frame["capacity"] >= 4]
+    expected = rec_svc.score_properties(frame, prefs, affinity=affinity).head(10)
+
+    scorer = par_svc.ShardedScorer(res, workers=2, shard_size=700)
+    try:
+        rows, scores = scorer.top_k(prefs, 10, affinity=affinity, min_capacity=4)
+    finally:
+        scorer.close()
+    assert len(scorer.shards()) == 5
+    assert [round(x, 9) for x in scores.tolist()] == [round(x, 9) for x in expected["match_score"].tolist()]
+    assert set(res.props[i]["property_id"] for i in rows.tolist()) == set(expected["property_id"])
+
+
+def test_shard_cleanup_spares_recent_directories():
+    props_svc.save_properties([_listing("P1")])
+    first = par_svc._write_arrays(res_svc.get_catalog_resources())
+    crashed = par_svc.SHARDS_DIR / f"{first.name}.999.deadbeef.tmp"
+    crashed.mkdir()
+
+    props_svc.upsert_property(_listing("P2"))
+    second = par_svc._write_arrays(res_svc.get_catalog_resources())
+    assert second != first and first.exists() and crashed.exists()
+
+    # Directories follow the arrays' content: the same fingerprint with other listings gets its own
+    res = res_svc.get_catalog_resources()
+    assert par_svc._write_arrays(res_svc.CatalogResources(res.props, res.fingerprint)) == second
+    assert par_svc._write_arrays(res_svc.CatalogResources(res.props[:1], res.fingerprint)) == first
+
+    old = os.stat(first).st_mtime - 2 * par_svc.SHARD_CLEANUP_GRACE_SECONDS
+    os.utime(first, (old, old))
+    os.utime(crashed, (old, old))
+    par_svc._write_arrays(res_svc.get_catalog_resources())
+    assert sorted(p.name for p in par_svc.SHARDS_DIR.iterdir()) == [second.name]
+
+
+def test_geo_index_radius_bbox_and_nearest():
+    props_svc.save_properties([
+        _listing("T1", lat=49.1529, lon=-125.9066),
+        _listing("T2", lat=49.1600, lon=-125.9000),
+        _listing("K1", location="Kelowna", lat=49.8880, lon=-119.4960),
+        _listing("B1", location="Banff", lat=51.1784, lon=-115.5708),
+    ])
+    near_tofino = geo_svc.properties_within_radius(49.1529, -125.9066, 10)
+    assert [pid for pid, _ in near_tofino] == ["T1", "T2"] and near_tofino[0][1] == pytest.approx(0.0)
+    assert sorted(geo_svc.properties_in_bbox(49.0, 50.0, -126.0, -119.0)) == ["K1", "T1", "T2"]
+    assert [pid for pid, _ in geo_svc.nearest_properties("T1", k=2)] == ["T2", "K1"]
+
+    # The index is rebuilt when the catalog changes
+    props_svc.delete_property("T2")
+    assert [pid for pid, _ in geo_svc.nearest_properties("T1", k=1)] == ["K1"]
+
+    # A radius crossing the antimeridian finds listings on both sides
+    far = [_listing(f"X{i}", lat=0.0, lon=float(i)) for i in range(20)]  # enough occupied cells to avoid a full scan
+    props_svc.save_properties([_listing("F1", lat=-17.0, lon=179.95), _listing("S1", lat=-17.0, lon=-179.95), *far])
+    assert [pid for pid, _ in geo_svc.properties_within_radius(-17.0, 179.99, 20)] == ["F1", "S1"]
+    assert [pid for pid, _ in geo_svc.properties_within_radius(-17.0, -179.99, 20)] == ["S1", "F1"]
+    props_svc.save_properties([_listing("E", lat=0.0, lon=179.5), _listing("W", lat=0.0, lon=-179.5), *far])
+    assert sorted(geo_svc.properties_in_bbox(-1, 1, 179, 181)) == ["E", "W"]
+    assert sorted(geo_svc.properties_in_bbox(-1, 1, -181, -179)) == ["E", "W"]
+    assert geo_svc.properties_in_bbox(-1, 1, 179.6, 180.4) == []
+
+    # A box over empty cells only looks at its own cells, even when the listings are clustered in a few
+    clustered = geo_svc.GeoIndex([_listing(f"C{i}", lat=10.0, lon=10.0 + i * 1e-4) for i in range(1000)])
+    assert len(clustered._candidates(40.0, 42.0, 40.0, 42.0)) == 0
+
+
+def test_map_layer_is_bounded():
+    import visualization_service as viz_svc
+
+    syn_svc.write_synthetic_catalog(5000, seed=5)
+    viz_svc.clear_map_cache()
+    pyramid = viz_svc.get_map_pyramid()
+    assert viz_svc.get_map_pyramid() is pyramid
+    bounds = pyramid.bounds()
+
+    overview = pyramid.layer(*bounds, viz_svc.MIN_ZOOM)
+    assert set(overview["kind"]) == {"cluster"} and overview["count"].sum() == 5000
+
+    detail = pyramid.layer(*bounds, viz_svc.MAX_ZOOM)
+    assert set(detail["kind"]) == {"point"} and len(detail) == viz_svc.MAX_MAP_POINTS
+
+    # A catalog change invalidates the shared frame
+    frame = viz_svc.get_map_dataframe()
+    props_svc.delete_property("syn0")
+    assert len(viz_svc.get_map_dataframe()) == len(frame) - 1
+    viz_svc.clear_map_cache()
+
+
+def test_snapshots_restore_and_replay_the_tail(monkeypatch, tmp_path):
+    import interactions_service as inter_svc
+
+    monkeypatch.setattr(inter_svc, "INTERACTIONS_PATH", tmp_path / "interactions.json")
+    monkeypatch.setattr(inter_svc, "_buffer", None)
+    monkeypatch.setattr(inter_svc, "_deduper", None)
+    props_svc.save_properties([_listing("P1"), _listing("P2", tags=["lake"])])
+    props_svc.upsert_property(_listing("P3", location="Kelowna"))
+    inter_svc.log_view("U1", "P1")
+    res_svc.get_catalog_resources().tokens
+    search_svc.get_search_index()
+    inter_svc.get_interaction_buffer()
+    assert snap_svc.snapshot_all() == {"interactions": True, "search": True, "catalog": True}
+
+    # Written after the snapshots: only these are replayed
+    props_svc.upsert_property(_listing("P4", location="Whistler"))
+    props_svc.delete_property("P2")
+    inter_svc.log_save("U1", "P4")
+
+    monkeypatch.setattr(res_svc, "_resources", None)
+    monkeypatch.setattr(search_svc, "_index", None)
+    monkeypatch.setattr(inter_svc, "_buffer", None)
+    monkeypatch.setattr(res_svc, "load_properties_from_disk", lambda: pytest.fail("resources were rebuilt"))
+    monkeypatch.setattr(search_svc, "load_properties_from_disk", lambda: pytest.fail("index was rebuilt"))
+    monkeypatch.setattr(inter_svc, "load_interactions", lambda: pytest.fail("interactions were reparsed"))
+
+    assert [p["property_id"] for p in res_svc.get_catalog_resources().props] == ["P1", "P3", "P4"]
+    assert {r["property_id"] for r in search_svc.search_properties("whistler")["results"]} == {"P4"}
+    assert [r["event"] for r in inter_svc.get_user_interactions("U1")] == ["view", "save"]
+
+    # A corrupt snapshot is rejected, so the store rebuilds from the JSON files
+    path = snap_svc.SNAPSHOTS_DIR / "catalog.snap"
+    data = bytearray(path.read_bytes())
+    data[-1] ^= 0xFF
+    path.write_bytes(bytes(data))
+    assert snap_svc.read_snapshot("catalog") is None
+
+    # A search snapshot from another index schema, or whose state fails to replay, is treated as missing
+    catalog = {"catalog": str(props_svc.PROPERTIES_DATA_PATH)}
+    index = search_svc.get_search_index()
+    snap_svc.write_snapshot("search", index, {**catalog, "schema": search_svc.INDEX_SCHEMA_VERSION - 1})
+    assert search_svc._restore_index() is None
+    broken = search_svc.PropertySearchIndex([])
+    broken.__dict__ = {"_lock": broken._lock, "version": index.version - 1}
+    snap_svc.write_snapshot("search", broken, {**catalog, "schema": search_svc.INDEX_SCHEMA_VERSION})
+    assert search_svc._restore_index() is None
@@ -0,0 +1,123 @@
+import json
+import pytest
+
+# Services under test
+import llm_client_service as llm_svc
+
+
+class _FakeResponse:
+    def __init__(self, body):
+        self.status_code = 200
+        self._body = body
+        self.text = json.dumps(body)
+
+    def json(self):
+        return self._body
+
+
+class _FakeSession:
+    def __init__(self, body):
+        self.body = body
+        self.calls = 0
+
+    def post(self, *a, **k):
+        self.calls += 1
+        return _FakeResponse(self.body)
+
+
+@pytest.fixture(autouse=True)
+def isolate_cache(tmp_path, monkeypatch):
+    """
+    Redirect the response cache to a temporary folder.
+    """
+    monkeypatch.setattr(llm_svc, "CACHE_DIR", tmp_path / "llm_cache")
+    monkeypatch.delenv(llm_svc.OFFLINE_ENV_VAR, raising=False)
+    yield
+
+
+@pytest.fixture
+def fake_session(monkeypatch):
+    body = {"choices": [{"message": {"content": "[]"}}]}
+    session = _FakeSession(body)
+    monkeypatch.setattr(llm_svc, "_get_session", lambda: session)
+    return session
+
+
+def test_cache_hit_and_offline_replay(fake_session):
+    messages = [{"role": "system", "content": "hi"}]
+    first = llm_svc.chat_completion(messages, model="m", temperature=0.5, headers={}, seed=1)
+    second = llm_svc.chat_completion(messages, model="m", temperature=0.5, headers={}, seed=1)
+    assert first == second and fake_session.calls == 1
+
+    # Same request replays offline; a different seed is a miss
+    assert llm_svc.chat_completion(messages, model="m", temperature=0.5, headers={}, seed=1, offline=True) == first
+    with pytest.raises(RuntimeError):
+        llm_svc.chat_completion(messages, model="m", temperature=0.5, headers={}, seed=2, offline=True)
+
+
+def test_cache_eviction(fake_session, monkeypatch):
+    monkeypatch.setattr(llm_svc, "CACHE_MAX_ENTRIES", 2)
+    for seed in range(4):
+        llm_svc.chat_completion([], model="m", temperature=0.0, headers={}, seed=seed)
+    assert llm_svc.cache_stats()["entries"] == 2
+
+
+def test_stream_skips_malformed_listings(monkeypatch):
+    import properties_service as props_svc
+
+    good = {"property_id": "P1", "location": "Tofino", "type": "cabin", "nightly_price": 150,
+            "features": ["wifi"], "tags": ["beach"], "capacity": 4, "lat": 49.1, "lon": -125.9}
+    content = "```json\n[" + json.dumps(good) + ', {"property_id": "P2", "location": }, ' \
+              + json.dumps({**good, "property_id": "P3"}) + "]\n```"
+    lines = [f"data: {json.dumps({'choices': [{'delta': {'content': content[i:i + 7]}}]})}"
+             for i in range(0, len(content), 7)] + [": keep-alive", "data: [DONE]"]
+
+    class _StreamResponse(_FakeResponse):
+        def iter_lines(self, decode_unicode=False):
+            return iter(lines)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+    monkeypatch.setattr(llm_svc, "_get_session", lambda: type("S", (), {"post": lambda *a, **k: _StreamResponse({})})())
+    monkeypatch.setattr(props_svc, "_headers", lambda: {})
+    streamed = [p["property_id"] for p in props_svc.llm_stream_properties(seed=7)]
+    assert streamed == ["P1", "P3"]
+
+    # The assembled completion was cached, so the same request replays offline
+    monkeypatch.setenv(llm_svc.OFFLINE_ENV_VAR, "1")
+    assert [p["property_id"] for p in props_svc.llm_stream_properties(seed=7)] == streamed
+    assert [p["property_id"] for p in props_svc.llm_generate_properties(seed=7)] == streamed
+
+
+def test_stream_caches_only_completed_replies(monkeypatch):
+    def stream(lines):
+        class _StreamResponse(_FakeResponse):
+            def iter_lines(self, decode_unicode=False):
+                return iter(lines)
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+        session = type("S", (), {"post": lambda *a, **k: _StreamResponse({})})()
+        monkeypatch.setattr(llm_svc, "_get_session", lambda: session)
+
+    def delta(text, finish=None):
+        return f"data: {json.dumps({'choices': [{'delta': {'content': text}, 'finish_reason': finish}]})}"
+
+    # The connection drops before [DONE]: the partial reply is not cached
+    stream([delta("[{\"a\":"), delta(" 1")])
+    assert "".join(llm_svc.stream_chat_completion([], model="m", temperature=0.0, headers={}, seed=1)) == '[{"a": 1'
+    assert llm_svc.cache_stats()["entries"] == 0
+
+    # A finish_reason completes the reply even without [DONE]
+    stream([delta("[{\"a\":"), delta(" 1}]", finish="stop")])
+    assert "".join(llm_svc.stream_chat_completion([], model="m", temperature=0.0, headers={}, seed=1)) == '[{"a": 1}]'
+    assert llm_svc.cache_stats()["entries"] == 1
+    assert list(llm_svc.CACHE_DIR.glob("*.tmp")) == []
@@ -1,11 +1,336 @@
 from __future__ import annotations
 from pathlib import Path
-from typing import List, Dict
-import json
+from typing import Callable, Collection, Iterable, Iterator, List, Dict
+import atexit, copy, json, os, sys, textwrap, threading, time
+from array import array
+from collections import deque
 from datetime import datetime
 
+from metrics_service import counter, histogram
+from profiling_service import profiled
+from snapshot_service import json_array_checkpoint, json_array_tail, read_snapshot, register_snapshot
+from storage_service import atomic_write_text, file_lock
+
 INTERACTIONS_PATH: Path = Path(__file__).parent / "data" / "interactions.json"
 EVENT_WEIGHTS = {"view": 1, "save": 3}
+RECORD_FIELDS = ("ts", "user_id", "property_id", "event", "weight")
+# Stored in place of a timestamp that could not be parsed (the original text is kept with the record's extras)
+NO_TIMESTAMP = -2**63
+# Events per write when importing a file
+IMPORT_CHUNK_SIZE = 100_000
+# Repeated views of a listing by the same user within this many seconds are coalesced (0 turns deduplication off)
+VIEW_DEDUP_SECONDS = float(os.environ.get("VIEW_DEDUP_SECONDS", "60"))
+# Time buckets per window: the window of a view ends between 1 - 1/VIEW_DEDUP_BUCKETS and 1 window after it
+VIEW_DEDUP_BUCKETS = 6
+
+_STORAGE_SECONDS = histogram("storage_seconds", "Time spent reading or writing a JSON data file", ("file", "op"))
+_LOGGED = counter("interactions_logged_total", "Interactions logged by event", ("event",))
+_COALESCED = counter("views_coalesced_total", "Repeated views folded into a counted record instead of logged")
+
+_listeners: List[Callable[[Dict], None]] = []
+_listeners_lock = threading.Lock()
+
+class InteractionBuffer:
+    """
+    Interactions held column by column instead of as a list of dictionaries: user and property ids are interned to
+    integer codes, events to byte codes and timestamps to microseconds since the epoch, each column in a typed array.
+    A record costs 17 bytes plus its share of the interned ids, against several hundred bytes for a parsed JSON
+    object. Records are converted back to the usual dictionaries on the way out, so callers see no difference.
+    """
+
+    __slots__ = ("users", "properties", "events", "times", "_user_ids", "_user_codes", "_property_ids",
+                 "_property_codes", "_event_names", "_event_codes", "_extras", "_lock")
+
+    def __init__(self, rows: Iterable[Dict] = ()):
+        self.users = array("I")
+        self.properties = array("I")
+        self.events = array("B")
+        self.times = array("q")
+        self._user_ids: List[str] = []
+        self._user_codes: Dict[str, int] = {}
+        self._property_ids: List[str] = []
+        self._property_codes: Dict[str, int] = {}
+        self._event_names: List[str] = []
+        self._event_codes: Dict[str, int] = {}
+        # Position -> fields that do not fit the columns (unknown keys, unparseable timestamps, unusual weights)
+        self._extras: Dict[int, Dict] = {}
+        self._lock = threading.Lock()
+        self.extend(rows)
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+    def __iter__(self) -> Iterator[Dict]:
+        for i in range(len(self)):
+            yield self.record(i)
+
+    def __getstate__(self) -> dict:
+        with self._lock:
+            return {name: copy.copy(getattr(self, name)) for name in self.__slots__ if name != "_lock"}
+
+    def __setstate__(self, state: dict) -> None:
+        for name, value in state.items():
+            setattr(self, name, value)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _intern(ids: List[str], codes: Dict[str, int], value: str) -> int:
+        """
+        Return the code of a value, assigning the next one on first sight
+
+        :param ids: code -> value
+        :param codes: value -> code
+        :param value: the value
+        :return: the code
+        """
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(ids)
+            ids.append(sys.intern(value) if isinstance(value, str) else value)
+        return code
+
+    def _append(self, rec: Dict) -> None:
+        extras = {k: v for k, v in rec.items() if k not in RECORD_FIELDS}
+        event = rec.get("event")
+        if rec.get("weight") != EVENT_WEIGHTS.get(event):
+            extras["weight"] = rec.get("weight")
+        micros = _to_micros(rec.get("ts"))
+        if _from_micros(micros) != rec.get("ts"):
+            # Unparseable, or not in _now_iso()'s format (an explicit offset, a time skipped by a DST change): the
+            # microseconds still order it, but only the original string rebuilds it
+            extras["ts"] = rec.get("ts")
+        if len(self._event_names) == 255 and event not in self._event_codes:
+            raise ValueError("Too many distinct event types")
+        if extras:
+            self._extras[len(self.users)] = extras
+        self.users.append(self._intern(self._user_ids, self._user_codes, rec.get("user_id")))
+        self.properties.append(self._intern(self._property_ids, self._property_codes, rec.get("property_id")))
+        self.events.append(self._intern(self._event_names, self._event_codes, event))
+        self.times.append(micros)
+
+    def append(self, rec: Dict) -> None:
+        """
+        Add one interaction record
+
+        :param rec: the record, as logged
+        :return: None
+        """
+        with self._lock:
+            self._append(rec)
+
+    def extend(self, rows: Iterable[Dict]) -> None:
+        """
+        Add interaction records
+
+        :param rows: the records, as logged
+        :return: None
+        """
+        with self._lock:
+            for rec in rows:
+                self._append(rec)
+
+    def record(self, i: int) -> Dict:
+        """
+        Rebuild the dictionary for one position
+
+        :param i: the position
+        :return: the record, as logged
+        """
+        event = self._event_names[self.events[i]]
+        rec = {
+            "ts": _from_micros(self.times[i]),
+            "user_id": self._user_ids[self.users[i]],
+            "property_id": self._property_ids[self.properties[i]],
+            "event": event,
+            "weight": EVENT_WEIGHTS.get(event),
+        }
+        extras = self._extras.get(i)
+        if extras:
+            rec.update(extras)
+        return rec
+
+    def has_user(self, user_id: str) -> bool:
+        """
+        Return whether a user has any interactions
+
+        :param user_id: the user id
+        :return: TRUE if they do; FALSE otherwise
+        """
+        return user_id in self._user_codes
+
+    def user_ids(self) -> set[str]:
+        """
+        Return the ids of every user with interactions, from the interned ids (no records are rebuilt)
+
+        :return: the user ids
+        """
+        with self._lock:
+            return set(self._user_codes)
+
+    def for_user(self, user_id: str) -> List[Dict]:
+        """
+        Return a user's interactions, oldest first
+
+        :param user_id: the user id
+        :return: the records
+        """
+        import numpy as np
+
+        code = self._user_codes.get(user_id)
+        if code is None:
+            return []
+        with self._lock:
+            positions = np.flatnonzero(np.frombuffer(self.users, dtype=np.uint32) == code).tolist()
+        return [self.record(i) for i in positions]
+
+    def since(self, ts: float, counts: bool = False) -> Iterator[tuple]:
+        """
+        Yield the interactions at or after a time without building dictionaries
+
+        :param ts: the UNIX timestamp
+        :param counts: also yield the number of events each record stands for (see ViewDeduper)
+        :return: (property id, event, UNIX timestamp) tuples, with the count appended if requested
+        """
+        import numpy as np
+
+        with self._lock:
+            positions = np.flatnonzero(np.frombuffer(self.times, dtype=np.int64) >= int(ts * 1_000_000)).tolist()
+        for i in positions:
+            row = self._property_ids[self.properties[i]], self._event_names[self.events[i]], self.times[i] / 1_000_000
+            yield (*row, self._extras.get(i, {}).get("count", 1)) if counts else row
+
+    def nbytes(self) -> int:
+        """
+        Estimate the memory held by the buffer (columns and interned ids)
+
+        :return: the size in bytes
+        """
+        columns = sum(a.itemsize * len(a) for a in (self.users, self.properties, self.events, self.times))
+        interned = sum(sys.getsizeof(v) for v in (*self._user_ids, *self._property_ids))
+        extras = sum(sys.getsizeof(e) for e in self._extras.values())
+        return columns + interned + extras
+
+class ViewDeduper:
+    """
+    Recency window over (user, property) pairs for view events. The first view of a pair is logged as usual; further
+    views within the window are only counted, and once the window has passed they are written as a single view record
+    with a "count" field (the number of views it stands for). Scrolling back and forth through the listings costs at
+    most two records per listing and window, and no view is lost.
+
+    Pairs are kept in a ring of time buckets (the bucket of their first view), so expiring a window pops whole buckets
+    instead of scanning every pair. Memory is bounded by the number of distinct pairs viewed within a window.
+    """
+
+    __slots__ = ("window", "buckets", "width", "_ring", "_open", "_lock")
+
+    def __init__(self, window: float = VIEW_DEDUP_SECONDS, buckets: int = VIEW_DEDUP_BUCKETS):
+        if window <= 0 or buckets < 1:
+            raise ValueError("window must be positive and buckets at least 1")
+        self.window = float(window)
+        self.buckets = buckets
+        self.width = self.window / buckets
+        # (bucket index, pair -> [repeat views, time of the last one]), oldest bucket first
+        self._ring: deque[tuple[int, Dict[tuple, list]]] = deque()
+        # pair -> the same [repeat views, time of the last one] entry held in its bucket
+        self._open: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._open)
+
+    @staticmethod
+    def _coalesced(pair: tuple, repeats: int, last: float) -> Dict:
+        """
+        Build the record standing for a pair's repeated views
+
+        :param pair: (user id, property id)
+        :param repeats: the number of repeated views
+        :param last: the UNIX time of the last one
+        :return: the record
+        """
+        return {
+            "ts": _from_micros(round(last * 1_000_000)),
+            "user_id": pair[0],
+            "property_id": pair[1],
+            "event": "view",
+            "weight": EVENT_WEIGHTS["view"],
+            "count": repeats,
+        }
+
+    def offer(self, user_id: str, property_id: str, now: float) -> bool:
+        """
+        Register a view
+
+        :param user_id: the user id
+        :param property_id: the property id
+        :param now: the UNIX time of the view
+        :return: TRUE if it is the first view of the pair within the window (log it); FALSE if it was counted
+        """
+        pair = (user_id, property_id)
+        with self._lock:
+            entry = self._open.get(pair)
+            if entry is not None:
+                entry[0] += 1
+                entry[1] = now
+                return False
+            idx = int(now // self.width)
+            if not self._ring or self._ring[-1][0] != idx:
+                self._ring.append((idx, {}))
+            self._ring[-1][1][pair] = self._open[pair] = [0, now]
+            return True
+
+    def forget(self, user_ids: Collection[str]) -> int:
+        """
+        Drop the open windows of some users without writing their repeated views (e.g. because the users were deleted)
+
+        :param user_ids: the user ids
+        :return: the number of windows dropped
+        """
+        with self._lock:
+            dropped = [pair for pair in self._open if pair[0] in user_ids]
+            for pair in dropped:
+                del self._open[pair]
+            if dropped:
+                for _, pairs in self._ring:
+                    for pair in dropped:
+                        pairs.pop(pair, None)
+                self._ring = deque(bucket for bucket in self._ring if bucket[1])
+        return len(dropped)
+
+    def expire(self, now: float) -> List[Dict]:
+        """
+        Close the windows that have passed
+
+        :param now: the current UNIX time
+        :return: a counted view record for every closed pair that was viewed again within its window
+        """
+        current = int(now // self.width)
+        out = []
+        with self._lock:
+            while self._ring and self._ring[0][0] + self.buckets <= current:
+                _, pairs = self._ring.popleft()
+                for pair, (repeats, last) in pairs.items():
+                    del self._open[pair]
+                    if repeats:
+                        out.append(self._coalesced(pair, repeats, last))
+        return out
+
+    def drain(self) -> List[Dict]:
+        """
+        Close every open window now
+
+        :return: a counted view record for every pair that was viewed again within its window
+        """
+        with self._lock:
+            ring, self._ring, self._open = self._ring, deque(), {}
+        return [self._coalesced(pair, repeats, last)
+                for _, pairs in ring for pair, (repeats, last) in pairs.items() if repeats]
+
+_buffer: InteractionBuffer | None = None
+_deduper: ViewDeduper | None = None
+_deduper_lock = threading.Lock()
+_buffer_stamp: tuple | None = None
+_buffer_lock = threading.Lock()
 
 # ======================================================================================================================
 # HELPER FUNCTIONS (for internal use)
@@ -19,6 +344,95 @@ def _now_iso() -> str:
     now = datetime.now()
     return now.isoformat() + "Z"
 
+def _to_micros(ts: str | None) -> int:
+    """
+    Convert an interaction timestamp (ISO 8601, local time with a trailing 'Z') to microseconds since the epoch
+
+    :param ts: the timestamp string
+    :return: the microseconds, or NO_TIMESTAMP if it cannot be parsed
+    """
+    try:
+        return round(datetime.fromisoformat(str(ts).rstrip("Z")).timestamp() * 1_000_000)
+    except ValueError:
+        return NO_TIMESTAMP
+
+def _from_micros(micros: int) -> str | None:
+    """
+    Convert microseconds since the epoch back to the timestamp string _now_iso() writes
+
+    :param micros: the microseconds
+    :return: the timestamp string
+    """
+    if micros == NO_TIMESTAMP:
+        return None
+    seconds, fraction = divmod(micros, 1_000_000)
+    return datetime.fromtimestamp(seconds).replace(microsecond=fraction).isoformat() + "Z"
+
+def _file_stamp() -> tuple:
+    """
+    Identify the current contents of the interactions file
+
+    :return: (path, modification time, size), with zeros if the file is missing
+    """
+    try:
+        stat = INTERACTIONS_PATH.stat()
+        return str(INTERACTIONS_PATH), stat.st_mtime_ns, stat.st_size
+    except FileNotFoundError:
+        return str(INTERACTIONS_PATH), 0, 0
+
+def _restore_buffer() -> tuple[InteractionBuffer, tuple] | None:
+    """
+    Load the buffer from its snapshot and add only the records appended to interactions.json since
+
+    :return: (buffer, file stamp), or None if there is no usable snapshot
+    """
+    snapshot = read_snapshot("interactions")
+    if snapshot is None:
+        return None
+    meta, buffer = snapshot
+    if meta.get("path") != str(INTERACTIONS_PATH):
+        return None
+    stamp = _file_stamp()
+    try:
+        data = INTERACTIONS_PATH.read_bytes()
+    except FileNotFoundError:
+        return None
+    rows = json_array_tail(data, meta["prefix_len"], meta["prefix_sha256"])
+    if rows is None or len(buffer) != meta["records"]:
+        return None
+    buffer.extend(rows)
+    return buffer, stamp
+
+def _dump_buffer() -> tuple[InteractionBuffer, dict] | None:
+    """
+    Return the buffer and what it covers of interactions.json, for snapshot_service
+
+    :return: (buffer, metadata), or None if the buffer is not loaded or is behind the file
+    """
+    with _buffer_lock:
+        if _buffer is None or _file_stamp() != _buffer_stamp:
+            return None
+        data = INTERACTIONS_PATH.read_bytes()
+        prefix_len, prefix_sha256 = json_array_checkpoint(data)
+        state = _buffer.__getstate__()
+    buffer = InteractionBuffer.__new__(InteractionBuffer)
+    buffer.__setstate__(state)
+    return buffer, {"path": str(INTERACTIONS_PATH), "records": len(buffer), "prefix_len": prefix_len,
+                    "prefix_sha256": prefix_sha256}
+
+def _notify(rec: Dict) -> None:
+    """
+    Pass a logged interaction to every listener. A failing listener does not affect the others.
+    :param rec: the interaction record
+    """
+    with _listeners_lock:
+        listeners = list(_listeners)
+    for callback in listeners:
+        try:
+            callback(rec)
+        except Exception:
+            pass
+
 def _ensure_data_file() -> None:
     """
     Ensure the data file exists
@@ -27,6 +441,7 @@ def _ensure_data_file() -> None:
         INTERACTIONS_PATH.parent.mkdir(parents=True, exist_ok=True)
         INTERACTIONS_PATH.write_text("[]", encoding="utf-8")
 
+@_STORAGE_SECONDS.timed(file="interactions", op="load")
 def load_interactions() -> List[Dict]:
     """
     Load the interactions data file
@@ -38,19 +453,153 @@ def load_interactions() -> List[Dict]:
     except RuntimeError:
         return []
 
+@_STORAGE_SECONDS.timed(file="interactions", op="save")
 def save_interactions(rows: List[Dict]) -> None:
-    INTERACTIONS_PATH.parent.mkdir(parents=True, exist_ok=True)
-    INTERACTIONS_PATH.write_text(json.dumps(rows, indent=2), encoding="utf-8")
+    atomic_write_text(INTERACTIONS_PATH, json.dumps(rows, indent=2))
+
+@_STORAGE_SECONDS.timed(file="interactions", op="append")
+def _append_records(records: List[Dict]) -> None:
+    """
+    Append records to interactions.json in place, without rewriting what is already there. The file keeps exactly the
+    layout save_interactions() writes, so snapshot replay (see snapshot_service.json_array_tail) still applies.
+
+    :param records: the records
+    :return: None
+    """
+    global _buffer_stamp
+    if not records:
+        return
+    body = ",\n".join(textwrap.indent(json.dumps(rec, indent=2), "  ") for rec in records).encode("utf-8")
+    with file_lock(INTERACTIONS_PATH):
+        _ensure_data_file()
+        loaded = _file_stamp()
+        with INTERACTIONS_PATH.open("r+b") as f:
+            size = f.seek(0, os.SEEK_END)
+            start = f.seek(max(size - 4096, 0))
+            tail = f.read()
+            close = tail.rfind(b"]")
+            if close < 0:
+                raise ValueError(f"{INTERACTIONS_PATH} is not a JSON array")
+            before = tail[:close].rstrip()
+            if before.endswith(b"[") or (not before and start == 0):
+                f.seek(start + len(before))
+                f.write((b"" if before else b"[") + b"\n" + body + b"\n]")
+            else:
+                f.seek(start + len(before))
+                f.write(b",\n" + body + b"\n]")
+            f.truncate()
+        with _buffer_lock:
+            if _buffer is not None and _buffer_stamp == loaded:
+                _buffer.extend(records)
+                _buffer_stamp = _file_stamp()
+
+def _validated(events: Iterable[Dict], user_ids, property_ids, skip_invalid: bool) -> tuple[List[Dict], int]:
+    """
+    Validate events and turn them into interaction records
+
+    :param events: dictionaries with user_id, property_id, event and optionally ts
+    :param user_ids: the known user ids (None to skip the check)
+    :param property_ids: the known property ids (None to skip the check)
+    :param skip_invalid: drop invalid events instead of raising
+    :return: the records and the number of events dropped
+    """
+    records, skipped = [], 0
+    now = _now_iso()
+    for i, e in enumerate(events):
+        reason = None
+        if not isinstance(e, dict):
+            reason = "not an object"
+        elif not isinstance(e.get("event"), str) or e["event"] not in EVENT_WEIGHTS:
+            reason = f"event must be one of {', '.join(EVENT_WEIGHTS)}"
+        elif not isinstance(e.get("user_id"), str) or not isinstance(e.get("property_id"), str):
+            reason = "user_id and property_id must be strings"
+        elif not e["user_id"] or not e["property_id"]:
+            reason = "user_id and property_id are required"
+        elif user_ids is not None and e["user_id"] not in user_ids:
+            reason = f"unknown user {e['user_id']}"
+        elif property_ids is not None and e["property_id"] not in property_ids:
+            reason = f"unknown property {e['property_id']}"
+        else:
+            micros = _to_micros(e["ts"]) if e.get("ts") else None
+            if micros == NO_TIMESTAMP or (micros is not None and not isinstance(e["ts"], str)):
+                reason = f"invalid timestamp {e['ts']!r}"
+        if reason:
+            if not skip_invalid:
+                raise ValueError(f"Event {i}: {reason}")
+            skipped += 1
+            continue
+        records.append({
+            "ts": now if micros is None else _from_micros(micros),
+            "user_id": str(e["user_id"]),
+            "property_id": str(e["property_id"]),
+            "event": e["event"],
+            "weight": EVENT_WEIGHTS[e["event"]],
+        })
+    return records, skipped
+
+def _known_ids() -> tuple[set, dict]:
+    """
+    Return the ids events are checked against
+
+    :return: (user ids, property id -> catalog position)
+    """
+    from resources_service import get_catalog_resources
+    from users_service import list_users
+
+    return {u.id for u in list_users()}, get_catalog_resources().index
+
+def _commit(records: List[Dict]) -> None:
+    """
+    Write validated records in one append and update everything that follows the interaction stream
+
+    :param records: the records
+    :return: None
+    """
+    _append_records(records)
+    counts: Dict[str, int] = {}
+    for rec in records:
+        counts[rec["event"]] = counts.get(rec["event"], 0) + 1
+        _notify(rec)
+    for event, n in counts.items():
+        _LOGGED.inc(n, event=event)
+
+def _get_deduper() -> ViewDeduper | None:
+    """
+    Return the process-wide view deduplicator, creating it on first use
+
+    :return: the deduplicator, or None if VIEW_DEDUP_SECONDS turns deduplication off
+    """
+    global _deduper
+    if VIEW_DEDUP_SECONDS <= 0:
+        return None
+    with _deduper_lock:
+        if _deduper is None:
+            _deduper = ViewDeduper(VIEW_DEDUP_SECONDS)
+            atexit.register(flush_views)
+        return _deduper
+
+def _expire_views() -> None:
+    """
+    Write the counted views whose windows have passed, so they do not wait for the next logged interaction
 
+    :return: None
+    """
+    with _deduper_lock:
+        deduper = _deduper
+    records = deduper.expire(time.time()) if deduper is not None else []
+    if records:
+        _commit(records)
+
+@profiled("log_interaction")
 def log_interaction(user_id: str, property_id: str, event: str) -> Dict:
     """
-    Append a single interaction to the list of events
+    Append a single interaction to the list of events. A view repeating one logged within VIEW_DEDUP_SECONDS is not
+    written on its own but counted, and written later as part of a counted record (see ViewDeduper).
 
     :return: The interaction record
     """
     if event not in EVENT_WEIGHTS:
         raise ValueError("event must be 'view' or 'save'")
-    rows = load_interactions()
     rec = {
         "ts": _now_iso(),
         "user_id": user_id,
@@ -58,8 +607,19 @@ def log_interaction(user_id: str, property_id: str, event: str) -> Dict:
         "event": event,
         "weight": EVENT_WEIGHTS[event],
     }
-    rows.append(rec)
-    save_interactions(rows)
+    deduper = _get_deduper()
+    if deduper is None:
+        _commit([rec])
+        return rec
+
+    now = time.time()
+    records = deduper.expire(now)
+    if event != "view" or deduper.offer(user_id, property_id, now):
+        records.append(rec)
+    else:
+        _COALESCED.inc()
+    if records:
+        _commit(records)
     return rec
 
 # ======================================================================================================================
@@ -84,6 +644,146 @@ def log_save(user_id: str, property_id: str) -> Dict:
     """
     return log_interaction(user_id, property_id, "save")
 
+def flush_views() -> List[Dict]:
+    """
+    Write the repeated views still being counted, without waiting for their windows to pass. Runs at interpreter exit.
+
+    :return: the counted view records written
+    """
+    with _deduper_lock:
+        deduper = _deduper
+    records = deduper.drain() if deduper is not None else []
+    if records:
+        _commit(records)
+    return records
+
+def forget_user_views(user_id: str) -> int:
+    """
+    Drop a deleted user's repeated views that are still being counted, so they are not written after their other
+    interactions have been purged
+
+    :param user_id: the user's id
+    :return: the number of windows dropped
+    """
+    with _deduper_lock:
+        deduper = _deduper
+    return deduper.forget({user_id}) if deduper is not None else 0
+
+def log_interactions_bulk(events: Iterable[Dict], validate_ids: bool = True, skip_invalid: bool = False) -> List[Dict]:
+    """
+    Log many interactions in one write (e.g. a backfill or a batch of client events). Views are not deduplicated.
+
+    :param events: dictionaries with user_id, property_id, event ('view' or 'save') and optionally ts (ISO 8601;
+                   defaults to now)
+    :param validate_ids: reject events whose user or property does not exist
+    :param skip_invalid: drop invalid events instead of raising ValueError
+    :return: the logged records
+    """
+    user_ids, property_ids = _known_ids() if validate_ids else (None, None)
+    records, _ = _validated(events, user_ids, property_ids, skip_invalid)
+    _commit(records)
+    return records
+
+def read_interactions_file(path: str | Path) -> Iterator[Dict | None]:
+    """
+    Read events from a .csv (header: user_id,property_id,event[,ts]) or .jsonl file, one at a time
+
+    :param path: the file
+    :return: an iterator of events (None for a .jsonl line that is not valid JSON)
+    """
+    path = Path(path)
+    with path.open("r", encoding="utf-8", newline="") as f:
+        if path.suffix.lower() == ".csv":
+            import csv
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        yield None
+
+def import_interactions_file(path: str | Path, chunk_size: int = IMPORT_CHUNK_SIZE, validate_ids: bool = True,
+                             skip_invalid: bool = True) -> Dict[str, int]:
+    """
+    Stream an event file into interactions.json, one append per chunk, so files of millions of events never have
+    to fit in memory
+
+    :param path: a .csv or .jsonl file (see read_interactions_file)
+    :param chunk_size: the events validated and written at a time
+    :param validate_ids: reject events whose user or property does not exist
+    :param skip_invalid: drop invalid events instead of raising ValueError (events already written stay written)
+    :return: counts of events read, logged and skipped
+    """
+    user_ids, property_ids = _known_ids() if validate_ids else (None, None)
+    stats = {"read": 0, "logged": 0, "skipped": 0}
+    chunk: List[Dict] = []
+
+    def flush() -> None:
+        records, skipped = _validated(chunk, user_ids, property_ids, skip_invalid)
+        _commit(records)
+        stats["logged"] += len(records)
+        stats["skipped"] += skipped
+        chunk.clear()
+
+    for event in read_interactions_file(path):
+        stats["read"] += 1
+        chunk.append(event)
+        if len(chunk) >= chunk_size:
+            flush()
+    flush()
+    return stats
+
+def subscribe_interactions(callback: Callable[[Dict], None]) -> None:
+    """
+    Register a callback that receives every interaction logged by this process
+    :param callback: a function taking the interaction record
+    :return: None
+    """
+    with _listeners_lock:
+        if callback not in _listeners:
+            _listeners.append(callback)
+
+def unsubscribe_interactions(callback: Callable[[Dict], None]) -> None:
+    """
+    Remove a registered callback
+    :param callback: the callback
+    :return: None
+    """
+    with _listeners_lock:
+        if callback in _listeners:
+            _listeners.remove(callback)
+
+def remove_orphaned_interactions(live_user_ids: Callable[[], Collection[str]]) -> Dict[str, int]:
+    """
+    Remove the interactions of users that no longer exist, in one rewrite of interactions.json. Orphans are found from
+    the buffer's interned user ids, so the file is only parsed when there is something to remove.
+
+    :param live_user_ids: returns the ids of the existing users; called with the file locked, so a user created in the
+                          meantime cannot already have interactions
+    :return: the number of records removed ('rows') and the bytes reclaimed ('bytes')
+    """
+    global _buffer, _buffer_stamp
+    with file_lock(INTERACTIONS_PATH):
+        orphans = get_interaction_buffer().user_ids()
+        if orphans:
+            orphans -= set(live_user_ids())
+        if not orphans:
+            return {"rows": 0, "bytes": 0}
+        # Their windows would otherwise write counted views back once they close
+        with _deduper_lock:
+            deduper = _deduper
+        if deduper is not None:
+            deduper.forget(orphans)
+        before = INTERACTIONS_PATH.stat().st_size
+        rows = load_interactions()
+        kept = [rec for rec in rows if rec.get("user_id") not in orphans]
+        save_interactions(kept)
+        with _buffer_lock:
+            _buffer, _buffer_stamp = InteractionBuffer(kept), _file_stamp()
+        return {"rows": len(rows) - len(kept), "bytes": before - INTERACTIONS_PATH.stat().st_size}
+
 def reset_interactions_file() -> None:
     """
     Clear all interaction data. For dev/testing purposes.
@@ -93,6 +793,26 @@ def reset_interactions_file() -> None:
     INTERACTIONS_PATH.parent.mkdir(parents=True, exist_ok=True)
     INTERACTIONS_PATH.write_text("[]", encoding="utf-8")
 
+def get_interaction_buffer() -> InteractionBuffer:
+    """
+    Return the process-wide columnar copy of interactions.json, reloading it when the file has changed. Repeated views
+    whose windows have passed are written first.
+
+    :return: the buffer
+    """
+    global _buffer, _buffer_stamp
+    _expire_views()
+    with _buffer_lock:
+        if _buffer is None:
+            restored = _restore_buffer()
+            if restored is not None:
+                _buffer, _buffer_stamp = restored
+        stamp = _file_stamp()
+        if _buffer is None or stamp != _buffer_stamp:
+            _buffer = InteractionBuffer(load_interactions())
+            _buffer_stamp = stamp
+        return _buffer
+
 def get_user_interactions(user_id: str) -> List[Dict]:
     """
     Get all interactions for a given user
@@ -100,4 +820,15 @@ def get_user_interactions(user_id: str) -> List[Dict]:
     :param user_id: the user id
     :return: the interactions for that user
     """
-    return [r for r in load_interactions() if r.get("user_id") == user_id]
\ No newline at end of file
+    return get_interaction_buffer().for_user(user_id)
+
+def has_interactions(user_id: str) -> bool:
+    """
+    Return whether a user has interacted with any listing
+
+    :param user_id: the user id
+    :return: TRUE if they have; FALSE otherwise
+    """
+    return get_interaction_buffer().has_user(user_id)
+
+register_snapshot("interactions", _dump_buffer)
@@ -0,0 +1,328 @@
+from __future__ import annotations
+import hashlib, json, os, threading
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterator
+
+from storage_service import atomic_write_text
+
+if TYPE_CHECKING:
+    import requests
+
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+CACHE_DIR = Path(__file__).parent / "data" / "llm_cache"
+CACHE_MAX_ENTRIES = 200
+CACHE_MAX_BYTES = 50 * 1024 * 1024
+POOL_MAXSIZE = 10
+MAX_RETRIES = 3
+TIMEOUT_SECONDS = 60
+
+# Size of the pieces a cached completion is replayed in when streaming
+REPLAY_CHUNK_CHARS = 256
+
+# Set LLM_OFFLINE=1 to serve completions from the cache only (no network)
+OFFLINE_ENV_VAR = "LLM_OFFLINE"
+
+"""
+Owns all HTTP traffic to OpenRouter. A single requests.Session is shared by the whole process so connections are kept
+alive and pooled, and transient failures (429/5xx, connection resets) are retried with backoff.
+
+Every successful completion is written to a content-addressed disk cache before anything parses it. The cache key is
+the SHA-256 of (model, messages, temperature, seed), so an identical request is answered from disk, including when
+running offline. The cache is bounded by entry count and total size; the least recently used entries are evicted first.
+requests is only imported when the network is actually used, so cache hits never pay for it.
+"""
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+_cache_lock = threading.Lock()
+
+# ======================================================================================================================
+# HELPERS
+# ======================================================================================================================
+
+def _now_iso() -> str:
+    """
+    Return the current date and time as a ISO 8601 formatted string.
+    :return: current date and time
+    """
+    return datetime.now().isoformat(timespec="seconds") + "Z"
+
+def _get_session() -> requests.Session:
+    """
+    Return the process-wide HTTP session, creating it on first use
+
+    :return: the shared session
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            retry = Retry(
+                total=MAX_RETRIES,
+                backoff_factor=0.5,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=frozenset({"POST"}),
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+    return _session
+
+def _is_offline(offline: bool | None) -> bool:
+    """
+    Resolve the offline flag, falling back to the LLM_OFFLINE environment variable
+
+    :param offline: the explicit flag, or None to use the environment
+    :return: TRUE if the network must not be used; FALSE otherwise
+    """
+    if offline is not None:
+        return offline
+    return os.environ.get(OFFLINE_ENV_VAR, "").strip().lower() in {"1", "true", "yes"}
+
+def _resolve_headers(headers: dict | Callable[[], dict]) -> dict:
+    """
+    Return the request headers, calling the factory if one was given (so secrets are only loaded when needed)
+
+    :param headers: the headers, or a zero-argument function returning them
+    :return: the headers
+    """
+    return headers() if callable(headers) else headers
+
+def _entry_path(key: str) -> Path:
+    """
+    Return the path of the cache entry for the given key
+
+    :param key: the cache key
+    :return: the entry path
+    """
+    return CACHE_DIR / f"{key}.json"
+
+def _cache_get(key: str) -> dict | None:
+    """
+    Return the cached response for the key, or None on a miss. Hits are touched so eviction stays LRU.
+
+    :param key: the cache key
+    :return: the cached response body
+    """
+    path = _entry_path(key)
+    try:
+        entry = json.loads(path.read_text(encoding="utf-8"))
+        os.utime(path)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return entry.get("response")
+
+def _cache_put(key: str, request: dict, response: dict) -> None:
+    """
+    Write a response to the cache, then evict old entries if the cache is over its limits
+
+    :param key: the cache key
+    :param request: the request parameters the key was derived from (kept for inspection)
+    :param response: the response body
+    :return: None
+    """
+    entry = {"key": key, "created_at": _now_iso(), "request": request, "response": response}
+    atomic_write_text(_entry_path(key), json.dumps(entry))
+    _evict()
+
+def _evict() -> int:
+    """
+    Remove least recently used entries until the cache fits CACHE_MAX_ENTRIES and CACHE_MAX_BYTES
+
+    :return: the number of entries removed
+    """
+    with _cache_lock:
+        entries = []
+        for p in CACHE_DIR.glob("*.json"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        while entries and (len(entries) > CACHE_MAX_ENTRIES or total > CACHE_MAX_BYTES):
+            _, size, p = entries.pop(0)
+            p.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        return removed
+
+# ======================================================================================================================
+# API-STYLE FUNCTIONS
+# ======================================================================================================================
+
+def cache_key(model: str, messages: list[dict], temperature: float, seed: int | None = None) -> str:
+    """
+    Return the content address of a completion request
+
+    :param model: the model name
+    :param messages: the chat messages (the prompt)
+    :param temperature: the sampling temperature
+    :param seed: the sampling seed, if any
+    :return: the hex SHA-256 key
+    """
+    blob = json.dumps(
+        {"model": model, "messages": messages, "temperature": temperature, "seed": seed},
+        sort_keys=True, separators=(",", ":"),
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+def chat_completion(
+    messages: list[dict],
+    *,
+    model: str,
+    temperature: float,
+    headers: dict | Callable[[], dict],
+    seed: int | None = None,
+    use_cache: bool = True,
+    refresh: bool = False,
+    offline: bool | None = None,
+) -> dict:
+    """
+    Return the response body of an OpenRouter chat completion, served from the disk cache when possible
+
+    :param messages: the chat messages (the prompt)
+    :param model: the model to be used
+    :param temperature: the temperature to be used
+    :param headers: the request headers (including authorization), or a function returning them
+    :param seed: the sampling seed, if any; part of the cache key
+    :param use_cache: whether to read from and write to the cache
+    :param refresh: skip the cache read (but still store the new response)
+    :param offline: never use the network; defaults to the LLM_OFFLINE environment variable
+    :return: the response body as a dictionary
+    """
+    key = cache_key(model, messages, temperature, seed)
+    if use_cache and not refresh:
+        cached = _cache_get(key)
+        if cached is not None:
+            return cached
+    if _is_offline(offline):
+        raise RuntimeError(f"Offline mode and no cached response for key {key}")
+
+    payload = {"model": model, "messages": messages, "temperature": temperature}
+    if seed is not None:
+        payload["seed"] = seed
+
+    response = _get_session().post(OPENROUTER_URL, headers=_resolve_headers(headers), json=payload,
+                                   timeout=TIMEOUT_SECONDS)
+    if response.status_code != 200:
+        raise RuntimeError(f"HTTP {response.status_code} with details: {response.text}")
+    data = response.json()
+
+    # Store the raw body before anyone parses it, so a bad parse never costs another paid call
+    if use_cache:
+        _cache_put(key, {"model": model, "temperature": temperature, "seed": seed}, data)
+    return data
+
+def stream_chat_completion(
+    messages: list[dict],
+    *,
+    model: str,
+    temperature: float,
+    headers: dict | Callable[[], dict],
+    seed: int | None = None,
+    use_cache: bool = True,
+    refresh: bool = False,
+    offline: bool | None = None,
+) -> Iterator[str]:
+    """
+    Stream the content of an OpenRouter chat completion as it is generated (server-sent events). Shares the cache with
+    chat_completion: a cached completion is replayed in chunks, and a streamed completion is cached once it finishes
+    ([DONE] or a finish_reason; a stream that ends without either is not cached).
+
+    :param messages: the chat messages (the prompt)
+    :param model: the model to be used
+    :param temperature: the temperature to be used
+    :param headers: the request headers (including authorization), or a function returning them
+    :param seed: the sampling seed, if any; part of the cache key
+    :param use_cache: whether to read from and write to the cache
+    :param refresh: skip the cache read (but still store the new response)
+    :param offline: never use the network; defaults to the LLM_OFFLINE environment variable
+    :return: an iterator over content fragments
+    """
+    key = cache_key(model, messages, temperature, seed)
+    if use_cache and not refresh:
+        cached = _cache_get(key)
+        if cached is not None:
+            content = (cached.get("choices") or [{}])[0].get("message", {}).get("content") or ""
+            for i in range(0, len(content), REPLAY_CHUNK_CHARS):
+                yield content[i:i + REPLAY_CHUNK_CHARS]
+            return
+    if _is_offline(offline):
+        raise RuntimeError(f"Offline mode and no cached response for key {key}")
+
+    payload = {"model": model, "messages": messages, "temperature": temperature, "stream": True}
+    if seed is not None:
+        payload["seed"] = seed
+
+    parts: list[str] = []
+    finished = False
+    with _get_session().post(OPENROUTER_URL, headers=_resolve_headers(headers), json=payload,
+                             timeout=TIMEOUT_SECONDS, stream=True) as response:
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code} with details: {response.text}")
+        for line in response.iter_lines(decode_unicode=True):
+            # SSE comments (e.g. keep-alive pings) start with ':' and carry no data
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                finished = True
+                break
+            try:
+                event = json.loads(data)
+            except json.JSONDecodeError:
+                continue
+            choice = (event.get("choices") or [{}])[0]
+            delta = choice.get("delta", {}).get("content")
+            if delta:
+                parts.append(delta)
+                yield delta
+            if choice.get("finish_reason"):
+                finished = True
+
+    # Cache the assembled completion in the same shape chat_completion returns, but only if the stream completed: a
+    # dropped connection must not leave a truncated reply to be replayed
+    if use_cache and parts and finished:
+        body = {"choices": [{"message": {"role": "assistant", "content": "".join(parts)}}]}
+        _cache_put(key, {"model": model, "temperature": temperature, "seed": seed}, body)
+
+def invalidate(key: str) -> bool:
+    """
+    Remove one entry from the cache
+
+    :param key: the cache key
+    :return: TRUE if an entry was removed; FALSE otherwise
+    """
+    path = _entry_path(key)
+    if not path.exists():
+        return False
+    path.unlink(missing_ok=True)
+    return True
+
+def clear_cache() -> None:
+    """
+    Remove every cached response. For dev/testing purposes.
+
+    :return: None
+    """
+    for p in CACHE_DIR.glob("*.json"):
+        p.unlink(missing_ok=True)
+
+def cache_stats() -> dict:
+    """
+    Return the number of entries and total bytes held by the cache
+
+    :return: a dictionary with 'entries' and 'bytes'
+    """
+    sizes = [p.stat().st_size for p in CACHE_DIR.glob("*.json")] if CACHE_DIR.exists() else []
+    return {"entries": len(sizes), "bytes": sum(sizes)}
@@ -0,0 +1,416 @@
+from __future__ import annotations
+import bisect, contextlib, functools, math, os, threading, time
+from pathlib import Path
+from typing import Callable, Iterator
+
+from storage_service import atomic_write_text
+
+METRICS_PATH = Path(__file__).parent / "data" / "metrics.prom"
+
+# Latency histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+"""
+A small in-process metrics registry: counters, gauges and latency histograms with labels, exportable in the
+Prometheus text format.
+
+Services declare their metrics at import time (declaring the same name twice returns the same metric) and record
+with inc() / set() / observe(), or time a block with metric.time(...) or a function with @metric.timed(...).
+
+Recording is on unless the METRICS_ENABLED environment variable is '0' and can be toggled with set_enabled(). When it
+is off every recording call returns after a single flag check, and timed functions call straight through without
+reading the clock. Values live in this process only; write_prometheus() saves them to data/metrics.prom for
+scraping (e.g. by node_exporter's textfile collector), and the Admin page shows them.
+"""
+
+_enabled = os.environ.get("METRICS_ENABLED", "1") != "0"
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        """
+        Return the label values in declaration order
+
+        :param labels: label name -> value
+        :return: the label values
+        """
+        if len(labels) != len(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, got {tuple(labels)}")
+        try:
+            return tuple(str(labels[name]) for name in self.labels)
+        except KeyError as e:
+            raise ValueError(f"{self.name} has no value for label {e}")
+
+    def items(self) -> list[tuple[dict, object]]:
+        """
+        Return every labelled value
+
+        :return: (labels, value) pairs
+        """
+        with self._lock:
+            return [(dict(zip(self.labels, key)), self._copy(v)) for key, v in sorted(self._values.items())]
+
+    def _copy(self, value):
+        return value
+
+    def reset(self) -> None:
+        """
+        Drop every recorded value
+
+        :return: None
+        """
+        with self._lock:
+            self._values.clear()
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        """
+        Increase the counter
+
+        :param amount: the amount (must not be negative)
+        :param labels: the label values
+        :return: None
+        """
+        if not _enabled:
+            return
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        """
+        Set the gauge
+
+        :param value: the value
+        :param labels: the label values
+        :return: None
+        """
+        if not _enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        """
+        Add to the gauge (use a negative amount to subtract)
+
+        :param amount: the amount
+        :param labels: the label values
+        :return: None
+        """
+        if not _enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _copy(self, value):
+        counts, total = value
+        return list(counts), total
+
+    def observe(self, value: float, **labels) -> None:
+        """
+        Record one observation
+
+        :param value: the observed value (seconds, for latencies)
+        :param labels: the label values
+        :return: None
+        """
+        if not _enabled:
+            return
+        self._observe(self._key(labels), value)
+
+    def _observe(self, key: tuple, value: float) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """
+        Time a block of code
+
+        :param labels: the label values
+        :return: a context manager
+        """
+        if not _enabled:
+            yield
+            return
+        key = self._key(labels)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._observe(key, time.perf_counter() - start)
+
+    def timed(self, **labels) -> Callable:
+        """
+        Decorate a function so every call is timed
+
+        :param labels: the label values
+        :return: the decorator
+        """
+        key = self._key(labels)
+
+        def decorator(fn: Callable) -> Callable:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not _enabled:
+                    return fn(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self._observe(key, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def quantile(self, q: float, **labels) -> float | None:
+        """
+        Estimate a quantile by interpolating within its bucket
+
+        :param q: the quantile in [0, 1]
+        :param labels: the label values
+        :return: the estimate, or None without observations
+        """
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            counts = list(entry[0]) if entry else None
+        return _quantile(self.buckets, counts, q) if counts else None
+
+# ======================================================================================================================
+# HELPER FUNCTIONS (for internal use)
+# ======================================================================================================================
+
+_registry: dict[str, _Metric] = {}
+_registry_lock = threading.Lock()
+
+def _declare(cls: type, name: str, help: str, labels: tuple[str, ...], **kwargs) -> _Metric:
+    """
+    Return the metric with this name, creating it on first declaration
+
+    :param cls: the metric class
+    :param name: the metric name
+    :param help: the description
+    :param labels: the label names
+    :return: the metric
+    """
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, help, tuple(labels), **kwargs)
+        elif not isinstance(metric, cls) or metric.labels != tuple(labels):
+            raise ValueError(f"Metric {name} is already declared as a {metric.kind} with labels {metric.labels}")
+        return metric
+
+def _quantile(buckets: tuple[float, ...], counts: list[int], q: float) -> float | None:
+    """
+    Estimate a quantile from bucket counts
+
+    :param buckets: the bucket upper bounds
+    :param counts: the count per bucket (the last one is +Inf)
+    :param q: the quantile in [0, 1]
+    :return: the estimate
+    """
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for i, c in enumerate(counts):
+        if c and seen + c >= rank:
+            if i >= len(buckets):
+                return buckets[-1]
+            lo = buckets[i - 1] if i else 0.0
+            return lo + (buckets[i] - lo) * (rank - seen) / c
+        seen += c
+    return buckets[-1]
+
+def _labels_text(labels: dict, extra: dict | None = None) -> str:
+    """
+    Format labels for the Prometheus text format
+
+    :param labels: label name -> value
+    :param extra: extra labels appended after them (e.g. le)
+    :return: '{a="1",b="2"}' or ''
+    """
+    items = {**labels, **(extra or {})}
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items.items()) + "}"
+
+def _escape(value) -> str:
+    """
+    Escape a label value (backslashes, double quotes and newlines)
+
+    :param value: the label value
+    :return: the escaped value
+    """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _number(value: float) -> str:
+    """
+    Format a sample value
+
+    :param value: the value
+    :return: the text
+    """
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+# ======================================================================================================================
+# API-STYLE FUNCTIONS
+# ======================================================================================================================
+
+def counter(name: str, help: str, labels: tuple[str, ...] = ()) -> Counter:
+    """
+    Declare a counter
+
+    :param name: the metric name
+    :param help: the description
+    :param labels: the label names
+    :return: the counter
+    """
+    return _declare(Counter, name, help, labels)
+
+def gauge(name: str, help: str, labels: tuple[str, ...] = ()) -> Gauge:
+    """
+    Declare a gauge
+
+    :param name: the metric name
+    :param help: the description
+    :param labels: the label names
+    :return: the gauge
+    """
+    return _declare(Gauge, name, help, labels)
+
+def histogram(name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    """
+    Declare a histogram
+
+    :param name: the metric name
+    :param help: the description
+    :param labels: the label names
+    :param buckets: the bucket upper bounds
+    :return: the histogram
+    """
+    return _declare(Histogram, name, help, labels, buckets=buckets)
+
+def is_enabled() -> bool:
+    """
+    Return whether metrics are being recorded
+
+    :return: TRUE if enabled; FALSE otherwise
+    """
+    return _enabled
+
+def set_enabled(enabled: bool) -> None:
+    """
+    Turn recording on or off for this process
+
+    :param enabled: whether to record
+    :return: None
+    """
+    global _enabled
+    _enabled = bool(enabled)
+
+def snapshot() -> list[dict]:
+    """
+    Return every recorded value, for display
+
+    :return: dictionaries with name, kind, help, labels and either value (counters and gauges) or count, sum, p50,
+             p95 and p99 (histograms)
+    """
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda m: m.name)
+    rows = []
+    for metric in metrics:
+        for labels, value in metric.items():
+            row = {"name": metric.name, "kind": metric.kind, "help": metric.help, "labels": labels}
+            if isinstance(metric, Histogram):
+                counts, total = value
+                row.update(
+                    count=sum(counts), sum=total,
+                    p50=_quantile(metric.buckets, counts, 0.5),
+                    p95=_quantile(metric.buckets, counts, 0.95),
+                    p99=_quantile(metric.buckets, counts, 0.99),
+                )
+            else:
+                row["value"] = value
+            rows.append(row)
+    return rows
+
+def render_prometheus() -> str:
+    """
+    Render every metric in the Prometheus text exposition format
+
+    :return: the text
+    """
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda m: m.name)
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for labels, value in metric.items():
+            if isinstance(metric, Histogram):
+                counts, total = value
+                cumulative = 0
+                for bound, c in zip((*metric.buckets, math.inf), counts):
+                    cumulative += c
+                    lines.append(f"{metric.name}_bucket{_labels_text(labels, {'le': _number(bound)})} {cumulative}")
+                lines.append(f"{metric.name}_sum{_labels_text(labels)} {_number(total)}")
+                lines.append(f"{metric.name}_count{_labels_text(labels)} {cumulative}")
+            else:
+                lines.append(f"{metric.name}{_labels_text(labels)} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+def write_prometheus(path: Path | None = None) -> Path:
+    """
+    Save the metrics in the Prometheus text format
+
+    :param path: the file (defaults to data/metrics.prom)
+    :return: the path written
+    """
+    path = path or METRICS_PATH
+    atomic_write_text(path, render_prometheus())
+    return path
+
+def reset_metrics() -> None:
+    """
+    Clear every recorded value (declarations are kept). For dev/testing purposes.
+
+    :return: None
+    """
+    with _registry_lock:
+        metrics = list(_registry.values())
+    for metric in metrics:
+        metric.reset()
@@ -0,0 +1,366 @@
+from __future__ import annotations
+import hashlib, multiprocessing, os, shutil, threading, time, uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from resources_service import CatalogResources
+
+if TYPE_CHECKING:
+    import numpy as np
+
+SHARDS_DIR = Path(__file__).parent / "data" / "score_shards"
+
+# Rows scored per task; each worker gets whole shards
+DEFAULT_SHARD_SIZE = 100_000
+# Worker processes (0 or 1 scores the shards in-process); overridable with the SCORING_WORKERS environment variable
+DEFAULT_WORKERS = int(os.environ.get("SCORING_WORKERS", os.cpu_count() or 1))
+# Catalogs smaller than this are scored with score_properties: writing the arrays would outweigh the gain
+PARALLEL_MIN_ROWS = 200_000
+# Arrays of older catalogs, and temporary directories left by crashed writers, are removed once they are this old; a
+# process may still be scoring an older catalog or writing its arrays until then
+SHARD_CLEANUP_GRACE_SECONDS = 600.0
+
+_ARRAYS = ("price", "capacity", "lat", "lon", "token_rows", "token_ids", "tag_rows", "tag_ids")
+
+"""
+Multi-core scoring for very large catalogs.
+
+The catalog is converted once per catalog fingerprint into flat NumPy arrays saved as .npy files under
+data/score_shards/<hash of the arrays>/: prices, capacities and coordinates per listing, plus each listing's normalized
+tokens (for affinity) and raw tags (for the environment check) as (row, vocabulary id) pairs. Worker processes are
+spawned (not forked) and open these files with mmap_mode='r' once and keep them, so a request only sends each worker
+its shard bounds and the user's parameters; the catalog is never pickled.
+
+Each worker scores its shard with the same formula as recommender_service.score_properties, fully vectorized (the
+affinity average is a bincount over the token pairs instead of a Python loop), and returns its local top k via
+np.argpartition. The parent merges the shards' candidates into the global top k. Ties are broken by catalog order.
+"""
+
+class ShardedScorer:
+    def __init__(self, resources: CatalogResources, workers: int = DEFAULT_WORKERS, shard_size: int = DEFAULT_SHARD_SIZE):
+        self.resources = resources
+        self.workers = max(int(workers), 1)
+        self.shard_size = max(int(shard_size), 1)
+        self.path = _write_arrays(resources)
+        meta = _vocabularies(self.path)
+        self.token_vocab: dict[str, int] = meta["tokens"]
+        self.tag_vocab: dict[str, int] = meta["tags"]
+        self._pool: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.resources)
+
+    def shards(self) -> list[tuple[int, int]]:
+        """
+        Return the row ranges of the shards
+
+        :return: (start, end) pairs
+        """
+        n = len(self.resources)
+        return [(lo, min(lo + self.shard_size, n)) for lo in range(0, n, self.shard_size)]
+
+    def top_k(
+        self,
+        prefs,
+        k: int,
+        affinity: dict[str, float] | None = None,
+        popularity: dict[str, float] | None = None,
+        mask: np.ndarray | None = None,
+        min_capacity: float = 0,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Return the k best listings for a user
+
+        :param prefs: normalized recommender_service.UserPrefs
+        :param k: the number of listings
+        :param affinity: token -> affinity (see recommender_service.build_user_affinity)
+        :param popularity: property id -> popularity in [0, 1]
+        :param mask: optional boolean array over the catalog; False rows are never returned
+        :param min_capacity: only return listings with at least this capacity
+        :return: (catalog rows, match scores), best first
+        """
+        import numpy as np
+
+        params = self._params(prefs, affinity, popularity)
+        params["min_capacity"] = float(min_capacity)
+        tasks = []
+        for lo, hi in self.shards():
+            shard_mask = None if mask is None else np.asarray(mask[lo:hi], dtype=bool)
+            tasks.append((str(self.path), lo, hi, k, params, shard_mask))
+
+        if self.workers > 1 and len(tasks) > 1:
+            results = list(self._executor().map(_score_shard, tasks))
+        else:
+            results = [_score_shard(task) for task in tasks]
+
+        rows = np.concatenate([r for r, _ in results]) if results else np.empty(0, dtype=np.int64)
+        scores = np.concatenate([s for _, s in results]) if results else np.empty(0)
+        order = np.lexsort((rows, -scores))[:k]
+        return rows[order], scores[order]
+
+    def close(self) -> None:
+        """
+        Shut the worker pool down
+
+        :return: None
+        """
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        """
+        Return the worker pool, starting it on first use
+
+        :return: the pool
+        """
+        with self._lock:
+            if self._pool is None:
+                # Spawned rather than forked: the app process runs background threads (snapshots, purges, the picks
+                # scheduler) whose locks a forked child could inherit held
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def _params(self, prefs, affinity: dict[str, float] | None, popularity: dict[str, float] | None) -> dict:
+        """
+        Translate the user's parameters into the small arrays sent to the workers
+
+        :return: the parameters
+        """
+        import numpy as np
+
+        aff_ids, aff_values = [], []
+        for token, value in (affinity or {}).items():
+            tid = self.token_vocab.get(token)
+            if tid is not None:
+                aff_ids.append(tid)
+                aff_values.append(value)
+        pop_rows, pop_values = [], []
+        if popularity and prefs.weight_popularity > 0:
+            for pid, value in popularity.items():
+                row = self.resources.index.get(pid)
+                if row is not None:
+                    pop_rows.append(row)
+                    pop_values.append(value)
+        return {
+            "budget": float(prefs.budget or 0),
+            "env_id": self.tag_vocab.get(prefs.preferred_environment, -1) if prefs.preferred_environment else None,
+            "weights": (
+                prefs.weight_afford, prefs.weight_env, prefs.weight_prefs, prefs.weight_proximity,
+                prefs.weight_popularity,
+            ),
+            "anchor": prefs.anchor if prefs.weight_proximity > 0 else None,
+            "proximity_scale_km": prefs.proximity_scale_km,
+            "n_tokens": len(self.token_vocab),
+            "affinity": (np.array(aff_ids, dtype=np.int64), np.array(aff_values, dtype=float)),
+            "popularity": (np.array(pop_rows, dtype=np.int64), np.array(pop_values, dtype=float)),
+        }
+
+# ======================================================================================================================
+# HELPER FUNCTIONS (for internal use)
+# ======================================================================================================================
+
+_scorer: ShardedScorer | None = None
+_scorer_lock = threading.Lock()
+# Arrays opened by this (worker) process, per shard directory
+_opened: dict[str, dict[str, np.ndarray]] = {}
+
+def _write_arrays(resources: CatalogResources) -> Path:
+    """
+    Save the catalog's scoring arrays (once per distinct content) and remove the arrays of older catalogs that are past
+    SHARD_CLEANUP_GRACE_SECONDS. The directory is named after a hash of the arrays themselves rather than the catalog
+    fingerprint, so two processes that loaded different catalogs under the same fingerprint never share one.
+
+    :param resources: the catalog resources
+    :return: the directory holding the arrays
+    """
+    import json
+    import numpy as np
+
+    props = resources.props
+    n = len(props)
+
+    def _numbers(field: str, default: float) -> np.ndarray:
+        return np.fromiter(
+            (v if isinstance(v := p.get(field), (int, float)) else default for p in props), dtype=float, count=n
+        )
+
+    token_vocab: dict[str, int] = {}
+    tag_vocab: dict[str, int] = {}
+    token_rows, token_ids, tag_rows, tag_ids = [], [], [], []
+    for row, (prop, tokens) in enumerate(zip(props, resources.tokens)):
+        for token in tokens:
+            token_rows.append(row)
+            token_ids.append(token_vocab.setdefault(token, len(token_vocab)))
+        for tag in set(prop.get("tags") or []):
+            tag_rows.append(row)
+            tag_ids.append(tag_vocab.setdefault(str(tag), len(tag_vocab)))
+
+    arrays = {
+        "price": _numbers("nightly_price", np.nan),
+        "capacity": _numbers("capacity", 0.0),
+        "lat": _numbers("lat", np.nan),
+        "lon": _numbers("lon", np.nan),
+        "token_rows": np.array(token_rows, dtype=np.int64),
+        "token_ids": np.array(token_ids, dtype=np.int64),
+        "tag_rows": np.array(tag_rows, dtype=np.int64),
+        "tag_ids": np.array(tag_ids, dtype=np.int64),
+    }
+    meta = json.dumps({"rows": n, "tokens": token_vocab, "tags": tag_vocab})
+    digest = hashlib.sha256(meta.encode("utf-8"))
+    for key in _ARRAYS:
+        digest.update(arrays[key].tobytes())
+    path = SHARDS_DIR / digest.hexdigest()[:16]
+
+    if not (path / "meta.json").exists():
+        # One temporary directory per writer, so processes writing the same arrays never share one
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp")
+        tmp.mkdir(parents=True)
+        for key, array in arrays.items():
+            np.save(tmp / f"{key}.npy", array)
+        (tmp / "meta.json").write_text(meta, encoding="utf-8")
+        try:
+            os.replace(tmp, path)
+        except OSError:  # another process wrote the same arrays first
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    cutoff = time.time() - SHARD_CLEANUP_GRACE_SECONDS
+    for old in SHARDS_DIR.iterdir():
+        try:
+            stale = old.name != path.name and old.stat().st_mtime < cutoff
+        except FileNotFoundError:  # removed by another process
+            continue
+        if stale:
+            shutil.rmtree(old, ignore_errors=True)
+    return path
+
+def _vocabularies(path: Path) -> dict:
+    """
+    Read the vocabularies saved with the arrays
+
+    :param path: the arrays' directory
+    :return: a dictionary with 'rows', 'tokens' and 'tags'
+    """
+    import json
+    return json.loads((path / "meta.json").read_text(encoding="utf-8"))
+
+def _open(path: str) -> dict[str, np.ndarray]:
+    """
+    Memory-map the arrays of a directory, once per process
+
+    :param path: the arrays' directory
+    :return: name -> array
+    """
+    import numpy as np
+
+    arrays = _opened.get(path)
+    if arrays is None:
+        _opened.clear()  # arrays of an older catalog
+        arrays = _opened[path] = {key: np.load(Path(path) / f"{key}.npy", mmap_mode="r") for key in _ARRAYS}
+        # Token and tag pairs are grouped by row, so each shard's pairs are one slice
+        arrays["token_bounds"] = np.searchsorted(arrays["token_rows"], np.arange(len(arrays["price"]) + 1))
+        arrays["tag_bounds"] = np.searchsorted(arrays["tag_rows"], np.arange(len(arrays["price"]) + 1))
+    return arrays
+
+def _score_shard(task: tuple) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Score one shard and return its local top k (runs in a worker process)
+
+    :param task: (arrays directory, first row, end row, k, parameters, optional boolean mask for the shard)
+    :return: (catalog rows, match scores)
+    """
+    import numpy as np
+
+    path, lo, hi, k, params, mask = task
+    a = _open(path)
+    n = hi - lo
+    w_afford, w_env, w_prefs, w_proximity, w_popularity = params["weights"]
+
+    budget = params["budget"]
+    price = np.asarray(a["price"][lo:hi])
+    score = w_afford * np.clip((budget - price) / max(budget, 0.001), 0.0, 1.0)
+
+    t0, t1 = a["tag_bounds"][lo], a["tag_bounds"][hi]
+    if params["env_id"] is not None and w_env:
+        tag_rows, tag_ids = np.asarray(a["tag_rows"][t0:t1]) - lo, np.asarray(a["tag_ids"][t0:t1])
+        env = np.bincount(tag_rows[tag_ids == params["env_id"]], minlength=n) > 0
+        score = score + w_env * env
+
+    aff_ids, aff_values = params["affinity"]
+    if len(aff_ids) and w_prefs:
+        s0, s1 = a["token_bounds"][lo], a["token_bounds"][hi]
+        rows, ids = np.asarray(a["token_rows"][s0:s1]) - lo, np.asarray(a["token_ids"][s0:s1])
+        value = np.zeros(params["n_tokens"])
+        known = np.zeros(params["n_tokens"], dtype=bool)
+        value[aff_ids], known[aff_ids] = aff_values, True
+        hit = known[ids]
+        total = np.bincount(rows[hit], weights=value[ids[hit]], minlength=n)
+        count = np.bincount(rows[hit], minlength=n)
+        score = score + w_prefs * np.divide(total, count, out=np.zeros(n), where=count > 0)
+
+    if params["anchor"] is not None and w_proximity:
+        from geo_service import haversine_km
+        dist = haversine_km(params["anchor"][0], params["anchor"][1], a["lat"][lo:hi], a["lon"][lo:hi])
+        score = score + w_proximity * np.nan_to_num(np.exp(-dist / max(params["proximity_scale_km"], 0.001)), nan=0.0)
+
+    pop_rows, pop_values = params["popularity"]
+    if len(pop_rows) and w_popularity:
+        inside = (pop_rows >= lo) & (pop_rows < hi)
+        popular = np.zeros(n)
+        popular[pop_rows[inside] - lo] = pop_values[inside]
+        score = score + w_popularity * popular
+
+    # Unknown prices sort last, as they do in score_properties
+    score = np.where(np.isnan(score), -np.inf, score)
+    keep = np.ones(n, dtype=bool) if mask is None else mask
+    if params.get("min_capacity"):
+        keep = keep & (np.asarray(a["capacity"][lo:hi]) >= params["min_capacity"])
+    candidates = np.flatnonzero(keep)
+    kk = min(k, len(candidates))
+    if kk == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    if kk < len(candidates):
+        candidates = candidates[np.argpartition(-score[candidates], kk - 1)[:kk]]
+    return candidates + lo, score[candidates]
+
+# ======================================================================================================================
+# API-STYLE FUNCTIONS
+# ======================================================================================================================
+
+def get_sharded_scorer(
+    resources: CatalogResources, workers: int = DEFAULT_WORKERS, shard_size: int = DEFAULT_SHARD_SIZE
+) -> ShardedScorer:
+    """
+    Return the process-wide scorer for a catalog, rebuilding it (and its arrays) when the catalog or settings change
+
+    :param resources: the catalog resources
+    :param workers: the number of worker processes
+    :param shard_size: the rows per shard
+    :return: the scorer
+    """
+    global _scorer
+    with _scorer_lock:
+        current = _scorer
+        if (
+            current is None or current.resources is not resources
+            or current.workers != max(int(workers), 1) or current.shard_size != max(int(shard_size), 1)
+        ):
+            if current is not None:
+                current.close()
+            _scorer = ShardedScorer(resources, workers=workers, shard_size=shard_size)
+        return _scorer
+
+def shutdown_scorer() -> None:
+    """
+    Stop the worker pool and drop the scorer. For dev/testing purposes.
+
+    :return: None
+    """
+    global _scorer
+    with _scorer_lock:
+        if _scorer is not None:
+            _scorer.close()
+            _scorer = None
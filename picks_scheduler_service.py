@@ -0,0 +1,343 @@
+from __future__ import annotations
+import itertools, threading, time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable
+
+from interactions_service import subscribe_interactions, unsubscribe_interactions
+from properties_service import catalog_fingerprint
+from users_service import User, get_user_by_id, subscribe_user_updates, unsubscribe_user_updates
+
+# Wait this long after the last change before recomputing, so bursts of events cost one recompute
+DEBOUNCE_SECONDS = 2.0
+# ...but never postpone a recompute by more than this after the first event of a burst
+MAX_DELAY_SECONDS = 10.0
+# How often the worker checks whether the catalog changed
+SWEEP_INTERVAL_SECONDS = 30.0
+# Results kept per scheduler; the least recently read or computed ones are dropped beyond this
+MAX_RESULTS = 10_000
+
+"""
+Precomputes Top Picks in the background so the page never waits on the recommender.
+
+A PicksScheduler runs one daemon worker thread. It listens for profile updates (users_service.update_user) and
+interactions (log_view / log_save) made in this process and schedules a recompute of that user's picks. Scheduling is
+debounced: each new event pushes the recompute back by DEBOUNCE_SECONDS, up to MAX_DELAY_SECONDS after the first
+event of the burst. Every SWEEP_INTERVAL_SECONDS the worker also checks the catalog fingerprint and, if the catalog
+changed, reschedules every user it holds picks for.
+
+Pages read the latest result with latest() (instant, possibly slightly stale) and is_pending() tells them a fresher
+result is on its way. get_scheduler() returns the process-wide scheduler, started on first use. Every computation
+takes a sequence number when it starts, and a result never replaces one from a computation that started later (e.g.
+compute_now racing the worker). At most MAX_RESULTS results are kept, least recently used first out.
+"""
+
+@dataclass
+class PicksResult:
+    user_id: str
+    picks: list[dict]
+    computed_at: float
+    catalog_fingerprint: tuple
+    # Order in which the computation started (see PicksScheduler._store)
+    sequence: int = 0
+
+class PicksScheduler:
+    def __init__(
+        self,
+        compute: Callable[[User], list[dict]] | None = None,
+        debounce_seconds: float = DEBOUNCE_SECONDS,
+        max_delay_seconds: float = MAX_DELAY_SECONDS,
+        sweep_interval_seconds: float = SWEEP_INTERVAL_SECONDS,
+        max_results: int = MAX_RESULTS,
+    ):
+        self._compute = compute or _default_compute
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.sweep_interval_seconds = sweep_interval_seconds
+        self.max_results = max_results
+
+        self._results: OrderedDict[str, PicksResult] = OrderedDict()
+        self._sequence = itertools.count(1)
+        # user id -> (due time, time of the first event of the burst)
+        self._pending: dict[str, tuple[float, float]] = {}
+        self._computing: set[str] = set()
+        self._errors: dict[str, str] = {}
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._stopping = False
+        self._last_sweep = 0.0
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def start(self) -> None:
+        """
+        Start the worker thread and subscribe to user and interaction changes
+
+        :return: None
+        """
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._last_sweep = time.monotonic()
+            self._thread = threading.Thread(target=self._run, name="picks-scheduler", daemon=True)
+            self._thread.start()
+        subscribe_user_updates(self._on_user_update)
+        subscribe_interactions(self._on_interaction)
+
+    def stop(self, timeout: float | None = None) -> None:
+        """
+        Unsubscribe and stop the worker thread (pending recomputes are dropped)
+
+        :param timeout: how long to wait for the worker to finish its current recompute
+        :return: None
+        """
+        unsubscribe_user_updates(self._on_user_update)
+        unsubscribe_interactions(self._on_interaction)
+        with self._cond:
+            thread, self._thread = self._thread, None
+            self._stopping = True
+            self._pending.clear()
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join(timeout)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Scheduling
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def schedule(self, user_id: str, delay: float | None = None) -> None:
+        """
+        Schedule a recompute of a user's picks, coalescing with any recompute already pending
+
+        :param user_id: the user's id
+        :param delay: seconds to wait for further events (defaults to debounce_seconds)
+        :return: None
+        """
+        now = time.monotonic()
+        delay = self.debounce_seconds if delay is None else delay
+        with self._cond:
+            _, first = self._pending.get(user_id, (None, now))
+            self._pending[user_id] = (min(now + delay, first + self.max_delay_seconds), first)
+            self._cond.notify_all()
+
+    def latest(self, user_id: str) -> PicksResult | None:
+        """
+        Return the most recent picks computed for a user
+
+        :param user_id: the user's id
+        :return: the result, or None if nothing was computed yet
+        """
+        with self._cond:
+            result = self._results.get(user_id)
+            if result is not None:
+                self._results.move_to_end(user_id)
+            return result
+
+    def is_pending(self, user_id: str) -> bool:
+        """
+        Return whether a recompute is scheduled or running for a user
+
+        :param user_id: the user's id
+        :return: TRUE if a fresher result is on its way; FALSE otherwise
+        """
+        with self._cond:
+            return user_id in self._pending or user_id in self._computing
+
+    def last_error(self, user_id: str) -> str | None:
+        """
+        Return the error of the user's last failed recompute, if the last attempt failed
+
+        :param user_id: the user's id
+        :return: the error message, or None
+        """
+        with self._cond:
+            return self._errors.get(user_id)
+
+    def compute_now(self, user: User) -> PicksResult:
+        """
+        Compute a user's picks in the calling thread and store them (used when nothing was precomputed yet)
+
+        :param user: the user
+        :return: the result
+        """
+        with self._cond:
+            self._pending.pop(user.id, None)
+            self._computing.add(user.id)
+            sequence = next(self._sequence)
+        try:
+            fingerprint = catalog_fingerprint()
+            return self._store(user.id, self._compute(user), fingerprint, sequence)
+        finally:
+            with self._cond:
+                self._computing.discard(user.id)
+                self._cond.notify_all()
+
+    def wait_idle(self, timeout: float = 10.0) -> bool:
+        """
+        Wait until nothing is pending or running. For dev/testing purposes.
+
+        :param timeout: the maximum number of seconds to wait
+        :return: TRUE if the scheduler became idle; FALSE on timeout
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._computing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Worker
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _on_user_update(self, user: User) -> None:
+        self.schedule(user.id)
+
+    def _on_interaction(self, rec: dict) -> None:
+        if rec.get("user_id"):
+            self.schedule(rec["user_id"])
+
+    def _store(self, user_id: str, picks: list[dict], fingerprint: tuple | None = None,
+               sequence: int | None = None) -> PicksResult:
+        """
+        Record a freshly computed result, unless a computation that started later already stored one
+
+        :param user_id: the user's id
+        :param picks: the picks
+        :param fingerprint: the catalog fingerprint the picks were computed from
+        :param sequence: the sequence number taken when the computation started (defaults to a new one)
+        :return: the stored result (the newer one, if this result was discarded)
+        """
+        fingerprint = fingerprint or catalog_fingerprint()
+        with self._cond:
+            if sequence is None:
+                sequence = next(self._sequence)
+            current = self._results.get(user_id)
+            if current is not None and current.sequence > sequence:
+                return current
+            result = PicksResult(user_id, picks, time.time(), fingerprint, sequence)
+            self._results[user_id] = result
+            self._results.move_to_end(user_id)
+            while len(self._results) > self.max_results:
+                evicted, _ = self._results.popitem(last=False)
+                self._errors.pop(evicted, None)
+            self._errors.pop(user_id, None)
+        return result
+
+    def _sweep(self) -> None:
+        """
+        Reschedule every user whose picks were computed from an older catalog
+
+        :return: None
+        """
+        fingerprint = catalog_fingerprint()
+        with self._cond:
+            stale = [uid for uid, r in self._results.items() if r.catalog_fingerprint != fingerprint]
+        for user_id in stale:
+            self.schedule(user_id, delay=0.0)
+
+    def _next_task(self) -> tuple[str | None, bool, float]:
+        """
+        Decide what the worker does next (call with the condition held)
+
+        :return: (user id to recompute or None, whether to sweep now, seconds to wait if there is nothing to do)
+        """
+        now = time.monotonic()
+        sweep_in = self._last_sweep + self.sweep_interval_seconds - now
+        if sweep_in <= 0:
+            return None, True, 0.0
+        if self._pending:
+            user_id, (due, _) = min(self._pending.items(), key=lambda kv: kv[1][0])
+            if due <= now:
+                return user_id, False, 0.0
+            return None, False, min(due - now, sweep_in)
+        return None, False, sweep_in
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if self._stopping:
+                    return
+                user_id, sweep, wait = self._next_task()
+                if sweep:
+                    self._last_sweep = time.monotonic()
+                elif user_id is None:
+                    self._cond.wait(wait)
+                    continue
+                else:
+                    self._pending.pop(user_id)
+                    self._computing.add(user_id)
+                    sequence = next(self._sequence)
+
+            if sweep:
+                try:
+                    self._sweep()
+                except Exception:
+                    pass
+                continue
+
+            try:
+                user = get_user_by_id(user_id)
+                if user is not None:
+                    fingerprint = catalog_fingerprint()
+                    self._store(user_id, self._compute(user), fingerprint, sequence)
+            except Exception as e:
+                with self._cond:
+                    self._errors[user_id] = str(e)
+                    while len(self._errors) > self.max_results:
+                        self._errors.pop(next(iter(self._errors)))
+            finally:
+                with self._cond:
+                    self._computing.discard(user_id)
+                    self._cond.notify_all()
+
+# ======================================================================================================================
+# HELPER FUNCTIONS (for internal use)
+# ======================================================================================================================
+
+_scheduler: PicksScheduler | None = None
+_scheduler_lock = threading.Lock()
+
+def _default_compute(user: User) -> list[dict]:
+    """
+    Compute a user's picks with the recommender
+
+    :param user: the user
+    :return: the top picks
+    """
+    from recommender_service import produce_top_matches
+    return produce_top_matches(user)
+
+# ======================================================================================================================
+# API-STYLE FUNCTIONS
+# ======================================================================================================================
+
+def get_scheduler() -> PicksScheduler:
+    """
+    Return the process-wide scheduler, starting it on first use
+
+    :return: the scheduler
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = PicksScheduler()
+            _scheduler.start()
+        return _scheduler
+
+def stop_scheduler() -> None:
+    """
+    Stop and drop the process-wide scheduler. For dev/testing purposes.
+
+    :return: None
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is not None:
+            _scheduler.stop()
+            _scheduler = None
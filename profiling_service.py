@@ -0,0 +1,268 @@
+from __future__ import annotations
+import functools, itertools, os, random, threading, time
+from pathlib import Path
+from typing import Callable
+
+from metrics_service import counter
+from storage_service import atomic_write_text
+
+PROFILES_DIR = Path(__file__).parent / "data" / "profiles"
+
+# Fraction of calls to a profiled entry point that are captured while profiling is on
+DEFAULT_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", "0.1"))
+# Number of captures kept on disk; older ones are deleted
+MAX_CAPTURES = int(os.environ.get("PROFILING_MAX_CAPTURES", "50"))
+# Frames kept per allocation traceback, and allocation sites written per capture
+TRACE_FRAMES = 25
+TOP_ALLOCATIONS = 50
+
+"""
+On-demand profiling of the service entry points (produce_top_matches, login, log_interaction, ensure_properties and
+get_map_pyramid, each decorated with @profiled).
+
+Profiling is off unless the PROFILING_ENABLED environment variable is '1' or the Admin page turns it on; while off,
+a profiled call costs a single flag check. While on, a random sample of calls (PROFILING_SAMPLE_RATE, 10% by default)
+runs under cProfile and tracemalloc and leaves a capture in data/profiles:
+  - <capture>.cpu.folded: collapsed stacks weighted by microseconds of CPU time, for flamegraph.pl or speedscope
+  - <capture>.mem.folded: collapsed allocation stacks weighted by bytes still allocated when the call returned
+  - <capture>.prof: the raw cProfile stats, for pstats or snakeviz
+Only the newest PROFILING_MAX_CAPTURES captures are kept.
+
+cProfile only records the thread that made the call. tracemalloc is process-wide, so allocations made by other
+threads during a capture are included, and nested profiled calls are part of their caller's capture.
+"""
+
+_CAPTURES = counter("profiles_captured_total", "Profiled calls captured by entry point", ("entry",))
+
+_enabled = os.environ.get("PROFILING_ENABLED", "0") == "1"
+_sample_rate = DEFAULT_SAMPLE_RATE
+_active = threading.local()
+_tracing = 0
+# Whether tracemalloc was started by _start_tracing (rather than by -X tracemalloc or another tool) and is ours to stop
+_owns_tracing = False
+_tracing_lock = threading.Lock()
+_files_lock = threading.Lock()
+_sequence = itertools.count()
+
+# ======================================================================================================================
+# HELPER FUNCTIONS (for internal use)
+# ======================================================================================================================
+
+def _start_tracing() -> object:
+    """
+    Start tracemalloc if no other capture has, and take the starting snapshot
+
+    :return: the snapshot
+    """
+    import tracemalloc
+
+    global _tracing, _owns_tracing
+    with _tracing_lock:
+        if _tracing == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACE_FRAMES)
+            _owns_tracing = True
+        _tracing += 1
+    return tracemalloc.take_snapshot()
+
+def _stop_tracing(start: object) -> list:
+    """
+    Compare with the starting snapshot, then stop tracemalloc once the last capture is done, unless it was already
+    tracing before the first one started
+
+    :param start: the snapshot returned by _start_tracing
+    :return: tracemalloc StatisticDiffs by traceback, largest growth first
+    """
+    import tracemalloc
+
+    global _tracing, _owns_tracing
+    try:
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        end = tracemalloc.take_snapshot().filter_traces(ignore)
+        return end.compare_to(start.filter_traces(ignore), "traceback")
+    finally:
+        with _tracing_lock:
+            _tracing -= 1
+            if _tracing == 0 and _owns_tracing:
+                tracemalloc.stop()
+                _owns_tracing = False
+
+def _frame_label(func: tuple) -> str:
+    """
+    Name a cProfile function entry for a collapsed stack
+
+    :param func: (filename, line, function name)
+    :return: 'module.py:function:line', or the built-in's name
+    """
+    filename, line, name = func
+    if filename == "~":
+        label = name.strip("<>")
+    else:
+        label = f"{os.path.basename(filename)}:{name}:{line}"
+    return label.replace(";", ",").replace(" ", "_")
+
+def _collapse_cpu(stats: dict) -> list[str]:
+    """
+    Turn cProfile stats into collapsed stacks. cProfile only records caller -> callee edges, so each function's time
+    is split between the paths that reach it in proportion to the time each caller spent in it.
+
+    :param stats: pstats.Stats.stats (function -> (calls, primitive calls, own time, cumulative time, callers))
+    :return: 'frame;frame;frame microseconds' lines
+    """
+    callees: dict[tuple, list[tuple[tuple, float]]] = {}
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+
+    weights: dict[str, float] = {}
+
+    def walk(func: tuple, path: list[str], seen: set, share: float) -> None:
+        _, _, own, cumulative, _ = stats[func]
+        ratio = share / cumulative if cumulative else 0.0
+        stack = path + [_frame_label(func)]
+        key = ";".join(stack)
+        weights[key] = weights.get(key, 0.0) + own * ratio
+        for child, edge in callees.get(func, ()):
+            if child not in seen and edge * ratio >= 1e-6:
+                walk(child, stack, seen | {child}, edge * ratio)
+
+    for func, (_, _, _, cumulative, callers) in stats.items():
+        if not callers:
+            walk(func, [], {func}, cumulative)
+    return [f"{stack} {round(w * 1e6)}" for stack, w in sorted(weights.items()) if w * 1e6 >= 1]
+
+def _collapse_memory(diffs: list) -> list[str]:
+    """
+    Turn tracemalloc differences into collapsed allocation stacks
+
+    :param diffs: StatisticDiffs by traceback
+    :return: 'frame;frame;frame bytes' lines for the TOP_ALLOCATIONS sites that grew the most
+    """
+    lines = []
+    for diff in [d for d in diffs if d.size_diff > 0][:TOP_ALLOCATIONS]:
+        frames = [f"{os.path.basename(f.filename)}:{f.lineno}".replace(";", ",").replace(" ", "_") for f in diff.traceback]
+        lines.append(f"{';'.join(frames)} {diff.size_diff}")
+    return lines
+
+def _enforce_retention() -> None:
+    """
+    Delete the oldest captures beyond MAX_CAPTURES
+
+    :return: None
+    """
+    stems = sorted({p.name.split(".", 1)[0] for p in PROFILES_DIR.glob("*.*")})
+    for stem in stems[:max(len(stems) - MAX_CAPTURES, 0)]:
+        for path in PROFILES_DIR.glob(f"{stem}.*"):
+            path.unlink(missing_ok=True)
+
+def _capture(entry: str, fn: Callable, args: tuple, kwargs: dict):
+    """
+    Run one call under cProfile and tracemalloc and write its capture
+
+    :param entry: the entry point name
+    :param fn: the function
+    :param args: its positional arguments
+    :param kwargs: its keyword arguments
+    :return: the function's return value
+    """
+    import cProfile, pstats
+
+    profiler = cProfile.Profile()
+    snapshot = _start_tracing()
+    _active.depth = 1
+    try:
+        profiler.enable()
+    except ValueError:  # another profiler owns this thread
+        _active.depth = 0
+        _stop_tracing(snapshot)
+        return fn(*args, **kwargs)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        profiler.disable()
+        _active.depth = 0
+        diffs = _stop_tracing(snapshot)
+        stem = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_sequence):06d}-{entry}"
+        with _files_lock:
+            PROFILES_DIR.mkdir(parents=True, exist_ok=True)
+            atomic_write_text(PROFILES_DIR / f"{stem}.cpu.folded", "\n".join(_collapse_cpu(pstats.Stats(profiler).stats)) + "\n")
+            atomic_write_text(PROFILES_DIR / f"{stem}.mem.folded", "\n".join(_collapse_memory(diffs)) + "\n")
+            profiler.dump_stats(str(PROFILES_DIR / f"{stem}.prof"))
+            _enforce_retention()
+        _CAPTURES.inc(entry=entry)
+
+# ======================================================================================================================
+# API-STYLE FUNCTIONS
+# ======================================================================================================================
+
+def profiled(entry: str) -> Callable:
+    """
+    Decorate a service entry point so a sample of its calls is profiled while profiling is on
+
+    :param entry: the name used for its captures
+    :return: the decorator
+    """
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled or getattr(_active, "depth", 0) or random.random() >= _sample_rate:
+                return fn(*args, **kwargs)
+            return _capture(entry, fn, args, kwargs)
+        return wrapper
+    return decorator
+
+def is_profiling() -> bool:
+    """
+    Return whether profiling is on
+
+    :return: TRUE if on; FALSE otherwise
+    """
+    return _enabled
+
+def get_sample_rate() -> float:
+    """
+    Return the fraction of calls captured while profiling is on
+
+    :return: the sample rate
+    """
+    return _sample_rate
+
+def set_profiling(enabled: bool, sample_rate: float | None = None) -> None:
+    """
+    Turn profiling on or off for this process
+
+    :param enabled: whether to profile
+    :param sample_rate: the fraction of calls to capture, in [0, 1] (unchanged if None)
+    :return: None
+    """
+    global _enabled, _sample_rate
+    if sample_rate is not None:
+        if not 0 <= sample_rate <= 1:
+            raise ValueError("sample_rate must be between 0 and 1")
+        _sample_rate = float(sample_rate)
+    _enabled = bool(enabled)
+
+def list_captures() -> list[dict]:
+    """
+    List the captures on disk, newest first
+
+    :return: dictionaries with the capture name, entry point and file paths
+    """
+    captures: dict[str, list[Path]] = {}
+    for path in PROFILES_DIR.glob("*.*"):
+        captures.setdefault(path.name.split(".", 1)[0], []).append(path)
+    return [
+        {"capture": stem, "entry": stem.split("-", 4)[-1], "files": sorted(paths)}
+        for stem, paths in sorted(captures.items(), reverse=True)
+    ]
+
+def clear_captures() -> int:
+    """
+    Delete every capture
+
+    :return: the number of files deleted
+    """
+    with _files_lock:
+        paths = list(PROFILES_DIR.glob("*.*"))
+        for path in paths:
+            path.unlink(missing_ok=True)
+    return len(paths)
@@ -1,19 +1,15 @@
-import json, requests
+import json, os
 from pathlib import Path
-from config_private import OPENROUTER_API_KEY
+from typing import Callable, Iterable, Iterator
+
+from catalog_feed_service import OP_DELETE, OP_RESET, OP_UPSERT, get_catalog_version, record_changes
+from metrics_service import counter, histogram
+from profiling_service import profiled
+from storage_service import atomic_write_text, file_lock
 
 PROPERTIES_DATA_PATH = Path(__file__).parent / "data" / "properties.json"
-OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
 MODEL = "deepseek/deepseek-chat"
 
-if not OPENROUTER_API_KEY:
-    raise RuntimeError(
-        "Please set OPENROUTER_API_KEY in config_private.py"
-    )
-
-HEADERS = {"Authorization": f"Bearer {OPENROUTER_API_KEY}",
-           "Content-Type": "application/json"}
-
 SYSTEM_PROMPT = """\
 You are a data generator for an Airbnb-style app. 
 Return ONLY valid JSON (no other text). 
@@ -34,53 +30,256 @@ Other constraints:
 
 """
 This module handles all properties data, including generation, storage, and retrieval.
+
+Every write to the catalog file is recorded in the catalog change feed (catalog_feed_service) under a new catalog
+version: full replacements as a 'reset', and single-listing edits (upsert_property / delete_property) as incremental
+changes that caches and indexes can apply without rebuilding.
+
+Importing it is cheap and works without an API key: the LLM client (and requests) and config_private are only loaded
+when listings actually have to be generated, so the app boots from an existing catalog with no key at all.
 """
 
-def llm_generate_properties(model: str = MODEL, temperature: float = 0.7) -> list[dict]:
+_STORAGE_SECONDS = histogram("storage_seconds", "Time spent reading or writing a JSON data file", ("file", "op"))
+_LLM_SECONDS = histogram("llm_generate_seconds", "Time spent generating listings with the LLM")
+_LISTINGS_GENERATED = counter("listings_generated_total", "Valid listings produced by the LLM")
+
+def _headers() -> dict:
+    """
+    Return the OpenRouter request headers, loading the API key from config_private on first use
+
+    :return: the headers
+    """
+    try:
+        from config_private import OPENROUTER_API_KEY
+    except ImportError:
+        OPENROUTER_API_KEY = None
+    if not OPENROUTER_API_KEY:
+        raise RuntimeError(
+            "Please set OPENROUTER_API_KEY in config_private.py"
+        )
+    return {"Authorization": f"Bearer {OPENROUTER_API_KEY}",
+            "Content-Type": "application/json"}
+
+# Fields every listing must carry, with the type each value is coerced to
+PROPERTY_SCHEMA = {
+    "property_id": str,
+    "location": str,
+    "type": str,
+    "nightly_price": int,
+    "features": list,
+    "tags": list,
+    "capacity": int,
+    "lat": float,
+    "lon": float,
+}
+
+class _ArrayElementParser:
+    """
+    Incremental parser for a JSON array of objects arriving in arbitrary fragments. feed() returns the raw text of
+    every top-level array element that closed within the fragment, so each element can be decoded on its own and one
+    malformed element never costs the rest of the array. Text before the opening '[' (e.g. a ```json fence) is ignored.
+    """
+
+    def __init__(self):
+        self._buf: list[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._started = False
+        self._done = False
+
+    def feed(self, chunk: str) -> list[str]:
+        out = []
+        for ch in chunk:
+            if self._done:
+                break
+            if not self._started:
+                if ch == "[":
+                    self._started = True
+                    self._depth = 1
+                continue
+            if self._depth > 1:
+                self._buf.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if self._depth == 1:
+                    self._buf = [ch]
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 1:
+                    out.append("".join(self._buf))
+                    self._buf = []
+                elif self._depth == 0:
+                    self._done = True
+        return out
+
+def _validate_property(obj) -> dict | None:
+    """
+    Coerce a generated listing to PROPERTY_SCHEMA
+
+    :param obj: the decoded listing
+    :return: the normalized listing, or None if it is missing fields or has unusable values
     """
-      Generates properties using the LLM OpenRouter's API
+    if not isinstance(obj, dict):
+        return None
+    out = {}
+    try:
+        for field, kind in PROPERTY_SCHEMA.items():
+            value = obj[field]
+            if kind is list:
+                if not isinstance(value, list):
+                    return None
+                value = [str(v) for v in value]
+            elif kind is int:
+                value = int(round(float(value)))
+            else:
+                value = kind(value)
+            out[field] = value
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not out["property_id"] or not (-90 <= out["lat"] <= 90 and -180 <= out["lon"] <= 180):
+        return None
+    return out
+
+def iter_listings(fragments: Iterable[str]) -> Iterator[dict]:
+    """
+    Parse listings from a JSON array streamed in fragments, yielding each valid listing as soon as its object closes.
+    Malformed or invalid objects and repeated property ids are skipped.
+
+    :param fragments: the text fragments (e.g. LLM stream deltas)
+    :return: an iterator over validated listings
+    """
+    parser = _ArrayElementParser()
+    seen: set[str] = set()
+    for fragment in fragments:
+        for raw in parser.feed(fragment):
+            try:
+                prop = _validate_property(json.loads(raw))
+            except json.JSONDecodeError:
+                continue
+            if prop and prop["property_id"] not in seen:
+                seen.add(prop["property_id"])
+                yield prop
+
+@_LLM_SECONDS.timed()
+def llm_generate_properties(model: str = MODEL, temperature: float = 0.7, seed: int | None = None,
+                            refresh: bool = False) -> list[dict]:
+    """
+      Generates properties using the LLM OpenRouter's API. Responses are cached on disk by llm_client_service, so
+      repeated calls with the same arguments (and offline runs) do not hit the network.
 
       :param model: the model to be used
       :param temperature: the temperature to be used
+      :param seed: the sampling seed (part of the cache key)
+      :param refresh: bypass the cached response and request a new one
       :return: the generated properties
     """
-    payload = {
-        "model": model,
-        "messages": [
-            {"role": "system", "content": SYSTEM_PROMPT},
-        ],
-        "temperature": temperature,
-    }
-
-    response = requests.post(OPENROUTER_URL, headers=HEADERS, json=payload, timeout=60)
-    if response.status_code != 200:
-        raise RuntimeError(f"HTTP {response.status_code} with details: {response.text}")
-    data = response.json()
+    from llm_client_service import chat_completion
+
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+    ]
+    data = chat_completion(messages, model=model, temperature=temperature, headers=_headers, seed=seed,
+                           refresh=refresh)
     content = (data.get("choices") or [{}])[0].get("message", {}).get("content")
     if not content:
         raise RuntimeError(f"Empty response with raw: {data}")
-    try:
-        return json.loads(content)
-    except json.JSONDecodeError:
-        s, e = content.find("["), content.rfind("]")
-        if s != -1 and e != -1 and e > s:
-            try:
-                return json.loads(content[s:e+1])
-            except json.JSONDecodeError:
-                raise RuntimeError(f"Non-JSON content with raw: {content}")
+    props = list(iter_listings([content]))
+    if not props:
         raise RuntimeError(f"Non-JSON content with raw: {content}")
+    _LISTINGS_GENERATED.inc(len(props))
+    return props
 
-def save_properties(props: list[dict], path: Path = PROPERTIES_DATA_PATH) -> None:
+def llm_stream_properties(model: str = MODEL, temperature: float = 0.7, seed: int | None = None,
+                          refresh: bool = False) -> Iterator[dict]:
+    """
+      Generates properties using the LLM OpenRouter's API in streaming mode, yielding each listing as soon as the
+      model finishes writing it. Shares the response cache with llm_generate_properties.
+
+      :param model: the model to be used
+      :param temperature: the temperature to be used
+      :param seed: the sampling seed (part of the cache key)
+      :param refresh: bypass the cached response and request a new one
+      :return: an iterator over validated listings
     """
-      Save the properties to the properties.json file
+    from llm_client_service import stream_chat_completion
+
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+    ]
+    fragments = stream_chat_completion(messages, model=model, temperature=temperature, headers=_headers, seed=seed,
+                                       refresh=refresh)
+    yield from iter_listings(fragments)
+
+def _is_catalog(path: Path) -> bool:
+    """
+      Return whether a path is the live catalog file (writes elsewhere are not versioned)
+
+      :param path: the path
+      :return: TRUE if the path is PROPERTIES_DATA_PATH; FALSE otherwise
+    """
+    return Path(path).resolve() == PROPERTIES_DATA_PATH.resolve()
+
+@_STORAGE_SECONDS.timed(file="properties", op="save")
+def save_properties(props: list[dict], path: Path | None = None) -> None:
+    """
+      Save the properties to the properties.json file. The file is replaced atomically so readers never see a
+      partially written catalog, and replacing the live catalog is recorded as a 'reset' in the change feed.
 
       :param props: the properties to be saved
-      :param path: the path to save the files to
+      :param path: the path to save the files to (defaults to PROPERTIES_DATA_PATH)
       :return: None
     """
+    path = path or PROPERTIES_DATA_PATH
+    with file_lock(path):
+        atomic_write_text(path, json.dumps(props, indent=2))
+        if _is_catalog(path):
+            record_changes([{"op": OP_RESET}])
+
+def write_properties_stream(chunks: Iterable[list[dict]], path: Path | None = None) -> int:
+    """
+      Save properties arriving in chunks without holding the whole catalog in memory. Each listing is written as one
+      compact line inside a JSON array, so the file stays readable by load_properties_from_disk. The file is replaced
+      atomically once every chunk has been written; if the chunks raise, it is left untouched.
+
+      :param chunks: an iterable of property lists
+      :param path: the path to save the files to (defaults to PROPERTIES_DATA_PATH)
+      :return: the number of properties written
+    """
+    path = path or PROPERTIES_DATA_PATH
     path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(json.dumps(props, indent=2), encoding="utf-8")
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.stream.tmp")
+    count = 0
+    try:
+        with tmp.open("w", encoding="utf-8") as f:
+            f.write("[")
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                sep = ",\n" if count else "\n"
+                f.write(sep + ",\n".join(json.dumps(p, separators=(",", ":")) for p in chunk))
+                count += len(chunk)
+            f.write("\n]\n")
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    with file_lock(path):
+        os.replace(tmp, path)
+        if _is_catalog(path):
+            record_changes([{"op": OP_RESET}])
+    return count
 
+@_STORAGE_SECONDS.timed(file="properties", op="load")
 def load_properties_from_disk() -> list[dict]:
     """
     Return a list of properties from disk, or [] if missing/empty/invalid.
@@ -95,14 +294,110 @@ def load_properties_from_disk() -> list[dict]:
     except json.JSONDecodeError:
         return []
 
-def ensure_properties() -> list[dict]:
+def catalog_fingerprint() -> tuple[int, int, int]:
+    """
+    Return a value that changes whenever the catalog does, including edits made outside this module
+
+    :return: (catalog version, file size, file modification time in ns)
+    """
+    try:
+        stat = PROPERTIES_DATA_PATH.stat()
+        return get_catalog_version(), stat.st_size, stat.st_mtime_ns
+    except FileNotFoundError:
+        return get_catalog_version(), 0, 0
+
+def get_property(property_id: str) -> dict | None:
+    """
+    Return a single property by id
+
+    :param property_id: the property's id
+    :return: the property if found, None otherwise
+    """
+    for prop in load_properties_from_disk():
+        if prop.get("property_id") == property_id:
+            return prop
+    return None
+
+def upsert_properties(props: list[dict]) -> int:
+    """
+    Insert or replace listings by property_id in one write, recorded as one catalog version
+
+    :param props: the listings (validated against PROPERTY_SCHEMA)
+    :return: the new catalog version
+    """
+    clean = []
+    for prop in props:
+        valid = _validate_property(prop)
+        if valid is None:
+            raise ValueError(f"Invalid property: {prop}")
+        clean.append(valid)
+
+    with file_lock(PROPERTIES_DATA_PATH):
+        rows = load_properties_from_disk()
+        index = {row.get("property_id"): i for i, row in enumerate(rows)}
+        for prop in clean:
+            i = index.get(prop["property_id"])
+            if i is None:
+                index[prop["property_id"]] = len(rows)
+                rows.append(prop)
+            else:
+                rows[i] = prop
+        atomic_write_text(PROPERTIES_DATA_PATH, json.dumps(rows, indent=2))
+        return record_changes([
+            {"op": OP_UPSERT, "property_id": prop["property_id"], "property": prop} for prop in clean
+        ])
+
+def upsert_property(prop: dict) -> int:
+    """
+    Insert or replace a single listing by property_id
+
+    :param prop: the listing (validated against PROPERTY_SCHEMA)
+    :return: the new catalog version
+    """
+    return upsert_properties([prop])
+
+def delete_property(property_id: str) -> bool:
+    """
+    Delete a single listing
+
+    :param property_id: the property's id
+    :return: TRUE if deletion succeeded; otherwise, FALSE
+    """
+    with file_lock(PROPERTIES_DATA_PATH):
+        rows = load_properties_from_disk()
+        new_rows = [r for r in rows if r.get("property_id") != property_id]
+        if len(new_rows) == len(rows):
+            return False
+        atomic_write_text(PROPERTIES_DATA_PATH, json.dumps(new_rows, indent=2))
+        record_changes([{"op": OP_DELETE, "property_id": property_id}])
+        return True
+
+@profiled("ensure_properties")
+def ensure_properties(stream: bool = False, on_listing: Callable[[dict, int], None] | None = None) -> list[dict]:
     """
     Return properties, generating and saving them & if missing
 
+    :param stream: generate in streaming mode, writing each listing to a temporary file as it arrives and swapping it
+                   in once the stream completes, so an interrupted stream leaves no partial catalog behind
+    :param on_listing: called with (listing, count so far) for each listing received in streaming mode
     :return: a list of properties
     """
     props = load_properties_from_disk()
-    if not props:
+    if props:
+        return props
+    if not stream:
         props = llm_generate_properties()
         save_properties(props)
+        return props
+
+    def _chunks() -> Iterator[list[dict]]:
+        for prop in llm_stream_properties():
+            props.append(prop)
+            if on_listing:
+                on_listing(prop, len(props))
+            yield [prop]
+        if not props:
+            raise RuntimeError("The LLM stream produced no valid listings")
+
+    write_properties_stream(_chunks())
     return props
\ No newline at end of file
@@ -0,0 +1,154 @@
+from __future__ import annotations
+import os, threading, time
+
+from interactions_service import forget_user_views, remove_orphaned_interactions
+from metrics_service import counter, histogram
+from sessions_service import remove_orphaned_sessions
+from users_service import list_users, subscribe_user_deletions, unsubscribe_user_deletions
+
+PURGE_INTERVAL_SECONDS = float(os.environ.get("PURGE_INTERVAL_SECONDS", "3600"))
+# After a user is deleted, wait this long for further deletions so a burst is purged in one rewrite per file
+PURGE_DELAY_SECONDS = 5.0
+
+"""
+Garbage collection of the records users leave behind. users_service.delete_user only removes the user row; their
+sessions and interactions stay in sessions.json and interactions.json, where every token lookup, interaction scan and
+buffer reload keeps paying for them.
+
+purge_orphans() removes every session and interaction whose user no longer exists, one file at a time, in a single
+rewrite per file (and no rewrite at all when a file has no orphans: the interactions are checked against the
+interaction buffer's interned user ids without parsing the file). Each file is rewritten under its file lock and
+atomically, and the set of existing users is read only once the lock is held, so it is safe to run while the app is
+serving requests: concurrent logins and logged interactions either land before the purge or wait for it.
+
+start_purge() runs the purge in a background thread every PURGE_INTERVAL_SECONDS, and PURGE_DELAY_SECONDS after a user
+is deleted by this process.
+"""
+
+_PURGED_ROWS = counter("purged_rows_total", "Orphaned records removed by file", ("file",))
+_PURGED_BYTES = counter("purged_bytes_total", "Bytes reclaimed from data files by the orphan purge", ("file",))
+_PURGE_SECONDS = histogram("purge_seconds", "Time spent purging orphaned records")
+
+_last_report: dict | None = None
+_thread: threading.Thread | None = None
+_stop = threading.Event()
+_wake = threading.Event()
+_thread_lock = threading.Lock()
+
+# ======================================================================================================================
+# HELPER FUNCTIONS (for internal use)
+# ======================================================================================================================
+
+def _live_user_ids() -> set[str]:
+    """
+    Return the ids of the existing users
+
+    :return: the user ids
+    """
+    return {u.id for u in list_users()}
+
+def _on_user_deleted(user_id: str) -> None:
+    """
+    Drop a deleted user's counted views and schedule a purge for their records
+
+    :param user_id: the deleted user's id
+    :return: None
+    """
+    forget_user_views(user_id)
+    _wake.set()
+
+def _loop(interval: float) -> None:
+    """
+    Purge every interval, or shortly after a deletion, until stopped
+
+    :param interval: the seconds between purges
+    :return: None
+    """
+    while not _stop.is_set():
+        if _wake.wait(interval) and _stop.wait(PURGE_DELAY_SECONDS):
+            return
+        if _stop.is_set():
+            return
+        _wake.clear()
+        try:
+            purge_orphans()
+        except Exception:
+            pass
+
+# ======================================================================================================================
+# API-STYLE FUNCTIONS
+# ======================================================================================================================
+
+def purge_orphans() -> dict:
+    """
+    Remove the sessions and interactions of users that no longer exist
+
+    :return: per file ('sessions', 'interactions') the records removed ('rows') and bytes reclaimed ('bytes'), plus
+             the total time taken ('seconds')
+    """
+    global _last_report
+    start = time.perf_counter()
+    with _PURGE_SECONDS.time():
+        report = {
+            "sessions": remove_orphaned_sessions(_live_user_ids),
+            "interactions": remove_orphaned_interactions(_live_user_ids),
+        }
+    for file, removed in report.items():
+        if removed["rows"]:
+            _PURGED_ROWS.inc(removed["rows"], file=file)
+            _PURGED_BYTES.inc(removed["bytes"], file=file)
+    report["seconds"] = round(time.perf_counter() - start, 4)
+    _last_report = report
+    return report
+
+def last_purge_report() -> dict | None:
+    """
+    Return the report of the latest purge in this process
+
+    :return: the report (see purge_orphans), or None if there was none yet
+    """
+    return _last_report
+
+def request_purge() -> None:
+    """
+    Ask the background purge to run soon (after PURGE_DELAY_SECONDS). Does nothing unless start_purge() was called.
+
+    :return: None
+    """
+    _wake.set()
+
+def start_purge(interval: float | None = None) -> None:
+    """
+    Start purging orphaned records periodically, and after every user deletion, in a background thread. Does nothing
+    if running.
+
+    :param interval: the seconds between purges (defaults to PURGE_INTERVAL_SECONDS)
+    :return: None
+    """
+    global _thread
+    with _thread_lock:
+        if _thread is not None:
+            return
+        _stop.clear()
+        _wake.clear()
+        _thread = threading.Thread(
+            target=_loop, args=(interval or PURGE_INTERVAL_SECONDS,), name="orphan-purge", daemon=True
+        )
+        _thread.start()
+        subscribe_user_deletions(_on_user_deleted)
+
+def stop_purge() -> None:
+    """
+    Stop the background purge
+
+    :return: None
+    """
+    global _thread
+    with _thread_lock:
+        thread, _thread = _thread, None
+        if thread is None:
+            return
+        unsubscribe_user_deletions(_on_user_deleted)
+        _stop.set()
+        _wake.set()
+    thread.join(timeout=5)
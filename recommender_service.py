@@ -1,22 +1,66 @@
-import json
-import numpy as np
-import pandas as pd
+from __future__ import annotations
+import json, threading
+from datetime import date
 from pathlib import Path
-from collections import defaultdict
-from typing import Any
-
-from interactions_service import load_interactions
-from properties_service import ensure_properties
+from collections import OrderedDict, defaultdict
+from typing import TYPE_CHECKING
+
+from interactions_service import get_user_interactions, has_interactions
+from metrics_service import histogram
+from profiling_service import profiled
+from resources_service import CatalogResources, get_catalog_resources, property_tokens
+from storage_service import atomic_write_text, file_lock
 from users_service import User
 
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+
 TOP_N_PROPERTIES = 5
+# Relative weights of the affordability, environment and affinity components
+AFFORD_WEIGHT = 10
+ENV_WEIGHT = 5
+PREFS_WEIGHT = 3
+# Whether a coalesced view record (see interactions_service.ViewDeduper) weighs as every view it stands for (TRUE) or
+# as a single view (FALSE, so lingering on one listing counts no more than a glance)
+AFFINITY_COUNT_REPEAT_VIEWS = True
+# Weight of the optional proximity component (relative to the weights above) and its distance scale
+PROXIMITY_WEIGHT = 5
+PROXIMITY_SCALE_KM = 50.0
+# Weight of the optional popularity component (recent views and saves, see trending_service)
+POPULARITY_WEIGHT = 3
 DATA_PATH = Path(__file__).parent / "data" / "records.json"
+RECORD_COLUMNS = ["property_id", "location", "type", "nightly_price", "features", "tags", "score"]
+
+# Cold-start segments kept per catalog version (least recently used ones are dropped beyond this)
+SEGMENT_CACHE_SIZE = 4096
+# Listings kept per segment (the most a cold-start request can ask for)
+SEGMENT_TOP_N = 20
 
 """
 This service handles all recommender logic for the app's recommender. This include collaborative filtering and 
 standard recommender filtering (as discussed in class).
+
+NumPy and pandas are imported inside the functions that score, so importing this module stays cheap for pages that
+never compute recommendations. The catalog DataFrame and each listing's normalized tokens come from the shared
+resources in resources_service and are only rebuilt when the catalog changes.
+
+Users without any interactions have no affinity, so their picks depend only on their segment: preferred environment,
+budget and group size (listings must sleep at least that many guests). The values are used as they are, not rounded,
+so segment picks are exactly what full scoring returns. A SegmentTable keeps the top SEGMENT_TOP_N listings of the
+SEGMENT_CACHE_SIZE most recently requested segments and is rebuilt, re-warming those segments, whenever the catalog
+changes; such users are then served with a dictionary lookup.
+
+When a user has set travel dates, listings that are booked or blocked for any night of the stay are left out (see
+availability_service); those users always go through full scoring.
+
+Catalogs of PARALLEL_MIN_ROWS listings or more are scored in shards on a process pool (see parallel_scoring_service)
+with the same formula, fully vectorized; smaller ones are scored with score_properties.
 """
 
+_RECOMMEND_SECONDS = histogram("recommend_seconds", "Time spent producing top picks", ("path",))
+_SCORE_SECONDS = histogram("score_seconds", "Time spent scoring a catalog frame in-process")
+
 class UserPrefs:
     def __init__(
         self,
@@ -25,46 +69,214 @@ class UserPrefs:
         weight_afford: float = 0.4,
         weight_env: float = 0.2,
         weight_prefs: float = 0.4,
+        weight_proximity: float = 0.0,
+        anchor: tuple[float, float] | None = None,
+        proximity_scale_km: float = PROXIMITY_SCALE_KM,
+        weight_popularity: float = 0.0,
     ):
         self.budget = budget
         self.preferred_environment = preferred_environment
         self.weight_afford = weight_afford
         self.weight_env = weight_env
         self.weight_prefs = weight_prefs
+        self.weight_proximity = weight_proximity
+        self.anchor = anchor
+        self.proximity_scale_km = proximity_scale_km
+        self.weight_popularity = weight_popularity
 
     def normalize_weights(self):
-        total = self.weight_afford + self.weight_env + self.weight_prefs
+        total = (
+            self.weight_afford + self.weight_env + self.weight_prefs + self.weight_proximity + self.weight_popularity
+        )
         if total == 0:
             self.weight_afford, self.weight_env, self.weight_prefs = 1.0, 0.0, 0.0
+            self.weight_proximity, self.weight_popularity = 0.0, 0.0
         else:
             self.weight_afford /= total
             self.weight_env /= total
             self.weight_prefs /= total
+            self.weight_proximity /= total
+            self.weight_popularity /= total
 
     def __repr__(self):
         return (
             f"UserPrefs(budget={self.budget}, "
             f"preferred_environment={self.preferred_environment!r}, "
             f"w_afford={self.weight_afford:.3f}, w_env={self.weight_env:.3f})"
-            f"w_prefs={self.weight_prefs:.3f})"
+            f"w_prefs={self.weight_prefs:.3f}, w_proximity={self.weight_proximity:.3f}, "
+            f"w_popularity={self.weight_popularity:.3f})"
         )
 
+class SegmentTable:
+    def __init__(self, resources: CatalogResources):
+        import numpy as np
+
+        self.resources = resources
+        props = resources.props
+        n = len(props)
+        self._price = np.fromiter(
+            (v if isinstance(v := p.get("nightly_price"), (int, float)) else np.nan for p in props), dtype=float, count=n
+        )
+        self._capacity = np.fromiter(
+            (v if isinstance(v := p.get("capacity"), (int, float)) else 0 for p in props), dtype=float, count=n
+        )
+        self._env_masks: dict[str, np.ndarray] = {}
+        self._tops: OrderedDict[tuple, list[dict]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def segments(self) -> list[tuple]:
+        """
+        Return the segments computed so far
+
+        :return: the segment keys
+        """
+        with self._lock:
+            return list(self._tops)
+
+    def top(self, segment: tuple, n: int = TOP_N_PROPERTIES) -> list[dict]:
+        """
+        Return the top listings of a segment, computing the segment on first use
+
+        :param segment: a key returned by segment_key
+        :param n: the number of listings (at most SEGMENT_TOP_N)
+        :return: records in the same format as run_vectorization
+        """
+        if n > SEGMENT_TOP_N:
+            raise ValueError(f"Segments keep at most {SEGMENT_TOP_N} listings")
+        with self._lock:
+            top = self._tops.get(segment)
+            if top is None:
+                top = self._tops[segment] = self._compute(segment)
+                if len(self._tops) > SEGMENT_CACHE_SIZE:
+                    self._tops.popitem(last=False)
+            else:
+                self._tops.move_to_end(segment)
+        return [dict(r) for r in top[:n]]
+
+    def _env_mask(self, env: str) -> np.ndarray:
+        """
+        Return 1.0 for the listings tagged with an environment, 0.0 for the others (call with the lock held)
+
+        :param env: the environment
+        :return: the mask
+        """
+        import numpy as np
+
+        mask = self._env_masks.get(env)
+        if mask is None:
+            props = self.resources.props
+            mask = self._env_masks[env] = np.fromiter(
+                (1.0 if env in (p.get("tags") or []) else 0.0 for p in props), dtype=float, count=len(props)
+            )
+        return mask
+
+    def _compute(self, segment: tuple) -> list[dict]:
+        """
+        Score the catalog for a segment with the same formula as score_properties (without affinity)
+
+        :param segment: the segment key
+        :return: the top SEGMENT_TOP_N records
+        """
+        import numpy as np
+
+        env, budget, group = segment
+        budget = float(budget or 0)
+        total = AFFORD_WEIGHT + ENV_WEIGHT + PREFS_WEIGHT
+        score = AFFORD_WEIGHT / total * np.clip((budget - self._price) / max(budget, 0.001), 0.0, 1.0)
+        if env:
+            score = score + ENV_WEIGHT / total * self._env_mask(env)
+        score = np.nan_to_num(score, nan=0.0)
+
+        eligible = np.flatnonzero(self._capacity >= group) if group else np.arange(len(score))
+        k = min(SEGMENT_TOP_N, len(eligible))
+        if k == 0:
+            return []
+        best = eligible[np.argpartition(-score[eligible], k - 1)[:k]] if k < len(eligible) else eligible
+        best = best[np.lexsort((best, -score[best]))]
+        return _records(self.resources.props, best, score[best])
+
 # ======================================================================================================================
 # HELPER FUNCTIONS (for internal use)
 # ======================================================================================================================
 
-def score_properties(df, prefs, affinity: dict[str, float] | None = None):
+_segments: SegmentTable | None = None
+_segments_lock = threading.Lock()
+
+def min_capacity(user: User) -> int:
+    """
+    Return the smallest capacity a listing needs for the user's group (0 when unknown, meaning no constraint)
+
+    :param user: the user
+    :return: the capacity
+    """
+    return int(user.group_size or 0)
+
+def segment_key(user: User) -> tuple:
+    """
+    Return the cold-start segment of a user
+
+    :param user: the user
+    :return: (preferred environment, budget, minimum capacity)
+    """
+    return (user.preferred_env or "", user.budget_max, min_capacity(user))
+
+def travel_dates(user: User) -> tuple[date, date] | None:
+    """
+    Return the user's stay if both travel dates are set and valid. A date that does not parse counts as not set.
+
+    :param user: the user
+    :return: (first night, check-out day), or None
+    """
+    try:
+        start = date.fromisoformat(str(user.travel_start or "")[:10])
+        end = date.fromisoformat(str(user.travel_end or "")[:10])
+    except ValueError:
+        return None
+    return (start, end) if end > start else None
+
+def _records(props: list[dict], rows, scores) -> list[dict]:
+    """
+    Build output records for catalog rows, in the same format as run_vectorization
+
+    :param props: the catalog
+    :param rows: the catalog rows, best first
+    :param scores: their match scores
+    :return: the records
+    """
+    out = []
+    for i, score in zip(rows.tolist(), scores.tolist()):
+        rec = {col: props[i].get(col) for col in RECORD_COLUMNS[:-1]}
+        rec["score"] = f"{round(float(score) * 100, 1)}%"
+        out.append(rec)
+    return out
+
+def _write_records(out: list[dict]) -> None:
+    """
+    Write the latest picks to the records file. Picks are produced concurrently (pages, the picks scheduler, the API),
+    so the file is replaced atomically under its lock and readers never see a partial file.
+
+    :param out: the picks
+    :return: None
+    """
+    with file_lock(DATA_PATH):
+        atomic_write_text(DATA_PATH, json.dumps(out, indent=2))
+
+@_SCORE_SECONDS.timed()
+def score_properties(df, prefs, affinity: dict[str, float] | None = None, popularity: dict[str, float] | None = None):
     """
     Score the properties based on affordability, environment, and affinity preferences
     :param df: the properties
     :param prefs: the user preferences
     :param affinity: the generated user affinity
+    :param popularity: optional property id -> popularity in [0, 1] (see trending_service.popularity_scores)
     :return: the scored properties
     """
+    import numpy as np
+
     df = df.copy()
 
     # Affordability (vectorized on the numeric column)
-    budget = prefs.budget
+    budget = float(prefs.budget or 0)  # a missing budget affords nothing, as in the segment and sharded paths
     prices = df["nightly_price"].to_numpy(dtype=float)
     afford = np.clip((budget - prices) / max(budget, 0.001), 0.0, 1.0) #avoid division by 0; clip
 
@@ -77,94 +289,143 @@ def score_properties(df, prefs, affinity: dict[str, float] | None = None):
     else:
         env = np.zeros(len(df), dtype=float)
 
-    # If affinity exists, score the properties using it
+    # If affinity exists, score the properties using it (shared frames carry precomputed tokens)
     if affinity:
+        if "tokens" in df:
+            token_lists = df["tokens"]
+        else:
+            token_lists = [property_tokens(rec) for rec in df[["features", "tags"]].to_dict(orient="records")]
         pref_scores = []
-        for feats, tags in zip(df.get("features", []), df.get("tags", [])):
-            toks = []
-            if isinstance(feats, list):
-                toks += [str(t).strip().lower() for t in feats]
-            if isinstance(tags, list):
-                toks += [str(t).strip().lower() for t in tags]
+        for toks in token_lists:
             vals = [affinity[t] for t in toks if t in affinity]
             pref_scores.append(float(sum(vals) / len(vals)) if vals else 0.0)
         prefs_score = np.array(pref_scores, dtype=float)
     else:
         prefs_score = np.zeros(len(df), dtype=float)
 
+    # Proximity: decays exponentially with the distance from the anchor point (if one was given)
+    if prefs.anchor is not None and prefs.weight_proximity > 0:
+        from geo_service import haversine_km
+        dist = haversine_km(prefs.anchor[0], prefs.anchor[1], df["lat"].to_numpy(), df["lon"].to_numpy())
+        proximity = np.nan_to_num(np.exp(-dist / max(prefs.proximity_scale_km, 0.001)), nan=0.0)
+    else:
+        proximity = np.zeros(len(df), dtype=float)
+
+    # Popularity: recent views and saves, already scaled to [0, 1]
+    if popularity and prefs.weight_popularity > 0:
+        popular = np.array([popularity.get(pid, 0.0) for pid in df["property_id"]], dtype=float)
+    else:
+        popular = np.zeros(len(df), dtype=float)
+
     # Weighted score
     df["afford_score"] = afford
     df["env_score"] = env
     df["prefs_score"] = prefs_score  # NEW
+    df["proximity_score"] = proximity
+    df["popularity_score"] = popular
     df["match_score"] = (
         prefs.weight_afford * df["afford_score"] +
         prefs.weight_env    * df["env_score"] +
-        prefs.weight_prefs * df["prefs_score"]
+        prefs.weight_prefs * df["prefs_score"] +
+        prefs.weight_proximity * df["proximity_score"] +
+        prefs.weight_popularity * df["popularity_score"]
     )
 
     return df.sort_values("match_score", ascending=False)
 
-def run_vectorization(user: User, n: int):
+@_RECOMMEND_SECONDS.timed(path="full")
+def run_vectorization(
+    user: User, n: int, near: tuple[float, float] | None = None, trending_window: str | None = None
+):
     """
     Run vectorization for the properties
     :param user: the current user
     :param n: the number of properties to return
+    :param near: an optional (lat, lon) point; properties close to it score higher
+    :param trending_window: an optional window ('1h', '24h' or '7d'); listings popular within it score higher
     :return: the top n properties
     """
-    properties = ensure_properties()
-
-    df = pd.DataFrame(properties)
+    resources = get_catalog_resources(generate=True)
+    capacity = min_capacity(user)
+    available = None
+    stay = travel_dates(user)
+    if stay is not None:
+        from availability_service import get_availability_index
+        ids = (p.get("property_id") for p in resources.props)
+        available = get_availability_index().available_mask(ids, *stay)
 
     prefs = UserPrefs(
         user.budget_max,
         user.preferred_env,
-        weight_afford=10,
-        weight_env=5,
-        weight_prefs=3,
+        weight_afford=AFFORD_WEIGHT,
+        weight_env=ENV_WEIGHT,
+        weight_prefs=PREFS_WEIGHT,
+        weight_proximity=PROXIMITY_WEIGHT if near is not None else 0,
+        anchor=near,
+        weight_popularity=POPULARITY_WEIGHT if trending_window is not None else 0,
     )
     prefs.normalize_weights()
 
-    affinity = build_user_affinity(user.id, df)
+    affinity = build_user_affinity(user.id)
 
-    scored = score_properties(df, prefs, affinity=affinity)
+    popularity = None
+    if trending_window is not None:
+        from trending_service import popularity_scores
+        popularity = popularity_scores(trending_window)
+
+    from parallel_scoring_service import PARALLEL_MIN_ROWS
+    if len(resources) >= PARALLEL_MIN_ROWS:
+        # Large catalogs: score shards on a process pool (in-process with a single worker) and merge their top n
+        from parallel_scoring_service import get_sharded_scorer
+        rows, scores = get_sharded_scorer(resources).top_k(
+            prefs, n, affinity=affinity, popularity=popularity, mask=available, min_capacity=capacity,
+        )
+        out = _records(resources.props, rows, scores)
+        _write_records(out)
+        return out
+
+    df = resources.frame
+    if available is not None:
+        df = df[available]
+    if capacity:
+        df = df[df["capacity"] >= capacity]
+
+    scored = score_properties(df, prefs, affinity=affinity, popularity=popularity)
 
     top = scored.head(n).copy()
 
     top["score"] = ((top["match_score"] * 100).round(1)).astype(str) + "%"
 
-    cols = [
-        "property_id", "location", "type", "nightly_price",
-        "features", "tags",
-        "score"
-    ]
-    top = top[cols]
+    top = top[RECORD_COLUMNS]
 
     top.reset_index(drop=True, inplace=True)
     out = top.to_dict(orient="records")
-    with open(DATA_PATH, "w") as f:
-        json.dump(out, f, indent=2)
+    _write_records(out)
 
     return out
 
-def build_user_affinity(user_id: str, df: pd.DataFrame) -> dict[str, float]:
+def build_user_affinity(user_id: str, df: pd.DataFrame | None = None) -> dict[str, float]:
     """
     Builds affinity for the given user using tokens (which are either property features or tags).
-    Each view event contributes 1 and each save event contributes 3, normalized over the range [0, 1].
+    Each view event contributes 1 and each save event contributes 3, normalized over the range [0, 1]. Repeated views
+    coalesced into one record count per view or once, depending on AFFINITY_COUNT_REPEAT_VIEWS.
 
     :param user_id: the user id
-    :param df: the properties
+    :param df: the properties (defaults to the shared catalog)
     :return: the user's affinity as a dictionary
     """
 
     # Only look at the interactions for the current user
-    rows = [r for r in load_interactions() if r.get("user_id") == user_id]
+    rows = get_user_interactions(user_id)
     if not rows:
         return {}
 
-    # Make a dictionary containing features and tags for each property
-    by_id: dict[str, tuple[list[Any], list[Any]]] = {}
-    for rec in df.to_dict(orient="records"):
-        by_id[rec.get("property_id")] = (rec.get("features") or [], rec.get("tags") or [])
+    # Tokens (normalized features and tags) for each property
+    if df is None:
+        resources = get_catalog_resources()
+        by_id = {pid: resources.tokens[i] for pid, i in resources.index.items()}
+    else:
+        by_id = {rec.get("property_id"): property_tokens(rec) for rec in df.to_dict(orient="records")}
 
     # Look at each relevant interaction
     counts: dict[str, float] = defaultdict(float)
@@ -175,12 +436,10 @@ def build_user_affinity(user_id: str, df: pd.DataFrame) -> dict[str, float]:
         weight = row.get("weight")
         if weight is None:
             weight = 3.0 if row.get("event") == "save" else 1.0
+        if AFFINITY_COUNT_REPEAT_VIEWS:
+            weight = float(weight) * row.get("count", 1)
 
-        # Create a list of the properties features and tags with appropriate normalized weights
-        feats, tags = by_id[pid]
-        tokens = [*(feats or []), *(tags or [])]
-        for token in tokens:
-            t = str(token).strip().lower()
+        for t in by_id[pid]:
             if t:
                 counts[t] += float(weight)
 
@@ -194,13 +453,57 @@ def build_user_affinity(user_id: str, df: pd.DataFrame) -> dict[str, float]:
 # API-STYLE FUNCTIONS
 # ======================================================================================================================
 
-def produce_top_matches(user: User, n:int=TOP_N_PROPERTIES):
+def get_segment_table() -> SegmentTable:
+    """
+    Return the process-wide segment table. When the catalog changed it is rebuilt and every segment the previous
+    table held is recomputed right away.
+
+    :return: the table
+    """
+    global _segments
+    resources = get_catalog_resources(generate=True)
+    with _segments_lock:
+        if _segments is None or _segments.resources is not resources:
+            previous = _segments.segments() if _segments is not None else []
+            _segments = SegmentTable(resources)
+            for segment in previous:
+                _segments.top(segment)
+        return _segments
+
+@_RECOMMEND_SECONDS.timed(path="segment")
+def segment_top_matches(user: User, n: int = TOP_N_PROPERTIES) -> list[dict]:
+    """
+    Return the top n properties of the user's segment, ignoring any interaction history
+
+    :param user: the user
+    :param n: the number of properties to return (at most SEGMENT_TOP_N)
+    :return: the top n properties
+    """
+    return get_segment_table().top(segment_key(user), n)
+
+@profiled("produce_top_matches")
+def produce_top_matches(
+    user: User,
+    n:int=TOP_N_PROPERTIES,
+    near: tuple[float, float] | None = None,
+    trending_window: str | None = None,
+):
     """
     Return the top n properties for the current user. This function exists to ensure separation between
-    frontend-serving functions and backend functions for code cleanliness.
+    frontend-serving functions and backend functions for code cleanliness. Users without interactions are served
+    from the precomputed segment table (unless they set travel dates or proximity or popularity is requested).
 
     :param user: the current user
     :param n: the number of properties to return
+    :param near: an optional (lat, lon) point to favour properties close to
+    :param trending_window: an optional window ('1h', '24h' or '7d') to favour listings popular within
     :return: the top n properties for the current user
     """
-    return run_vectorization(user, n)
\ No newline at end of file
+    if (
+        near is None and trending_window is None and n <= SEGMENT_TOP_N and travel_dates(user) is None
+        and not has_interactions(user.id)
+    ):
+        out = segment_top_matches(user, n)
+        _write_records(out)
+        return out
+    return run_vectorization(user, n, near=near, trending_window=trending_window)
\ No newline at end of file
@@ -0,0 +1,209 @@
+from __future__ import annotations
+import threading
+from typing import TYPE_CHECKING
+
+import properties_service
+from catalog_feed_service import OP_DELETE, OP_RESET, OP_UPSERT, changes_since
+from metrics_service import counter, gauge
+from properties_service import catalog_fingerprint, ensure_properties, load_properties_from_disk
+from snapshot_service import read_snapshot, register_snapshot
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+"""
+Process-wide shared resources built from the catalog. Streamlit reruns every page script on each interaction; instead
+of re-reading properties.json and rebuilding dictionaries, labels and DataFrames every time, pages and services read
+one CatalogResources object per process.
+
+The object is rebuilt only when the catalog fingerprint (version, file size and modification time) changes. A cold
+start loads it from its snapshot (see snapshot_service) and replays the catalog changes made since. Expensive
+parts (the scoring DataFrame, the token lists used for affinity) are built lazily on first use and then shared. All
+resources are read-only: callers must copy before modifying anything.
+"""
+
+_LISTINGS = gauge("catalog_listings", "Listings in the shared catalog resources")
+_REBUILDS = counter("catalog_resources_rebuilds_total", "Times the shared catalog resources were rebuilt")
+
+class CatalogResources:
+    def __init__(self, props: list[dict], fingerprint: tuple):
+        self.fingerprint = fingerprint
+        self.version = fingerprint[0]
+        self.props = props
+        self.index = {p.get("property_id"): i for i, p in enumerate(props)}
+        self.labels = [f"{p.get('property_id')} — {p.get('location')} (${p.get('nightly_price')})" for p in props]
+        self._frame: pd.DataFrame | None = None
+        self._tokens: list[list[str]] | None = None
+        self._lock = threading.Lock()
+        _LISTINGS.set(len(props))
+        _REBUILDS.inc()
+
+    def __len__(self) -> int:
+        return len(self.props)
+
+    def get(self, property_id: str) -> dict | None:
+        """
+        Return a listing by id
+
+        :param property_id: the property's id
+        :return: the listing if found, None otherwise
+        """
+        i = self.index.get(property_id)
+        return None if i is None else self.props[i]
+
+    def label(self, property_id: str) -> str:
+        """
+        Return the display label of a listing
+
+        :param property_id: the property's id
+        :return: the label, or the id itself if the listing is unknown
+        """
+        i = self.index.get(property_id)
+        return property_id if i is None else self.labels[i]
+
+    @property
+    def tokens(self) -> list[list[str]]:
+        """
+        Normalized features and tags of every listing (aligned with props), as used for affinity scoring
+
+        :return: one token list per listing
+        """
+        with self._lock:
+            if self._tokens is None:
+                self._tokens = [property_tokens(p) for p in self.props]
+            return self._tokens
+
+    @property
+    def frame(self) -> pd.DataFrame:
+        """
+        The catalog as a DataFrame with an extra 'tokens' column, for scoring
+
+        :return: DataFrame (read-only)
+        """
+        tokens = self.tokens
+        with self._lock:
+            if self._frame is None:
+                import pandas as pd
+                frame = pd.DataFrame(self.props)
+                frame["tokens"] = tokens
+                self._frame = frame
+            return self._frame
+
+# ======================================================================================================================
+# HELPER FUNCTIONS (for internal use)
+# ======================================================================================================================
+
+_resources: CatalogResources | None = None
+_resources_lock = threading.Lock()
+
+def property_tokens(prop: dict) -> list[str]:
+    """
+    Return the normalized (stripped, lowercase) features and tags of a listing
+
+    :param prop: the listing
+    :return: the tokens
+    """
+    toks = []
+    for field in ("features", "tags"):
+        values = prop.get(field)
+        if isinstance(values, list):
+            toks += [str(t).strip().lower() for t in values]
+    return toks
+
+def _replay(props: list[dict], changes: list[dict]) -> list[dict] | None:
+    """
+    Apply catalog change-feed records to a listing list the way properties_service applies them to the file
+
+    :param props: the listings (modified in place)
+    :param changes: the change records
+    :return: the listings, or None if a reset was encountered
+    """
+    index = {p.get("property_id"): i for i, p in enumerate(props)}
+    for change in changes:
+        op = change.get("op")
+        if op == OP_RESET:
+            return None
+        if op == OP_UPSERT:
+            i = index.get(change["property_id"])
+            if i is None:
+                index[change["property_id"]] = len(props)
+                props.append(change["property"])
+            else:
+                props[i] = change["property"]
+        elif op == OP_DELETE:
+            props[:] = [p for p in props if p.get("property_id") != change["property_id"]]
+            index = {p.get("property_id"): i for i, p in enumerate(props)}
+    return props
+
+def _restore_resources() -> CatalogResources | None:
+    """
+    Load the resources from their snapshot, replaying the catalog changes made since
+
+    :return: the resources, or None if there is no usable snapshot
+    """
+    snapshot = read_snapshot("catalog")
+    if snapshot is None:
+        return None
+    meta, state = snapshot
+    if meta.get("catalog") != str(properties_service.PROPERTIES_DATA_PATH):
+        return None
+    fingerprint = catalog_fingerprint()
+    saved = tuple(meta["fingerprint"])
+    if saved == fingerprint:
+        resources = CatalogResources(state["props"], fingerprint)
+        resources._tokens = state["tokens"]
+        return resources
+    if saved[0] >= fingerprint[0]:
+        return None  # changed outside the change feed
+    props = _replay(state["props"], changes_since(saved[0]))
+    return None if props is None else CatalogResources(props, fingerprint)
+
+def _dump_resources() -> tuple[dict, dict] | None:
+    """
+    Return the listings and their tokens for snapshot_service
+
+    :return: (state, metadata), or None if nothing is loaded
+    """
+    with _resources_lock:
+        resources = _resources
+    if resources is None or not resources.props:
+        return None
+    state = {"props": resources.props, "tokens": resources.tokens}
+    return state, {"catalog": str(properties_service.PROPERTIES_DATA_PATH), "fingerprint": list(resources.fingerprint)}
+
+# ======================================================================================================================
+# API-STYLE FUNCTIONS
+# ======================================================================================================================
+
+def get_catalog_resources(generate: bool = False) -> CatalogResources:
+    """
+    Return the shared catalog resources, rebuilding them if the catalog changed
+
+    :param generate: generate the catalog with the LLM if it is empty (see properties_service.ensure_properties)
+    :return: the resources
+    """
+    global _resources
+    with _resources_lock:
+        fingerprint = catalog_fingerprint()
+        if _resources is None:
+            _resources = _restore_resources()
+        if _resources is None or _resources.fingerprint != fingerprint:
+            props = ensure_properties() if generate else load_properties_from_disk()
+            # Stamp the fingerprint read before the load: a write landing in between leaves it stale, so the next call
+            # rebuilds instead of caching the old listings under the new fingerprint
+            _resources = CatalogResources(props, fingerprint)
+        elif generate and not _resources.props:
+            _resources = CatalogResources(ensure_properties(), fingerprint)
+        return _resources
+
+def clear_resources() -> None:
+    """
+    Drop the shared resources. For dev/testing purposes.
+
+    :return: None
+    """
+    global _resources
+    with _resources_lock:
+        _resources = None
+
+register_snapshot("catalog", _dump_resources)
@@ -0,0 +1,501 @@
+from __future__ import annotations
+import bisect, math, re, threading
+from typing import Iterable
+
+from catalog_feed_service import OP_DELETE, OP_RESET, OP_UPSERT, changes_since, get_catalog_version
+import properties_service
+from properties_service import load_properties_from_disk
+from snapshot_service import read_snapshot, register_snapshot
+
+# Fields that are tokenized for full-text search
+TEXT_FIELDS = ("location", "type", "features", "tags")
+# Fields that can be filtered on exactly and have facet counts
+FACET_FIELDS = ("location", "type", "features", "tags")
+# Numeric fields that support range filters
+RANGE_FIELDS = ("nightly_price", "capacity")
+
+DEFAULT_PAGE_SIZE = 20
+EXACT_MATCH_BOOST = 2.0
+# Removed listings leave a tombstone position; the index is compacted once there are at least COMPACT_MIN_TOMBSTONES
+# of them and they outnumber this fraction of the live listings
+COMPACT_TOMBSTONE_RATIO = 0.5
+COMPACT_MIN_TOMBSTONES = 1000
+# Bump whenever PropertySearchIndex's attributes change, so older snapshots are rebuilt instead of restored
+INDEX_SCHEMA_VERSION = 1
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+"""
+Search over the property catalog for the Explore page.
+
+The index keeps, per listing position:
+  - an inverted index from text tokens (words of location, type, features and tags) to sets of positions, plus a
+    sorted vocabulary so a query word also matches every token it is a prefix of ('lak' -> 'lake', 'lakeside')
+  - exact facet postings ('tags=lake', 'type=cabin', ...) used both for filtering and for facet counts
+  - sorted (value, position) lists for price and capacity, so range filters are two binary searches
+
+A query ANDs its words (each word may match any token it prefixes), ANDs the filters of different fields and ORs the
+values selected within one field. Facet counts are intersections of the facet postings with the result set, computed
+without the field's own filter so the other values of a field stay selectable. Results are ranked by an idf-weighted
+match score (exact token matches count double) and returned one page at a time.
+
+The index follows the catalog change feed: get_search_index() applies upserts and deletes incrementally and only
+rebuilds on a catalog reset. Queries and changes hold the index's lock, so a query running in another session never
+sees a half-applied change. A fresh build appends to the range lists and sorts them once. An upsert or delete leaves
+the listing's old position empty; once empty positions outnumber half the live listings, the index is rebuilt from
+the live ones.
+"""
+
+class PropertySearchIndex:
+    def __init__(self, props: list[dict] | None = None):
+        # Held by queries and by every change, so a query never sees a half-applied update
+        self._lock = threading.RLock()
+        self.version = 0
+
+        # Index the last copy of each listing
+        latest: dict = {}
+        for prop in props or []:
+            latest.pop(prop.get("property_id"), None)
+            latest[prop.get("property_id")] = prop
+        self._build(latest.values())
+
+    def __len__(self) -> int:
+        return len(self._live)
+
+    def __getstate__(self) -> dict:
+        with self._lock:
+            state = dict(self.__dict__)
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def _build(self, props: Iterable[dict]) -> None:
+        """
+        Index listings from scratch, appending to the range lists and sorting them once (call with the lock held, or
+        while building)
+
+        :param props: the listings, one per property_id, in catalog order
+        :return: None
+        """
+        self._docs: list[dict | None] = []
+        self._pos: dict[str, int] = {}
+        self._postings: dict[str, set[int]] = {}
+        self._facets: dict[str, set[int]] = {}
+        self._ranges: dict[str, list[tuple[float, int]]] = {f: [] for f in RANGE_FIELDS}
+        self._vocab: list[str] = []
+        self._vocab_dirty = True
+        self._live: set[int] = set()
+        for prop in props:
+            self._add(prop, keep_sorted=False)
+        for entries in self._ranges.values():
+            entries.sort()
+
+    def _compact(self) -> None:
+        """
+        Reindex the live listings once removed positions outnumber COMPACT_TOMBSTONE_RATIO of them, so a long run of
+        catalog edits does not grow the index without bound. Listings keep their relative order.
+
+        :return: None
+        """
+        tombstones = len(self._docs) - len(self._live)
+        if tombstones >= COMPACT_MIN_TOMBSTONES and tombstones > COMPACT_TOMBSTONE_RATIO * len(self._live):
+            self._build([doc for doc in self._docs if doc is not None])
+
+    def add(self, prop: dict) -> None:
+        """
+        Index a listing, replacing any listing with the same property_id
+
+        :param prop: the listing
+        :return: None
+        """
+        with self._lock:
+            self._add(prop, keep_sorted=True)
+
+    def _add(self, prop: dict, keep_sorted: bool) -> None:
+        """
+        Index a listing (call with the lock held, or while building)
+
+        :param prop: the listing
+        :param keep_sorted: insert into the range lists in order; FALSE appends, and the caller sorts them afterwards
+        :return: None
+        """
+        pid = prop.get("property_id")
+        if pid in self._pos:
+            self._remove(pid)
+        pos = len(self._docs)
+        self._docs.append(prop)
+        self._pos[pid] = pos
+        self._live.add(pos)
+
+        for token in _doc_tokens(prop):
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = set()
+                self._vocab_dirty = True
+            postings.add(pos)
+        for key in _facet_keys(prop):
+            self._facets.setdefault(key, set()).add(pos)
+        for field in RANGE_FIELDS:
+            value = prop.get(field)
+            if isinstance(value, (int, float)):
+                if keep_sorted:
+                    bisect.insort(self._ranges[field], (float(value), pos))
+                else:
+                    self._ranges[field].append((float(value), pos))
+
+    def remove(self, property_id: str) -> bool:
+        """
+        Remove a listing from the index
+
+        :param property_id: the property's id
+        :return: TRUE if the listing was indexed; FALSE otherwise
+        """
+        with self._lock:
+            return self._remove(property_id)
+
+    def _remove(self, property_id: str) -> bool:
+        """
+        Remove a listing from the index (call with the lock held)
+
+        :param property_id: the property's id
+        :return: TRUE if the listing was indexed; FALSE otherwise
+        """
+        pos = self._pos.pop(property_id, None)
+        if pos is None:
+            return False
+        prop = self._docs[pos]
+        self._docs[pos] = None
+        self._live.discard(pos)
+        for token in _doc_tokens(prop):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.discard(pos)
+                if not postings:
+                    del self._postings[token]
+                    self._vocab_dirty = True
+        for key in _facet_keys(prop):
+            postings = self._facets.get(key)
+            if postings is not None:
+                postings.discard(pos)
+                if not postings:
+                    del self._facets[key]
+        for field in RANGE_FIELDS:
+            value = prop.get(field)
+            if isinstance(value, (int, float)):
+                entries = self._ranges[field]
+                i = bisect.bisect_left(entries, (float(value), pos))
+                if i < len(entries) and entries[i] == (float(value), pos):
+                    entries.pop(i)
+        self._compact()
+        return True
+
+    def get(self, property_id: str) -> dict | None:
+        """
+        Return an indexed listing by id
+
+        :param property_id: the property's id
+        :return: the listing if indexed, None otherwise
+        """
+        with self._lock:
+            pos = self._pos.get(property_id)
+            return None if pos is None else self._docs[pos]
+
+    def apply_changes(self, changes: list[dict]) -> bool:
+        """
+        Apply catalog change-feed records
+
+        :param changes: the change records (see catalog_feed_service)
+        :return: FALSE if a reset was encountered and the index must be rebuilt; TRUE otherwise
+        """
+        with self._lock:
+            for change in changes:
+                op = change.get("op")
+                if op == OP_RESET:
+                    return False
+                if op == OP_UPSERT:
+                    self._add(change["property"], keep_sorted=True)
+                elif op == OP_DELETE:
+                    self._remove(change["property_id"])
+                self.version = max(self.version, change.get("version", self.version))
+            return True
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def search(
+        self,
+        query: str = "",
+        filters: dict[str, list[str]] | None = None,
+        price_range: tuple[float | None, float | None] = (None, None),
+        capacity_range: tuple[float | None, float | None] = (None, None),
+        page: int = 1,
+        page_size: int = DEFAULT_PAGE_SIZE,
+    ) -> dict:
+        """
+        Run a query and return one page of ranked results with facet counts
+
+        :param query: free text; every word must prefix-match some token of the listing
+        :param filters: facet field -> accepted values (OR within a field, AND across fields)
+        :param price_range: inclusive (min, max) nightly price; None leaves that side open
+        :param capacity_range: inclusive (min, max) capacity; None leaves that side open
+        :param page: the 1-based page number
+        :param page_size: the number of results per page
+        :return: a dictionary with 'total', 'page', 'page_size', 'pages', 'results' and 'facets'
+        """
+        filters = {f: [str(v).strip().lower() for v in vals] for f, vals in (filters or {}).items() if vals}
+        for field in filters:
+            if field not in FACET_FIELDS:
+                raise ValueError(f"Cannot filter on {field}")
+        with self._lock:
+            return self._search(query, filters, price_range, capacity_range, page, page_size)
+
+    def _search(self, query: str, filters: dict[str, list[str]], price_range: tuple, capacity_range: tuple, page: int,
+                page_size: int) -> dict:
+        """
+        Run a query (call with the lock held). See search for the arguments.
+
+        :return: a dictionary with 'total', 'page', 'page_size', 'pages', 'results' and 'facets'
+        """
+        # Text and range constraints apply to every facet; each field's own filter is left out of its counts
+        base, scores = self._match_text(query)
+        for field, (lo, hi) in (("nightly_price", price_range), ("capacity", capacity_range)):
+            if lo is not None or hi is not None:
+                base &= self._range(field, lo, hi)
+        field_sets = {field: self._facet_union(field, values) for field, values in filters.items()}
+
+        matches = base
+        for postings in field_sets.values():
+            matches = matches & postings
+
+        facets = {}
+        for field in FACET_FIELDS:
+            scope = base
+            for other, postings in field_sets.items():
+                if other != field:
+                    scope = scope & postings
+            facets[field] = self._facet_counts(field, scope)
+
+        ranked = sorted(
+            matches,
+            key=lambda p: (-scores.get(p, 0.0), self._docs[p].get("nightly_price", 0), p),
+        )
+        page_size = max(1, int(page_size))
+        pages = max(1, math.ceil(len(ranked) / page_size))
+        page = min(max(1, int(page)), pages)
+        start = (page - 1) * page_size
+        return {
+            "total": len(ranked),
+            "page": page,
+            "page_size": page_size,
+            "pages": pages,
+            "results": [self._docs[p] for p in ranked[start:start + page_size]],
+            "facets": facets,
+        }
+
+    def _match_text(self, query: str) -> tuple[set[int], dict[int, float]]:
+        """
+        Return the positions matching every query word, and their relevance scores
+
+        :param query: the free-text query
+        :return: the matching positions and a position -> score mapping
+        """
+        words = _tokenize(query)
+        if not words:
+            return set(self._live), {}
+        if self._vocab_dirty:
+            self._vocab = sorted(self._postings)
+            self._vocab_dirty = False
+
+        n = max(len(self._live), 1)
+        result: set[int] | None = None
+        scores: dict[int, float] = {}
+        for word in words:
+            # A listing scores the best of the tokens the word prefixes
+            best: dict[int, float] = {}
+            i = bisect.bisect_left(self._vocab, word)
+            while i < len(self._vocab) and self._vocab[i].startswith(word):
+                token = self._vocab[i]
+                postings = self._postings[token]
+                weight = math.log(1 + n / len(postings)) * (EXACT_MATCH_BOOST if token == word else 1.0)
+                for p in postings:
+                    if best.get(p, 0.0) < weight:
+                        best[p] = weight
+                i += 1
+            result = set(best) if result is None else result & best.keys()
+            if not result:
+                return set(), {}
+            for p, weight in best.items():
+                scores[p] = scores.get(p, 0.0) + weight
+        return result, scores
+
+    def _range(self, field: str, lo: float | None, hi: float | None) -> set[int]:
+        """
+        Return the positions whose numeric field lies within [lo, hi]
+
+        :param field: the numeric field
+        :param lo: the minimum (inclusive), or None
+        :param hi: the maximum (inclusive), or None
+        :return: the matching positions
+        """
+        entries = self._ranges[field]
+        start = 0 if lo is None else bisect.bisect_left(entries, (float(lo), -1))
+        end = len(entries) if hi is None else bisect.bisect_right(entries, (float(hi), math.inf))
+        return {pos for _, pos in entries[start:end]}
+
+    def _facet_union(self, field: str, values: list[str]) -> set[int]:
+        """
+        Return the positions having any of the given values for a facet field
+
+        :param field: the facet field
+        :param values: the accepted values
+        :return: the matching positions
+        """
+        out: set[int] = set()
+        for value in values:
+            out |= self._facets.get(f"{field}={value}", set())
+        return out
+
+    def _facet_counts(self, field: str, scope: set[int]) -> dict[str, int]:
+        """
+        Count, for each value of a facet field, how many positions in scope have it
+
+        :param field: the facet field
+        :param scope: the positions to count within
+        :return: value -> count, most frequent first (zero counts omitted)
+        """
+        prefix = f"{field}="
+        counts = {}
+        for key, postings in self._facets.items():
+            if key.startswith(prefix):
+                c = len(postings & scope)
+                if c:
+                    counts[key[len(prefix):]] = c
+        return dict(sorted(counts.items(), key=lambda kv: (-kv[1], kv[0])))
+
+# ======================================================================================================================
+# HELPER FUNCTIONS (for internal use)
+# ======================================================================================================================
+
+_index: PropertySearchIndex | None = None
+_index_lock = threading.Lock()
+
+def _tokenize(text: str) -> list[str]:
+    """
+    Split text into lowercase alphanumeric words
+
+    :param text: the text
+    :return: the words
+    """
+    return _TOKEN_RE.findall(str(text or "").lower())
+
+def _doc_tokens(prop: dict) -> set[str]:
+    """
+    Return the distinct text tokens of a listing
+
+    :param prop: the listing
+    :return: the tokens
+    """
+    tokens: set[str] = set()
+    for field in TEXT_FIELDS:
+        value = prop.get(field)
+        for item in value if isinstance(value, list) else [value]:
+            tokens.update(_tokenize(item))
+    return tokens
+
+def _facet_keys(prop: dict) -> set[str]:
+    """
+    Return the 'field=value' facet keys of a listing
+
+    :param prop: the listing
+    :return: the facet keys
+    """
+    keys = set()
+    for field in FACET_FIELDS:
+        value = prop.get(field)
+        for item in value if isinstance(value, list) else [value]:
+            if item is not None and str(item).strip():
+                keys.add(f"{field}={str(item).strip().lower()}")
+    return keys
+
+# ======================================================================================================================
+# API-STYLE FUNCTIONS
+# ======================================================================================================================
+
+def _restore_index() -> PropertySearchIndex | None:
+    """
+    Load the index from its snapshot and replay the catalog changes made since. A snapshot from another catalog or
+    index schema, or one that fails to load or replay, is treated as missing.
+
+    :return: the index, or None if there is no usable snapshot
+    """
+    snapshot = read_snapshot("search")
+    if snapshot is None:
+        return None
+    meta, index = snapshot
+    if meta.get("catalog") != str(properties_service.PROPERTIES_DATA_PATH) \
+            or meta.get("schema") != INDEX_SCHEMA_VERSION or not isinstance(index, PropertySearchIndex):
+        return None
+    try:
+        if index.version > get_catalog_version() or not index.apply_changes(changes_since(index.version)):
+            return None
+    except Exception:
+        return None
+    return index
+
+def _dump_index() -> tuple[PropertySearchIndex, dict] | None:
+    """
+    Return the index for snapshot_service. The index pickles itself under its own lock, so no catalog change is
+    half-applied in the snapshot.
+
+    :return: (index, metadata), or None if the index is not built
+    """
+    with _index_lock:
+        index = _index
+    if index is None:
+        return None
+    return index, {"catalog": str(properties_service.PROPERTIES_DATA_PATH), "schema": INDEX_SCHEMA_VERSION}
+
+def build_search_index() -> PropertySearchIndex:
+    """
+    Build a fresh index over the catalog on disk
+
+    :return: the index
+    """
+    version = get_catalog_version()
+    index = PropertySearchIndex(load_properties_from_disk())
+    index.version = version
+    return index
+
+def get_search_index() -> PropertySearchIndex:
+    """
+    Return the process-wide index, brought up to date with the catalog change feed
+
+    :return: the index
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = _restore_index() or build_search_index()
+        elif get_catalog_version() != _index.version:
+            if not _index.apply_changes(changes_since(_index.version)):
+                _index = build_search_index()
+        return _index
+
+def search_properties(query: str = "", **kwargs) -> dict:
+    """
+    Search the catalog. See PropertySearchIndex.search for the arguments.
+
+    :param query: free text
+    :return: one page of results with facet counts
+    """
+    return get_search_index().search(query, **kwargs)
+
+register_snapshot("search", _dump_index)
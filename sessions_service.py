@@ -2,10 +2,13 @@ from __future__ import annotations
 import json, secrets, uuid
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Callable, Collection, Optional, Tuple
 
 from users_service import get_user_by_email, get_user_by_id, User
 from auth_service import verify_user_password
+from metrics_service import counter, histogram
+from profiling_service import profiled
+from storage_service import atomic_write_text, file_lock
 
 SESSIONS_PATH = Path(__file__).parent / "data" / "sessions.json"
 
@@ -14,6 +17,9 @@ Handles all sessions for the app. Does not do any authentication (uses authentic
 Does not do any direct user retrieval (uses users_service.py for this)
 """
 
+_STORAGE_SECONDS = histogram("storage_seconds", "Time spent reading or writing a JSON data file", ("file", "op"))
+_LOGINS = counter("logins_total", "Login attempts by result", ("result",))
+
 # ======================================================================================================================
 # HELPERS
 # ======================================================================================================================
@@ -26,6 +32,7 @@ def _now_iso() -> str:
     """
     return datetime.now().isoformat(timespec="seconds") + "Z"
 
+@_STORAGE_SECONDS.timed(file="sessions", op="load")
 def _load_all_sessions() -> list[dict]:
     """
       Loads all sessions from the sessions.json file
@@ -39,6 +46,7 @@ def _load_all_sessions() -> list[dict]:
     except json.decoder.JSONDecodeError:
         return []
 
+@_STORAGE_SECONDS.timed(file="sessions", op="save")
 def _save_all_sessions(rows: list[dict]) -> None:
     """
       Saves all sessions to the sessions.json file
@@ -46,8 +54,7 @@ def _save_all_sessions(rows: list[dict]) -> None:
       :param rows: a list of sessions
       :return: None
     """
-    SESSIONS_PATH.parent.mkdir(parents=True, exist_ok=True)
-    SESSIONS_PATH.write_text(json.dumps(rows, indent=2), encoding="utf-8")
+    atomic_write_text(SESSIONS_PATH, json.dumps(rows, indent=2))
 
 def _get_session_by_token(token: str) -> Optional[dict]:
     """
@@ -78,7 +85,6 @@ def create_session(user_id: str) -> dict:
       :param user_id: the user id
       :return: the created session
     """
-    rows = _load_all_sessions()
     row = {
         "session_id": str(uuid.uuid4()),
         "user_id": user_id,
@@ -88,10 +94,13 @@ def create_session(user_id: str) -> dict:
         "expires_at": None,
     }
 
-    rows.append(row)
-    _save_all_sessions(rows)
+    with file_lock(SESSIONS_PATH):
+        rows = _load_all_sessions()
+        rows.append(row)
+        _save_all_sessions(rows)
     return row
 
+@profiled("login")
 def login(email: str, password: str) -> Tuple[str, str]:
     """
       Verify the login credentials and creates a new session if verified
@@ -102,9 +111,12 @@ def login(email: str, password: str) -> Tuple[str, str]:
     """
     user = get_user_by_email(email)
     if not user:
+        _LOGINS.inc(result="unknown_email")
         raise ValueError("Invalid email")
     if not verify_user_password(user.id, password):
+        _LOGINS.inc(result="bad_password")
         raise ValueError("Invalid password")
+    _LOGINS.inc(result="ok")
     session = create_session(user.id)
     return session["token"], user.id
 
@@ -127,19 +139,40 @@ def logout(token: str) -> bool:
     :param token: the token
     :return: TRUE if the user was logged out; FALSE otherwise
     """
-    rows = _load_all_sessions()
-    changed = False
-    for i, row in enumerate(rows):
-        if row.get("token") == token and row.get("active"):
-            row["active"] = False
-            row["ended_at"] = _now_iso()
-            rows[i] = row
-            changed = True
-            break
-    if changed:
-        _save_all_sessions(rows)
+    with file_lock(SESSIONS_PATH):
+        rows = _load_all_sessions()
+        changed = False
+        for i, row in enumerate(rows):
+            if row.get("token") == token and row.get("active"):
+                row["active"] = False
+                row["ended_at"] = _now_iso()
+                rows[i] = row
+                changed = True
+                break
+        if changed:
+            _save_all_sessions(rows)
     return changed
 
+def remove_orphaned_sessions(live_user_ids: Callable[[], Collection[str]]) -> dict:
+    """
+    Remove the sessions of users that no longer exist, in one rewrite of sessions.json
+
+    :param live_user_ids: returns the ids of the existing users; called with the file locked, so a user created in the
+                          meantime cannot already have a session
+    :return: the number of sessions removed ('rows') and the bytes reclaimed ('bytes')
+    """
+    with file_lock(SESSIONS_PATH):
+        rows = _load_all_sessions()
+        if not rows:
+            return {"rows": 0, "bytes": 0}
+        live = set(live_user_ids())
+        kept = [r for r in rows if r.get("user_id") in live]
+        if len(kept) == len(rows):
+            return {"rows": 0, "bytes": 0}
+        before = SESSIONS_PATH.stat().st_size
+        _save_all_sessions(kept)
+        return {"rows": len(rows) - len(kept), "bytes": before - SESSIONS_PATH.stat().st_size}
+
 # ======================================================================================================================
 # TESTS
 # ======================================================================================================================
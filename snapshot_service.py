@@ -0,0 +1,251 @@
+from __future__ import annotations
+import atexit, json, os, struct, threading
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+
+from metrics_service import counter
+
+SNAPSHOTS_DIR = Path(__file__).parent / "data" / "snapshots"
+SNAPSHOT_INTERVAL_SECONDS = float(os.environ.get("SNAPSHOT_INTERVAL_SECONDS", "300"))
+
+MAGIC = b"AIRSNAP\x00"
+FORMAT_VERSION = 1
+
+"""
+Binary snapshots of the in-memory stores, so a cold start does not reparse every JSON file and rebuild every index.
+
+A snapshot file (data/snapshots/<store>.snap) is:
+  - MAGIC, then a 4-byte big-endian header length
+  - a JSON header: store, format version, creation time, the store's own metadata, payload length and SHA-256
+  - the payload: the store's state, pickled
+A snapshot whose magic, format, length or checksum does not match is treated as missing, and the store rebuilds from
+the JSON files as before. Snapshots are as trusted as the data files next to them; never load them from elsewhere.
+hashlib and pickle are imported on first use, so importing the services that register stores stays cheap.
+
+Stores register a dump function with register_snapshot(). start_snapshots() writes every registered store every
+SNAPSHOT_INTERVAL_SECONDS and once more at interpreter exit. On first use each store loads its snapshot and replays
+only what was written after it:
+  - the search index and the catalog resources replay the catalog change feed from the snapshot's version
+  - the interaction buffer parses only the records appended to interactions.json after the snapshot, after checking
+    (json_array_checkpoint / json_array_tail) that everything before them is byte-for-byte unchanged
+"""
+
+_LOADS = counter("snapshot_loads_total", "Snapshot loads by store and result", ("store", "result"))
+_WRITES = counter("snapshot_writes_total", "Snapshots written by store", ("store",))
+
+_dumpers: dict[str, Callable[[], tuple[object, dict] | None]] = {}
+_dumpers_lock = threading.Lock()
+_thread: threading.Thread | None = None
+_stop = threading.Event()
+_thread_lock = threading.Lock()
+
+# ======================================================================================================================
+# HELPER FUNCTIONS (for internal use)
+# ======================================================================================================================
+
+def _path(store: str) -> Path:
+    """
+    Return the snapshot file of a store
+
+    :param store: the store name
+    :return: the path
+    """
+    return SNAPSHOTS_DIR / f"{store}.snap"
+
+def _loop(interval: float) -> None:
+    """
+    Write every registered store each interval until stopped
+
+    :param interval: the seconds between snapshots
+    :return: None
+    """
+    while not _stop.wait(interval):
+        snapshot_all()
+
+def _on_exit() -> None:
+    """
+    Write a final snapshot of every store at interpreter exit if periodic snapshots are running
+
+    :return: None
+    """
+    if _thread is not None:
+        stop_snapshots()
+        snapshot_all()
+
+# ======================================================================================================================
+# API-STYLE FUNCTIONS
+# ======================================================================================================================
+
+def write_snapshot(store: str, state: object, meta: dict | None = None) -> Path:
+    """
+    Write a store's snapshot, replacing the previous one atomically
+
+    :param store: the store name
+    :param state: the state to save (must be picklable)
+    :param meta: JSON-serializable metadata the store needs to validate and replay the snapshot
+    :return: the snapshot path
+    """
+    import hashlib, pickle
+
+    payload = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+    header = json.dumps({
+        "store": store,
+        "format": FORMAT_VERSION,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "meta": meta or {},
+        "payload_bytes": len(payload),
+        "sha256": hashlib.sha256(payload).hexdigest(),
+    }).encode("utf-8")
+
+    path = _path(store)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with tmp.open("wb") as f:
+        f.write(MAGIC + struct.pack(">I", len(header)) + header)
+        f.write(payload)
+    os.replace(tmp, path)
+    _WRITES.inc(store=store)
+    return path
+
+def read_snapshot(store: str) -> tuple[dict, object] | None:
+    """
+    Load a store's snapshot, verifying its checksum
+
+    :param store: the store name
+    :return: (metadata, state), or None if there is no valid snapshot
+    """
+    import hashlib, pickle
+
+    try:
+        data = _path(store).read_bytes()
+    except FileNotFoundError:
+        _LOADS.inc(store=store, result="missing")
+        return None
+    try:
+        if not data.startswith(MAGIC):
+            raise ValueError("bad magic")
+        start = len(MAGIC) + 4
+        (header_len,) = struct.unpack(">I", data[len(MAGIC):start])
+        header = json.loads(data[start:start + header_len])
+        payload = data[start + header_len:]
+        if header.get("store") != store or header.get("format") != FORMAT_VERSION:
+            raise ValueError("wrong store or format")
+        if len(payload) != header["payload_bytes"] or hashlib.sha256(payload).hexdigest() != header["sha256"]:
+            raise ValueError("checksum mismatch")
+        state = pickle.loads(payload)
+    except Exception:
+        _LOADS.inc(store=store, result="corrupt")
+        return None
+    _LOADS.inc(store=store, result="loaded")
+    return header["meta"], state
+
+def json_array_checkpoint(data: bytes) -> tuple[int, str]:
+    """
+    Mark how much of a JSON array file a snapshot covers: everything before the closing bracket
+
+    :param data: the file contents
+    :return: (prefix length, SHA-256 of the prefix)
+    """
+    import hashlib
+
+    end = data.rstrip().rfind(b"]")
+    prefix = data[:max(end, 0)].rstrip()
+    return len(prefix), hashlib.sha256(prefix).hexdigest()
+
+def json_array_tail(data: bytes, prefix_len: int, prefix_sha256: str) -> list | None:
+    """
+    Parse only the elements appended to a JSON array file since json_array_checkpoint()
+
+    :param data: the current file contents
+    :param prefix_len: the prefix length from the checkpoint
+    :param prefix_sha256: the prefix checksum from the checkpoint
+    :return: the appended elements, or None if the covered part changed (the caller must reparse everything)
+    """
+    import hashlib
+
+    prefix = data[:prefix_len]
+    if len(prefix) != prefix_len or hashlib.sha256(prefix).hexdigest() != prefix_sha256:
+        return None
+    tail = data[prefix_len:].lstrip()
+    if tail.startswith(b","):
+        tail = tail[1:]
+    elif prefix.rstrip() != b"[" and tail.rstrip() != b"]":
+        return None
+    try:
+        rows = json.loads(b"[" + tail)
+    except json.JSONDecodeError:
+        return None
+    return rows if isinstance(rows, list) else None
+
+def register_snapshot(store: str, dump: Callable[[], tuple[object, dict] | None]) -> None:
+    """
+    Register a store to be included in snapshot_all()
+
+    :param store: the store name
+    :param dump: returns (state, metadata) for write_snapshot, or None when there is nothing to save
+    :return: None
+    """
+    with _dumpers_lock:
+        _dumpers[store] = dump
+
+def snapshot_all() -> dict[str, bool]:
+    """
+    Write a snapshot of every registered store. A failing store does not affect the others.
+
+    :return: store name -> TRUE if a snapshot was written
+    """
+    with _dumpers_lock:
+        dumpers = dict(_dumpers)
+    out = {}
+    for store, dump in dumpers.items():
+        try:
+            dumped = dump()
+            if dumped is not None:
+                write_snapshot(store, *dumped)
+            out[store] = dumped is not None
+        except Exception:
+            out[store] = False
+    return out
+
+def start_snapshots(interval: float | None = None) -> None:
+    """
+    Start writing snapshots periodically in a background thread, and at interpreter exit. Does nothing if running.
+
+    :param interval: the seconds between snapshots (defaults to SNAPSHOT_INTERVAL_SECONDS)
+    :return: None
+    """
+    global _thread
+    with _thread_lock:
+        if _thread is not None:
+            return
+        _stop.clear()
+        _thread = threading.Thread(
+            target=_loop, args=(interval or SNAPSHOT_INTERVAL_SECONDS,), name="snapshots", daemon=True
+        )
+        _thread.start()
+        atexit.register(_on_exit)
+
+def stop_snapshots() -> None:
+    """
+    Stop periodic snapshots
+
+    :return: None
+    """
+    global _thread
+    with _thread_lock:
+        thread, _thread = _thread, None
+        if thread is None:
+            return
+        _stop.set()
+    thread.join(timeout=5)
+    atexit.unregister(_on_exit)
+
+def remove_snapshots() -> None:
+    """
+    Delete every snapshot file. For dev/testing purposes.
+
+    :return: None
+    """
+    for path in SNAPSHOTS_DIR.glob("*.snap"):
+        path.unlink(missing_ok=True)
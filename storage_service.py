@@ -0,0 +1,88 @@
+from __future__ import annotations
+import os, threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+"""
+Shared low-level helpers for the JSON data files. Services keep owning their own files; this module only provides
+the primitives they need to change those files safely:
+  - file_lock: an exclusive lock held across a read-modify-write, both between threads of this process and between
+    processes (advisory flock on a '<file>.lock' sidecar where available)
+  - atomic_write_text: write to a temporary file and rename it over the target, so readers never see a partial file
+"""
+
+_thread_locks: dict[str, threading.RLock] = {}
+_thread_locks_guard = threading.Lock()
+_held = threading.local()
+
+# ======================================================================================================================
+# HELPERS
+# ======================================================================================================================
+
+def _thread_lock(key: str) -> threading.RLock:
+    """
+    Return the in-process lock for a path, creating it on first use
+
+    :param key: the resolved path
+    :return: the lock
+    """
+    with _thread_locks_guard:
+        lock = _thread_locks.get(key)
+        if lock is None:
+            lock = _thread_locks[key] = threading.RLock()
+        return lock
+
+# ======================================================================================================================
+# API-STYLE FUNCTIONS
+# ======================================================================================================================
+
+@contextmanager
+def file_lock(path: Path) -> Iterator[None]:
+    """
+    Hold an exclusive lock on a data file for the duration of the block. Re-entrant within a thread.
+
+    :param path: the data file to lock
+    :return: a context manager
+    """
+    key = str(Path(path).resolve())
+    lock = _thread_lock(key)
+    with lock:
+        depth = getattr(_held, key, 0)
+        if depth or fcntl is None:
+            setattr(_held, key, depth + 1)
+            try:
+                yield
+            finally:
+                setattr(_held, key, depth)
+            return
+
+        lock_path = Path(key + ".lock")
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(lock_path, "a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            setattr(_held, key, 1)
+            try:
+                yield
+            finally:
+                setattr(_held, key, 0)
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def atomic_write_text(path: Path, text: str) -> None:
+    """
+    Replace the contents of a file atomically
+
+    :param path: the file to write
+    :param text: the new contents
+    :return: None
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
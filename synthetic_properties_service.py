@@ -0,0 +1,215 @@
+from __future__ import annotations
+import argparse
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+
+from properties_service import write_properties_stream
+
+DEFAULT_SEED = 8431
+DEFAULT_CHUNK_SIZE = 50_000
+
+# (location, lat, lon, relative popularity, environment tags typical for the town)
+TOWNS = [
+    ("Tofino", 49.1529, -125.9066, 3.0, ["beach", "ocean", "surf"]),
+    ("Ucluelet", 48.9420, -125.5463, 1.0, ["beach", "ocean", "quiet"]),
+    ("Victoria", 48.4284, -123.3656, 3.0, ["city", "ocean", "historic"]),
+    ("Vancouver", 49.2827, -123.1207, 6.0, ["city", "beach", "nightlife"]),
+    ("Whistler", 50.1163, -122.9574, 3.0, ["mountain", "ski-in/ski-out", "adventure"]),
+    ("Kelowna", 49.8880, -119.4960, 3.0, ["lake", "wine country", "beach"]),
+    ("Penticton", 49.4991, -119.5937, 1.5, ["lake", "wine country"]),
+    ("Banff", 51.1784, -115.5708, 3.0, ["mountain", "scenic", "wildlife"]),
+    ("Canmore", 51.0884, -115.3479, 1.5, ["mountain", "adventure"]),
+    ("Jasper", 52.8737, -118.0814, 1.5, ["mountain", "wildlife", "remote"]),
+    ("Calgary", 51.0447, -114.0719, 4.0, ["city", "urban"]),
+    ("Edmonton", 53.5461, -113.4938, 3.0, ["city", "urban"]),
+    ("Saskatoon", 52.1332, -106.6700, 1.5, ["city", "quiet"]),
+    ("Winnipeg", 49.8951, -97.1384, 2.0, ["city", "historic"]),
+    ("Toronto", 43.6532, -79.3832, 8.0, ["city", "nightlife", "downtown"]),
+    ("Muskoka", 45.0370, -79.3092, 2.5, ["lake", "quiet", "rustic"]),
+    ("Niagara Falls", 43.0896, -79.0849, 2.0, ["waterfall", "scenic", "wine country"]),
+    ("Ottawa", 45.4215, -75.6972, 3.0, ["city", "historic"]),
+    ("Montreal", 45.5017, -73.5673, 6.0, ["city", "nightlife", "historic"]),
+    ("Mont-Tremblant", 46.1185, -74.5962, 2.0, ["mountain", "lake", "ski-in/ski-out"]),
+    ("Quebec City", 46.8139, -71.2080, 3.0, ["city", "historic", "charming"]),
+    ("Halifax", 44.6488, -63.5752, 2.0, ["city", "ocean", "coastal"]),
+    ("Charlottetown", 46.2382, -63.1311, 1.0, ["beach", "coastal", "quiet"]),
+    ("St. John's", 47.5615, -52.7126, 1.0, ["city", "ocean", "colorful"]),
+    ("Whitehorse", 60.7212, -135.0568, 0.5, ["wilderness", "northern lights", "remote"]),
+    ("Yellowknife", 62.4540, -114.3718, 0.5, ["lake", "northern lights", "remote"]),
+]
+
+# (type, relative frequency, price multiplier, mean capacity)
+TYPES = [
+    ("house", 8.0, 1.3, 6.0),
+    ("apartment", 6.0, 0.9, 3.0),
+    ("condo", 5.0, 1.0, 3.5),
+    ("cabin", 4.0, 1.0, 4.5),
+    ("cottage", 3.0, 1.1, 5.0),
+    ("chalet", 1.5, 1.6, 7.0),
+    ("loft", 1.5, 1.1, 2.5),
+    ("villa", 0.5, 2.5, 9.0),
+]
+
+# (feature, probability a listing has it)
+FEATURES = [
+    ("wifi", 0.95), ("kitchen", 0.8), ("fireplace", 0.35), ("balcony", 0.25), ("garden", 0.2),
+    ("hot tub", 0.15), ("gym", 0.1), ("pool", 0.1), ("parking", 0.6), ("washer", 0.5),
+    ("bbq", 0.3), ("air conditioning", 0.4),
+]
+
+# (tag, probability) for tags that are independent of the town
+GENERIC_TAGS = [
+    ("quiet", 0.25), ("family-friendly", 0.3), ("pet-friendly", 0.2), ("modern", 0.2), ("budget", 0.15),
+    ("luxury", 0.08), ("romantic", 0.1), ("rustic", 0.1),
+]
+
+MEDIAN_PRICE = 150
+PRICE_SIGMA = 0.45
+LOCATION_SPREAD_DEG = 0.05
+
+"""
+Offline, deterministic generator for large synthetic catalogs, used to load-test the recommender, map and explore
+paths. Listings have exactly the schema produced by the LLM (properties_service.PROPERTY_SCHEMA).
+
+Every column is drawn with NumPy for a whole chunk at once from a seeded generator: towns by popularity, coordinates
+normally scattered around the town centre, log-normal prices scaled by property type and capacity, Poisson capacities
+per type, and features/tags as independent Bernoulli draws. Chunks are written straight to the catalog file, so memory
+use is bounded by the chunk size rather than the catalog size. The same (n, seed, chunk_size) always yields the same
+catalog.
+"""
+
+# ======================================================================================================================
+# HELPER FUNCTIONS (for internal use)
+# ======================================================================================================================
+
+def _names_for_codes(codes: np.ndarray, names: list[str], cache: dict[int, list[str]]) -> list[list[str]]:
+    """
+    Convert bitmask codes to lists of names, memoizing each distinct combination
+
+    :param codes: one bitmask per listing (bit j set = names[j] present)
+    :param names: the names for each bit
+    :param cache: the memo of code -> list of names, shared across chunks
+    :return: one list of names per listing
+    """
+    out = []
+    for code in codes.tolist():
+        lst = cache.get(code)
+        if lst is None:
+            lst = [names[j] for j in range(len(names)) if code >> j & 1]
+            cache[code] = lst
+        out.append(lst)
+    return out
+
+def _bitmask(rng: np.random.Generator, n: int, probs: np.ndarray) -> np.ndarray:
+    """
+    Draw independent Bernoulli columns and pack each row into an integer bitmask
+
+    :param rng: the random generator
+    :param n: the number of rows
+    :param probs: the probability of each column
+    :return: the packed bitmasks
+    """
+    mask = rng.random((n, len(probs))) < probs
+    return mask.astype(np.int64) @ (np.int64(1) << np.arange(len(probs), dtype=np.int64))
+
+# ======================================================================================================================
+# API-STYLE FUNCTIONS
+# ======================================================================================================================
+
+def generate_catalog(n: int, seed: int = DEFAULT_SEED, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[list[dict]]:
+    """
+    Generate n synthetic listings in chunks
+
+    :param n: the number of listings
+    :param seed: the random seed
+    :param chunk_size: the number of listings per chunk
+    :return: an iterator over lists of listings
+    """
+    rng = np.random.default_rng(seed)
+
+    town_names = [t[0] for t in TOWNS]
+    town_lat = np.array([t[1] for t in TOWNS])
+    town_lon = np.array([t[2] for t in TOWNS])
+    town_p = np.array([t[3] for t in TOWNS])
+    town_p /= town_p.sum()
+
+    type_names = [t[0] for t in TYPES]
+    type_p = np.array([t[1] for t in TYPES])
+    type_p /= type_p.sum()
+    type_mult = np.array([t[2] for t in TYPES])
+    type_cap = np.array([t[3] for t in TYPES])
+
+    feature_names = [f[0] for f in FEATURES]
+    feature_p = np.array([f[1] for f in FEATURES])
+
+    # Town tags: the town's first (environment) tag is very likely, the others less so; generic tags follow
+    tag_names = [t[0] for t in GENERIC_TAGS]
+    generic_p = np.array([t[1] for t in GENERIC_TAGS])
+    town_tag_cache: dict[tuple[int, int], list[str]] = {}
+    generic_cache: dict[int, list[str]] = {}
+    feature_cache: dict[int, list[str]] = {}
+
+    for start in range(0, n, chunk_size):
+        m = min(chunk_size, n - start)
+
+        town = rng.choice(len(TOWNS), size=m, p=town_p)
+        kind = rng.choice(len(TYPES), size=m, p=type_p)
+        lat = np.round(town_lat[town] + rng.normal(0.0, LOCATION_SPREAD_DEG, m), 4)
+        lon = np.round(town_lon[town] + rng.normal(0.0, LOCATION_SPREAD_DEG, m), 4)
+        capacity = np.clip(rng.poisson(type_cap[kind]), 1, 16)
+        # Bigger places cost more; round to the nearest $5 like real listings
+        price = MEDIAN_PRICE * type_mult[kind] * np.sqrt(capacity / 4.0) * rng.lognormal(0.0, PRICE_SIGMA, m)
+        price = (np.clip(np.round(price / 5.0) * 5.0, 40, 5000)).astype(np.int64)
+
+        features = _names_for_codes(_bitmask(rng, m, feature_p), feature_names, feature_cache)
+        town_tag_bits = _bitmask(rng, m, np.array([0.95, 0.6, 0.4]))
+        generic = _names_for_codes(_bitmask(rng, m, generic_p), tag_names, generic_cache)
+
+        chunk = []
+        for i, (t, k, la, lo, c, pr, bits) in enumerate(zip(
+            town.tolist(), kind.tolist(), lat.tolist(), lon.tolist(),
+            capacity.tolist(), price.tolist(), town_tag_bits.tolist(),
+        )):
+            key = (t, bits)
+            tags = town_tag_cache.get(key)
+            if tags is None:
+                env_tags = TOWNS[t][4]
+                tags = [env_tags[j] for j in range(len(env_tags)) if bits >> j & 1]
+                town_tag_cache[key] = tags
+            chunk.append({
+                "property_id": f"syn{start + i}",
+                "location": town_names[t],
+                "type": type_names[k],
+                "nightly_price": pr,
+                "features": features[i],
+                "tags": tags + generic[i],
+                "capacity": c,
+                "lat": la,
+                "lon": lo,
+            })
+        yield chunk
+
+def write_synthetic_catalog(n: int, seed: int = DEFAULT_SEED, path: Path | None = None,
+                            chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Generate n synthetic listings and stream them into the catalog file, replacing it
+
+    :param n: the number of listings
+    :param seed: the random seed
+    :param path: the catalog path (defaults to properties_service.PROPERTIES_DATA_PATH)
+    :param chunk_size: the number of listings generated and written at a time
+    :return: the number of listings written
+    """
+    return write_properties_stream(generate_catalog(n, seed=seed, chunk_size=chunk_size), path=path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic property catalog for load testing")
+    parser.add_argument("n", type=int, help="number of listings")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--path", type=Path, default=None, help="output file (defaults to data/properties.json)")
+    args = parser.parse_args()
+    written = write_synthetic_catalog(args.n, seed=args.seed, path=args.path, chunk_size=args.chunk_size)
+    print(f"Wrote {written} listings")
@@ -0,0 +1,191 @@
+from __future__ import annotations
+import threading, time
+from datetime import datetime
+
+from interactions_service import EVENT_WEIGHTS, get_interaction_buffer, subscribe_interactions, unsubscribe_interactions
+
+# Sliding windows (name -> length in seconds); each is split into BUCKETS_PER_WINDOW ring-buffer buckets
+WINDOWS = {"1h": 3600, "24h": 86400, "7d": 7 * 86400}
+BUCKETS_PER_WINDOW = 60
+DEFAULT_WINDOW = "24h"
+
+"""
+Trending / popularity counters over the interaction stream.
+
+For every window (last hour, day and week) a TrendingCounters object keeps a ring of BUCKETS_PER_WINDOW buckets, each
+covering window / BUCKETS_PER_WINDOW seconds (1 minute, 24 minutes and 2.8 hours). A bucket maps property ids to
+[views, saves]. Logging an event increments one bucket per window; a bucket is cleared when the ring wraps around to
+it, so memory is bounded by the number of distinct listings touched within a week. A window's counts are the sum of
+its live buckets, so they slide with bucket granularity (at most one bucket of events too many at the oldest edge).
+
+The process-wide counters (get_trending()) are seeded once from interactions.json and then follow every log_view /
+log_save of this process, so queries never rescan the interactions file. Popularity is views * 1 + saves * 3 (the
+interaction weights).
+"""
+
+class TrendingCounters:
+    def __init__(self, windows: dict[str, int] | None = None, buckets: int = BUCKETS_PER_WINDOW):
+        self.windows = dict(windows or WINDOWS)
+        self.buckets = buckets
+        self._width = {name: length / buckets for name, length in self.windows.items()}
+        # window -> ring of [bucket index, {property id: [views, saves]}]
+        self._rings: dict[str, list[list]] = {name: [[-1, {}] for _ in range(buckets)] for name in self.windows}
+        self._lock = threading.Lock()
+
+    def add(self, property_id: str, event: str, ts: float | None = None, count: int = 1) -> None:
+        """
+        Count an event
+
+        :param property_id: the property's id
+        :param event: 'view' or 'save'
+        :param ts: the event's time as a UNIX timestamp (defaults to now)
+        :param count: the number of events
+        :return: None
+        """
+        if event not in EVENT_WEIGHTS:
+            raise ValueError("event must be 'view' or 'save'")
+        ts = time.time() if ts is None else ts
+        slot_of = 0 if event == "view" else 1
+        with self._lock:
+            for name, ring in self._rings.items():
+                idx = int(ts // self._width[name])
+                bucket = ring[idx % self.buckets]
+                if bucket[0] != idx:
+                    if bucket[0] > idx:
+                        continue  # older than the window
+                    bucket[0], bucket[1] = idx, {}
+                bucket[1].setdefault(property_id, [0, 0])[slot_of] += count
+
+    def counts(self, window: str = DEFAULT_WINDOW, now: float | None = None) -> dict[str, tuple[int, int]]:
+        """
+        Return the views and saves of every listing within a window
+
+        :param window: a key of WINDOWS
+        :param now: the end of the window as a UNIX timestamp (defaults to now)
+        :return: property id -> (views, saves)
+        """
+        if window not in self.windows:
+            raise ValueError(f"Unknown window {window}; expected one of {', '.join(self.windows)}")
+        now = time.time() if now is None else now
+        current = int(now // self._width[window])
+        out: dict[str, list[int]] = {}
+        with self._lock:
+            for idx, counts in self._rings[window]:
+                if current - self.buckets < idx <= current:
+                    for pid, (views, saves) in counts.items():
+                        total = out.setdefault(pid, [0, 0])
+                        total[0] += views
+                        total[1] += saves
+        return {pid: (v, s) for pid, (v, s) in out.items()}
+
+    def popularity(self, window: str = DEFAULT_WINDOW, now: float | None = None) -> dict[str, float]:
+        """
+        Return the weighted popularity (views * 1 + saves * 3) of every listing within a window
+
+        :param window: a key of WINDOWS
+        :param now: the end of the window as a UNIX timestamp (defaults to now)
+        :return: property id -> popularity
+        """
+        w_view, w_save = EVENT_WEIGHTS["view"], EVENT_WEIGHTS["save"]
+        return {pid: float(v * w_view + s * w_save) for pid, (v, s) in self.counts(window, now).items()}
+
+    def trending(self, window: str = DEFAULT_WINDOW, k: int = 10, now: float | None = None) -> list[dict]:
+        """
+        Return the k most popular listings within a window
+
+        :param window: a key of WINDOWS
+        :param k: the number of listings
+        :param now: the end of the window as a UNIX timestamp (defaults to now)
+        :return: dictionaries with property_id, views, saves and popularity, most popular first
+        """
+        counts = self.counts(window, now)
+        w_view, w_save = EVENT_WEIGHTS["view"], EVENT_WEIGHTS["save"]
+        ranked = sorted(counts.items(), key=lambda kv: (-(kv[1][0] * w_view + kv[1][1] * w_save), kv[0]))
+        return [
+            {"property_id": pid, "views": v, "saves": s, "popularity": float(v * w_view + s * w_save)}
+            for pid, (v, s) in ranked[:k]
+        ]
+
+# ======================================================================================================================
+# HELPER FUNCTIONS (for internal use)
+# ======================================================================================================================
+
+_counters: TrendingCounters | None = None
+_counters_lock = threading.Lock()
+
+def _parse_ts(ts: str | None) -> float | None:
+    """
+    Convert an interaction timestamp (ISO 8601, local time with a trailing 'Z') to a UNIX timestamp
+
+    :param ts: the timestamp string
+    :return: the UNIX timestamp, or None if it cannot be parsed
+    """
+    try:
+        return datetime.fromisoformat(str(ts).rstrip("Z")).timestamp()
+    except ValueError:
+        return None
+
+def _on_interaction(rec: dict) -> None:
+    """
+    Count a freshly logged interaction
+
+    :param rec: the interaction record
+    :return: None
+    """
+    counters = _counters
+    if counters is not None and rec.get("event") in EVENT_WEIGHTS:
+        counters.add(rec.get("property_id"), rec["event"], _parse_ts(rec.get("ts")), rec.get("count", 1))
+
+# ======================================================================================================================
+# API-STYLE FUNCTIONS
+# ======================================================================================================================
+
+def get_trending() -> TrendingCounters:
+    """
+    Return the process-wide counters, seeding them from interactions.json on first use
+
+    :return: the counters
+    """
+    global _counters
+    with _counters_lock:
+        if _counters is None:
+            counters = TrendingCounters()
+            horizon = time.time() - max(counters.windows.values())
+            for property_id, event, ts, count in get_interaction_buffer().since(horizon, counts=True):
+                if event in EVENT_WEIGHTS:
+                    counters.add(property_id, event, ts, count)
+            _counters = counters
+            subscribe_interactions(_on_interaction)
+        return _counters
+
+def trending_properties(window: str = DEFAULT_WINDOW, k: int = 10) -> list[dict]:
+    """
+    Return the k most popular listings within a window (see TrendingCounters.trending)
+
+    :param window: '1h', '24h' or '7d'
+    :param k: the number of listings
+    :return: dictionaries with property_id, views, saves and popularity
+    """
+    return get_trending().trending(window, k)
+
+def popularity_scores(window: str = DEFAULT_WINDOW) -> dict[str, float]:
+    """
+    Return the popularity of every listing with activity within a window, scaled to [0, 1]
+
+    :param window: '1h', '24h' or '7d'
+    :return: property id -> popularity (the most popular listing scores 1)
+    """
+    raw = get_trending().popularity(window)
+    top = max(raw.values(), default=0.0)
+    return {pid: p / top for pid, p in raw.items()} if top else {}
+
+def reset_trending() -> None:
+    """
+    Drop the process-wide counters. For dev/testing purposes.
+
+    :return: None
+    """
+    global _counters
+    with _counters_lock:
+        unsubscribe_interactions(_on_interaction)
+        _counters = None
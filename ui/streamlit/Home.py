@@ -11,9 +11,26 @@ from sessions_service import login, get_current_user, logout
 st.set_page_config(page_title="Summer Home Recommender", layout="centered")
 
 from properties_service import ensure_properties
-
-with st.spinner("Preparing property listings…"):
-    _ = ensure_properties()
+from resources_service import get_catalog_resources
+from purge_service import start_purge
+from snapshot_service import start_snapshots
+
+# Snapshot the in-memory stores periodically and on shutdown so the next start can skip reparsing (no-op on reruns)
+start_snapshots()
+# Remove the sessions and interactions of deleted users in the background (no-op on reruns)
+start_purge()
+
+# Reruns read the shared catalog; the LLM is only involved when there is no catalog yet
+if not len(get_catalog_resources()):
+    with st.spinner("Preparing property listings…"):
+        # Listings are streamed from the LLM and saved once the stream completes; show them as they arrive
+        progress = st.empty()
+
+        def _show_listing(prop: dict, count: int) -> None:
+            progress.caption(f"{count} listings ready — latest: {prop['location']} ({prop['type']}, ${prop['nightly_price']})")
+
+        _ = ensure_properties(stream=True, on_listing=_show_listing)
+        progress.empty()
 
 # HELPER FUNCTIONS
 def is_authed() -> bool:
@@ -1,9 +1,9 @@
 import streamlit as st
 import sys, pathlib
-import pandas as pd
 
 from interactions_service import log_save, get_user_interactions, log_view
-from properties_service import ensure_properties
+from resources_service import get_catalog_resources
+from search_service import get_search_index
 
 ROOT = pathlib.Path(__file__).resolve().parents[2]
 if str(ROOT) not in sys.path:
@@ -25,30 +25,81 @@ if not user:
 
 st.caption(f"You are logged in as {getattr(user, 'first_name', '')} {getattr(user, 'last_name', '')} — {user.email}")
 
-# ---- Load and show properties ----
+# ---- Search and filter properties ----
 
-props = ensure_properties()
-if not props:
+# Shared by every session of this process; only rebuilt when the catalog changes
+resources = get_catalog_resources(generate=True)
+if not len(resources):
     st.warning("No properties available.")
     st.stop()
+index = get_search_index()
+
+query = st.text_input("Search", placeholder="e.g. tofino cabin, hot tub, lake", key="explore_query")
+all_facets = index.search(query, page_size=1)["facets"]
+
+fcol1, fcol2, fcol3 = st.columns(3)
+with fcol1:
+    types = st.multiselect("Type", options=list(all_facets["type"]), key="explore_types")
+with fcol2:
+    tags = st.multiselect("Tags", options=list(all_facets["tags"]), key="explore_tags")
+with fcol3:
+    features = st.multiselect("Features", options=list(all_facets["features"]), key="explore_features")
+
+rcol1, rcol2 = st.columns(2)
+with rcol1:
+    price = st.slider("Nightly price", min_value=0, max_value=2000, value=(0, 2000), step=10, key="explore_price")
+with rcol2:
+    min_capacity = st.number_input("Guests", min_value=0, max_value=50, value=0, step=1, key="explore_guests")
+
+filters = {"type": types, "tags": tags, "features": features}
+price_range = (price[0], None if price[1] >= 2000 else price[1])
+capacity_range = (min_capacity or None, None)
+
+# Go back to the first page whenever the search itself changes
+signature = repr((query, filters, price_range, capacity_range))
+if st.session_state.get("explore_signature") != signature:
+    st.session_state["explore_signature"] = signature
+    st.session_state["explore_page"] = 1
+
+result = index.search(
+    query,
+    filters=filters,
+    price_range=price_range,
+    capacity_range=capacity_range,
+    page=st.session_state["explore_page"],
+)
+st.caption(f"{result['total']} matching properties — page {result['page']} of {result['pages']}")
+
+pcol1, pcol2, _ = st.columns([1, 1, 4])
+with pcol1:
+    if st.button("Previous", disabled=result["page"] <= 1):
+        st.session_state["explore_page"] = result["page"] - 1
+        st.rerun()
+with pcol2:
+    if st.button("Next", disabled=result["page"] >= result["pages"]):
+        st.session_state["explore_page"] = result["page"] + 1
+        st.rerun()
+
+# Only the current page is rendered, so the cost of this widget does not grow with the catalog
+props = result["results"]
+if not props:
+    st.info("No properties match your search.")
+    st.stop()
 
-labels = [f"{p['property_id']} — {p['location']} (${p['nightly_price']})" for p in props]
-
-idx = st.selectbox(
+prop_id = st.selectbox(
     "Choose a place to save",
-    options=range(len(props)),
-    format_func=lambda i: labels[i],
+    options=[p["property_id"] for p in props],
+    format_func=resources.label,
     index=None,
     placeholder="— Select a property —",
-    key="prop_select_idx",
+    key="prop_select_id",
 )
 
-if idx is None:
+if prop_id is None:
     st.info("Pick a property to see details.")
     st.stop()
 
-selected = props[idx]
-prop_id = selected["property_id"]
+selected = resources.get(prop_id) or index.get(prop_id)
 
 st.subheader("Selected property")
 st.markdown(
@@ -84,9 +135,6 @@ with st.expander("Your recent interactions"):
 st.divider()
 st.subheader("Your saved properties")
 
-props = ensure_properties()
-by_id = {p["property_id"]: p for p in props}
-
 events = [r for r in get_user_interactions(user.id) if r.get("event") == "save"]
 latest = {}
 for r in events:
@@ -94,7 +142,7 @@ for r in events:
     if pid not in latest or r["ts"] > latest[pid]["ts"]:
         latest[pid] = r
 
-saved_props = [by_id[pid] for pid in latest.keys() if pid in by_id]
+saved_props = [p for p in (resources.get(pid) for pid in latest.keys()) if p]
 
 if not saved_props:
     st.caption("You haven’t saved any places yet.")
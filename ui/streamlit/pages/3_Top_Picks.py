@@ -2,7 +2,7 @@ import streamlit as st
 import sys, pathlib
 import pandas as pd
 
-from recommender_service import produce_top_matches
+from picks_scheduler_service import get_scheduler
 from sessions_service import get_current_user
 
 ROOT = pathlib.Path(__file__).resolve().parents[2]
@@ -25,8 +25,15 @@ st.caption(f"You are logged in as {getattr(user, 'first_name', '')} {getattr(use
 
 # ---- Load and show properties ----
 
-with st.spinner("Computing your top picks..."):
-    props = produce_top_matches(user, n=5)
+# Picks are recomputed in the background when the profile, interactions or catalog change; show the latest ones
+scheduler = get_scheduler()
+result = scheduler.latest(user.id)
+if result is None:
+    with st.spinner("Computing your top picks..."):
+        result = scheduler.compute_now(user)
+elif scheduler.is_pending(user.id):
+    st.caption("Refreshing your picks… reload the page in a moment to see the update.")
+props = result.picks
 
 df = pd.DataFrame(props)
 
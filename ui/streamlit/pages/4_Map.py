@@ -1,9 +1,8 @@
-import sys, pathlib
+import sys, pathlib, math
 import streamlit as st
-import json
 
-from properties_service import load_properties_from_disk
-from visualization_service import get_map_dataframe
+from geo_service import properties_within_radius
+from visualization_service import MAX_ZOOM, MIN_ZOOM, get_map_pyramid, zoom_for_span
 
 ROOT = pathlib.Path(__file__).resolve().parents[2]
 if str(ROOT) not in sys.path:
@@ -22,17 +21,44 @@ if not user:
     st.warning("You must be logged in to view the map. Go to Home to log in.")
     st.stop()
 
-@st.cache_data(show_spinner=False)
-def _map_df():
-    return get_map_dataframe()
+# Clusters for every zoom level are built once per catalog version and shared by all sessions
+pyramid = get_map_pyramid()
+if not len(pyramid):
+    st.error("No mappable rows. Ensure your properties have numeric 'latitude' and 'longitude' attributes.")
+    st.stop()
+
+ANYWHERE = "— All listings —"
+col1, col2 = st.columns(2)
+with col1:
+    center = st.selectbox("Center on", [ANYWHERE, *sorted(pyramid.location_centers)])
+with col2:
+    radius_km = st.slider("Radius (km)", min_value=1, max_value=500, value=50, disabled=center == ANYWHERE)
+detail = st.slider("Detail", min_value=-2, max_value=3, value=0, help="Zoom in or out from the default view.")
+
+# The viewport is either every listing or the box around the chosen radius
+if center == ANYWHERE:
+    min_lat, max_lat, min_lon, max_lon = pyramid.bounds()
+else:
+    lat, lon = pyramid.location_centers[center]
+    dlat = radius_km / 111.0
+    dlon = radius_km / (111.0 * max(math.cos(math.radians(lat)), 0.01))
+    min_lat, max_lat, min_lon, max_lon = lat - dlat, lat + dlat, lon - dlon, lon + dlon
+zoom = min(max(zoom_for_span(max_lon - min_lon) + detail, MIN_ZOOM), MAX_ZOOM)
+
+df = pyramid.layer(min_lat, max_lat, min_lon, max_lon, zoom)
+if center != ANYWHERE and not df.empty and df["kind"].iloc[0] == "point":
+    nearby = {pid for pid, _ in properties_within_radius(lat, lon, radius_km)}
+    df = df[df["property_id"].isin(nearby)]
 
-df = _map_df()
 if df.empty:
-    st.error("No mappable rows. Ensure your properties have numeric 'latitude' and 'longitude' attributes.")
+    st.info("No properties in this area.")
     st.stop()
 
-print(df)
-st.map(df, latitude="lat", longitude="lon")
+if df["kind"].iloc[0] == "cluster":
+    st.caption(f"{int(df['count'].sum())} properties shown as {len(df)} clusters. Increase the detail to see listings.")
+else:
+    st.caption(f"{len(df)} properties shown")
+st.map(df, latitude="lat", longitude="lon", size="size", zoom=zoom)
 
 with st.expander("Shown points (first 50)"):
-    st.dataframe(df.head(50), use_container_width=True, hide_index=True)
\ No newline at end of file
+    st.dataframe(df.drop(columns=["size", "kind"]).head(50), use_container_width=True, hide_index=True)
@@ -0,0 +1,125 @@
+import streamlit as st
+import sys, pathlib
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from metrics_service import is_enabled, render_prometheus, reset_metrics, set_enabled, snapshot, write_prometheus
+from profiling_service import clear_captures, get_sample_rate, is_profiling, list_captures, set_profiling
+from purge_service import last_purge_report, purge_orphans
+from sessions_service import get_current_user
+
+# On this page, logged-in users can see where the app spends its time (metrics recorded by this server process).
+
+st.title("Admin — Metrics")
+
+# ---- Authentication gate ----
+token = st.session_state.get("token")
+user = get_current_user(token) if token else None
+if not user:
+    st.warning("You must be logged in to view metrics.")
+    st.write("Go to **Home** to sign up or log in.")
+    st.stop()
+
+enabled = st.toggle("Record metrics", value=is_enabled())
+if enabled != is_enabled():
+    set_enabled(enabled)
+
+rows = snapshot()
+timings = [r for r in rows if r["kind"] == "histogram"]
+values = [r for r in rows if r["kind"] != "histogram"]
+
+def _labels(r: dict) -> str:
+    return ", ".join(f"{k}={v}" for k, v in r["labels"].items())
+
+def _ms(seconds) -> str:
+    return "—" if seconds is None else f"{seconds * 1000:.1f}"
+
+st.subheader("Latencies")
+if not timings:
+    st.caption("Nothing recorded yet.")
+else:
+    st.dataframe(
+        [
+            {
+                "Metric": r["name"],
+                "Labels": _labels(r),
+                "Calls": r["count"],
+                "Total (s)": round(r["sum"], 3),
+                "p50 (ms)": _ms(r["p50"]),
+                "p95 (ms)": _ms(r["p95"]),
+                "p99 (ms)": _ms(r["p99"]),
+            }
+            for r in timings
+        ],
+        use_container_width=True,
+        hide_index=True,
+    )
+
+st.subheader("Counters and gauges")
+if not values:
+    st.caption("Nothing recorded yet.")
+else:
+    st.dataframe(
+        [{"Metric": r["name"], "Type": r["kind"], "Labels": _labels(r), "Value": r["value"]} for r in values],
+        use_container_width=True,
+        hide_index=True,
+    )
+
+st.divider()
+
+col1, col2, col3 = st.columns(3)
+with col1:
+    if st.button("Write data/metrics.prom"):
+        st.success(f"Wrote {write_prometheus()}")
+with col2:
+    st.download_button("Download (Prometheus)", render_prometheus(), file_name="metrics.prom", mime="text/plain")
+with col3:
+    if st.button("Reset metrics"):
+        reset_metrics()
+        st.rerun()
+
+st.divider()
+
+st.subheader("Profiling")
+st.caption(
+    "While on, a sample of calls to Top Picks, login, interaction logging, listing generation and the map is run "
+    "under cProfile and tracemalloc. Captures are collapsed-stack files for flamegraph tools."
+)
+profiling = st.toggle("Profile requests", value=is_profiling())
+rate = st.slider("Share of calls to capture", 0.0, 1.0, value=get_sample_rate(), step=0.05)
+if profiling != is_profiling() or rate != get_sample_rate():
+    set_profiling(profiling, sample_rate=rate)
+
+captures = list_captures()
+if not captures:
+    st.caption("No captures yet.")
+else:
+    for capture in captures[:20]:
+        with st.expander(f"{capture['entry']} — {capture['capture']}"):
+            for path in capture["files"]:
+                st.download_button(path.name, path.read_bytes(), file_name=path.name, key=str(path))
+    if st.button("Delete captures"):
+        clear_captures()
+        st.rerun()
+
+st.divider()
+
+st.subheader("Orphaned records")
+st.caption(
+    "Sessions and interactions of deleted users are removed in the background, hourly and shortly after a deletion."
+)
+if st.button("Purge now"):
+    purge_orphans()
+report = last_purge_report()
+if not report:
+    st.caption("No purge has run in this process yet.")
+else:
+    st.dataframe(
+        [{"File": f"{name}.json", "Records removed": report[name]["rows"], "Bytes reclaimed": report[name]["bytes"]}
+         for name in ("sessions", "interactions")],
+        use_container_width=True,
+        hide_index=True,
+    )
+    st.caption(f"Took {report['seconds']:.3f} s.")
@@ -1,7 +1,11 @@
 import json
-import uuid, copy
+import uuid, copy, threading
 from pathlib import Path
 from dataclasses import dataclass, asdict
+from typing import Callable
+
+from metrics_service import histogram
+from storage_service import atomic_write_text, file_lock
 
 # Path to the users data
 USERS_DATA_PATH = Path(__file__).parent / "data" / "users.json"
@@ -14,11 +18,13 @@ USER_FIELDS = {
 """
 Handles all user logic. Owns the users record and JSON I/O for users.
 Has no knowledge of hashing algorithms or sessions. Just stores the hash for a given user.
+Every read-modify-write of users.json holds its file lock, and the file is replaced atomically, so concurrent signups
+and updates (threads or processes) are never lost and readers never see a partial file.
 """
 
-@dataclass
+@dataclass(slots=True)
 class User:
-    """Stored user record for auth and recommendations.
+    """Stored user record for auth and recommendations. Slotted, so instances carry no per-instance __dict__.
 
     Attributes:
         id: Stable UUID string.
@@ -50,6 +56,43 @@ class User:
 # HELPER FUNCTIONS (for internal use)
 # ======================================================================================================================
 
+_STORAGE_SECONDS = histogram("storage_seconds", "Time spent reading or writing a JSON data file", ("file", "op"))
+
+_listeners: list[Callable[[User], None]] = []
+_listeners_lock = threading.Lock()
+_deletion_listeners: list[Callable[[str], None]] = []
+
+def _notify(user: User) -> None:
+    """
+    Pass an updated user to every listener. A failing listener does not affect the others.
+
+    :param user: the updated user
+    :return: None
+    """
+    with _listeners_lock:
+        listeners = list(_listeners)
+    for callback in listeners:
+        try:
+            callback(user)
+        except Exception:
+            pass
+
+def _notify_deleted(user_id: str) -> None:
+    """
+    Pass the id of a deleted user to every deletion listener. A failing listener does not affect the others.
+
+    :param user_id: the deleted user's id
+    :return: None
+    """
+    with _listeners_lock:
+        listeners = list(_deletion_listeners)
+    for callback in listeners:
+        try:
+            callback(user_id)
+        except Exception:
+            pass
+
+@_STORAGE_SECONDS.timed(file="users", op="load")
 def _load_all() -> list[dict]:
     """
     Load all users data from the users.json file
@@ -59,6 +102,7 @@ def _load_all() -> list[dict]:
     users =  json.loads(USERS_DATA_PATH.read_text(encoding="utf-8"))
     return users
 
+@_STORAGE_SECONDS.timed(file="users", op="save")
 def _save_all(rows: list[dict]) -> None:
     """
     Save all users data to the users.json file
@@ -66,7 +110,7 @@ def _save_all(rows: list[dict]) -> None:
     :param rows: the data to be saved
     :return: None
     """
-    USERS_DATA_PATH.write_text(json.dumps(rows, indent=2), encoding="utf-8")
+    atomic_write_text(USERS_DATA_PATH, json.dumps(rows, indent=2))
 
 # ======================================================================================================================
 # API-STYLE FUNCTIONS (for internal and external use)
@@ -122,41 +166,53 @@ def create_user(*, email: str, first_name: str, last_name: str, **optional_field
         **optional_fields
     )
 
-    rows = _load_all()
-    rows.append(asdict(user))
-    _save_all(rows)
+    with file_lock(USERS_DATA_PATH):
+        rows = _load_all()
+        rows.append(asdict(user))
+        _save_all(rows)
     return user
 
 def update_user(user_id: str, **fields) -> User:
     """
-    Update a user with the given fields (some of them may be changed)
+    Update a user with the given fields (some of them may be changed). Raises ValueError if the new email belongs to
+    another user and KeyError if there is no such user.
     :param user_id: the users id
     :param fields: fields a user is able to update through the UI
     :return: the updated user
     """
-    rows = _load_all()
-    for i, row in enumerate(rows):
-        if row["id"] == user_id:
-            updated_user = copy.deepcopy(row)
-            for key, value in fields.items():
-                if key in USER_FIELDS:
-                    updated_user[key] = value
-            rows[i] = updated_user
-            _save_all(rows)
-            return User(**updated_user)
-    raise KeyError(f"User with id {user_id} not found")
+    with file_lock(USERS_DATA_PATH):
+        rows = _load_all()
+        email = fields.get("email")
+        if email is not None and any(r["email"] == email and r["id"] != user_id for r in rows):
+            raise ValueError("A user with this email already exists")
+        for i, row in enumerate(rows):
+            if row["id"] == user_id:
+                updated_user = copy.deepcopy(row)
+                for key, value in fields.items():
+                    if key in USER_FIELDS:
+                        updated_user[key] = value
+                rows[i] = updated_user
+                _save_all(rows)
+                break
+        else:
+            raise KeyError(f"User with id {user_id} not found")
+    user = User(**updated_user)
+    _notify(user)
+    return user
 
 def delete_user(user_id: str) -> bool:
     """
-    Delete a user
+    Delete a user. Their sessions and interactions are left to the deletion listeners (see purge_service).
     :param user_id: the user's id
     :return: TRUE if deletion succeeded; otherwise, FALSE
     """
-    rows = _load_all()
-    new_rows = [r for r in rows if r["id"] != user_id]
-    if len(new_rows) == len(rows):
-        return False
-    _save_all(new_rows)
+    with file_lock(USERS_DATA_PATH):
+        rows = _load_all()
+        new_rows = [r for r in rows if r["id"] != user_id]
+        if len(new_rows) == len(rows):
+            return False
+        _save_all(new_rows)
+    _notify_deleted(user_id)
     return True
 
 def get_user_preferences(user_id: str) -> dict:
@@ -175,13 +231,53 @@ def get_user_preferences(user_id: str) -> dict:
         "travel_end": user.travel_end
     }
 
+def subscribe_user_updates(callback: Callable[[User], None]) -> None:
+    """
+    Register a callback that receives the user after every update_user call in this process
+    :param callback: a function taking the updated user
+    :return: None
+    """
+    with _listeners_lock:
+        if callback not in _listeners:
+            _listeners.append(callback)
+
+def unsubscribe_user_updates(callback: Callable[[User], None]) -> None:
+    """
+    Remove a registered callback
+    :param callback: the callback
+    :return: None
+    """
+    with _listeners_lock:
+        if callback in _listeners:
+            _listeners.remove(callback)
+
+def subscribe_user_deletions(callback: Callable[[str], None]) -> None:
+    """
+    Register a callback that receives the id of every user deleted by this process
+    :param callback: a function taking the user id
+    :return: None
+    """
+    with _listeners_lock:
+        if callback not in _deletion_listeners:
+            _deletion_listeners.append(callback)
+
+def unsubscribe_user_deletions(callback: Callable[[str], None]) -> None:
+    """
+    Remove a registered deletion callback
+    :param callback: the callback
+    :return: None
+    """
+    with _listeners_lock:
+        if callback in _deletion_listeners:
+            _deletion_listeners.remove(callback)
+
 def reset_users_file() -> None:
     """
     Reset the users file to empty. Useful for resetting the app.
     :return: None
     """
-    USERS_DATA_PATH.parent.mkdir(parents=True, exist_ok=True)
-    USERS_DATA_PATH.write_text("[]", encoding="utf-8")
+    with file_lock(USERS_DATA_PATH):
+        atomic_write_text(USERS_DATA_PATH, "[]")
 
 def set_user_password_hash(user_id: str, password_hash: str) -> User:
     """
@@ -190,13 +286,14 @@ def set_user_password_hash(user_id: str, password_hash: str) -> User:
     :param password_hash: the new password hash
     :return: the updated user
     """
-    rows = _load_all()
-    for i, row in enumerate(rows):
-        if row["id"] == user_id:
-            row["password_hash"] = password_hash
-            rows[i] = row
-            _save_all(rows)
-            return User(**row)
+    with file_lock(USERS_DATA_PATH):
+        rows = _load_all()
+        for i, row in enumerate(rows):
+            if row["id"] == user_id:
+                row["password_hash"] = password_hash
+                rows[i] = row
+                _save_all(rows)
+                return User(**row)
     raise KeyError(f"User with id {user_id} not found")
 
 # ======================================================================================================================
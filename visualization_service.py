@@ -1,21 +1,250 @@
 from __future__ import annotations
-import pandas as pd
+import math, threading
+from typing import TYPE_CHECKING
 
-from properties_service import load_properties_from_disk
+from properties_service import catalog_fingerprint, load_properties_from_disk
+from profiling_service import profiled
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+
+MAP_COLUMNS = ["lat", "lon", "property_id", "location", "type", "nightly_price", "capacity"]
+
+# Zoom levels follow web maps: zoom z shows roughly 360 / 2**z degrees of longitude
+MIN_ZOOM = 1
+MAX_ZOOM = 14
+# Grid cells per viewport width used for clustering at every zoom
+CLUSTER_CELLS_ACROSS = 24
+# Upper bound on rows sent to the browser, whatever the catalog size
+MAX_MAP_POINTS = 2000
 
 """
 Handles backend functionality related to generating the map visualization
+
+Large catalogs are not sent to the browser as-is. A MapPyramid precomputes, for every zoom level, a grid of clusters
+(count, centroid and mean price of the listings in each cell; cells get smaller as the zoom increases). A map request
+names a viewport and a zoom and gets back either
+  - the individual listings in the viewport, if there are at most MAX_MAP_POINTS of them, or
+  - the clusters of that zoom level that overlap the viewport, or
+  - at the deepest zooms, an evenly decimated sample of at most MAX_MAP_POINTS listings.
+Either way the payload is bounded by MAX_MAP_POINTS rows regardless of catalog size.
+
+The map frame and its pyramid are cached for the whole process (so every Streamlit session shares them) and keyed on
+the catalog fingerprint: the catalog version plus the file's size and modification time, so edits made outside the
+versioned API are picked up too. The frame is assembled from one typed array per column rather than a list of dicts.
+Cached frames are shared; callers must not modify them in place.
 """
 
+class MapPyramid:
+    def __init__(self, df: pd.DataFrame):
+        import numpy as np
+
+        df = df.dropna(subset=["lat", "lon"])
+        self.df = df.reset_index(drop=True)
+        self.lat = self.df["lat"].to_numpy(dtype=float)
+        self.lon = self.df["lon"].to_numpy(dtype=float)
+        price = self.df["nightly_price"].to_numpy(dtype=float)
+
+        # Per zoom: sorted cell keys with their count, centroid and mean price
+        self.levels: dict[int, dict[str, np.ndarray]] = {}
+        for zoom in range(MIN_ZOOM, MAX_ZOOM + 1):
+            cell = cell_size_deg(zoom)
+            rows = np.floor((self.lat + 90.0) / cell).astype(np.int64)
+            cols = np.floor((self.lon + 180.0) / cell).astype(np.int64)
+            keys, inverse = np.unique(rows * 10_000_000 + cols, return_inverse=True)
+            count = np.bincount(inverse)
+            self.levels[zoom] = {
+                "row": keys // 10_000_000,
+                "col": keys % 10_000_000,
+                "count": count,
+                "lat": np.bincount(inverse, weights=self.lat) / count,
+                "lon": np.bincount(inverse, weights=self.lon) / count,
+                "price": np.bincount(inverse, weights=price) / count,
+            }
+
+        locations = self.df.groupby("location", observed=True)[["lat", "lon"]].mean()
+        self.location_centers = {loc: (float(r.lat), float(r.lon)) for loc, r in locations.iterrows()}
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    def bounds(self) -> tuple[float, float, float, float]:
+        """
+        Return the bounding box of every listing
+
+        :return: (min_lat, max_lat, min_lon, max_lon)
+        """
+        if not len(self):
+            return (-90.0, 90.0, -180.0, 180.0)
+        return float(self.lat.min()), float(self.lat.max()), float(self.lon.min()), float(self.lon.max())
+
+    def layer(self, min_lat: float, max_lat: float, min_lon: float, max_lon: float, zoom: int) -> pd.DataFrame:
+        """
+        Return what to draw for a viewport at a zoom level (see the module docstring)
+
+        :param min_lat: southern edge of the viewport
+        :param max_lat: northern edge of the viewport
+        :param min_lon: western edge of the viewport
+        :param max_lon: eastern edge of the viewport
+        :param zoom: the zoom level
+        :return: a DataFrame with lat, lon, count, nightly_price, size and kind ('point' or 'cluster') columns,
+                 plus the listing columns for points
+        """
+        import numpy as np
+        import pandas as pd
+
+        zoom = int(min(max(zoom, MIN_ZOOM), MAX_ZOOM))
+        level = self.levels[zoom]
+        cell = cell_size_deg(zoom)
+        r0, r1 = math.floor((min_lat + 90.0) / cell), math.floor((max_lat + 90.0) / cell)
+        c0, c1 = math.floor((min_lon + 180.0) / cell), math.floor((max_lon + 180.0) / cell)
+        visible = (level["row"] >= r0) & (level["row"] <= r1) & (level["col"] >= c0) & (level["col"] <= c1)
+        n_visible = int(level["count"][visible].sum())
+
+        if n_visible <= MAX_MAP_POINTS or zoom == MAX_ZOOM:
+            inside = np.flatnonzero(
+                (self.lat >= min_lat) & (self.lat <= max_lat) & (self.lon >= min_lon) & (self.lon <= max_lon)
+            )
+            if len(inside) > MAX_MAP_POINTS:
+                # Evenly spaced sample; deterministic so the map does not flicker between reruns
+                inside = inside[np.linspace(0, len(inside) - 1, MAX_MAP_POINTS).astype(np.int64)]
+            points = self.df.iloc[inside].copy()
+            points["count"] = 1
+            points["size"] = point_radius_m(zoom)
+            points["kind"] = "point"
+            return points.reset_index(drop=True)
+
+        idx = np.flatnonzero(visible)
+        if len(idx) > MAX_MAP_POINTS:
+            idx = idx[np.argsort(-level["count"][idx], kind="stable")[:MAX_MAP_POINTS]]
+        count = level["count"][idx]
+        return pd.DataFrame({
+            "lat": level["lat"][idx],
+            "lon": level["lon"][idx],
+            "count": count,
+            "nightly_price": np.round(level["price"][idx], 0),
+            # Cluster area grows with its count, capped at about one cell
+            "size": np.minimum(point_radius_m(zoom) * np.sqrt(count), cell * 111_000 / 2),
+            "kind": "cluster",
+        })
+
+# ======================================================================================================================
+# HELPER FUNCTIONS (for internal use)
+# ======================================================================================================================
+
+_cache: dict[str, object] = {"fingerprint": None, "frame": None, "pyramid": None}
+_cache_lock = threading.Lock()
+
+def _build_frame(props: list[dict]) -> pd.DataFrame:
+    """
+    Build the map frame from one typed array per column
+
+    :param props: the listings
+    :return: DataFrame with MAP_COLUMNS
+    """
+    import numpy as np
+    import pandas as pd
+
+    n = len(props)
+
+    def _numbers(field: str) -> np.ndarray:
+        return np.fromiter(
+            (v if isinstance(v := p.get(field), (int, float)) else np.nan for p in props), dtype=np.float64, count=n
+        )
+
+    return pd.DataFrame({
+        "lat": _numbers("lat"),
+        "lon": _numbers("lon"),
+        "property_id": np.array([p.get("property_id") for p in props], dtype=object),
+        # Few distinct values: categoricals store each string once
+        "location": pd.Categorical([p.get("location") for p in props]),
+        "type": pd.Categorical([p.get("type") for p in props]),
+        "nightly_price": _numbers("nightly_price"),
+        "capacity": _numbers("capacity"),
+    }, columns=MAP_COLUMNS)
+
+def _refresh() -> None:
+    """
+    Rebuild the cached frame if the catalog changed since it was built (call with _cache_lock held)
+
+    :return: None
+    """
+    fingerprint = catalog_fingerprint()
+    if _cache["fingerprint"] != fingerprint:
+        _cache["frame"] = _build_frame(load_properties_from_disk())
+        _cache["pyramid"] = None
+        _cache["fingerprint"] = fingerprint
+
+def cell_size_deg(zoom: int) -> float:
+    """
+    Return the cluster cell size at a zoom level
+
+    :param zoom: the zoom level
+    :return: the cell size in degrees
+    """
+    return 360.0 / (2 ** zoom) / CLUSTER_CELLS_ACROSS
+
+def point_radius_m(zoom: int) -> float:
+    """
+    Return a marker radius that stays a few pixels wide at a zoom level
+
+    :param zoom: the zoom level
+    :return: the radius in metres
+    """
+    return 40_000_000 / (2 ** zoom) / 256 * 3
+
+def zoom_for_span(span_deg: float) -> int:
+    """
+    Return the zoom level at which a span of longitude fills the viewport
+
+    :param span_deg: the span in degrees
+    :return: the zoom level
+    """
+    if span_deg <= 0:
+        return MAX_ZOOM
+    return int(min(max(math.floor(math.log2(360.0 / span_deg)), MIN_ZOOM), MAX_ZOOM))
+
+# ======================================================================================================================
+# API-STYLE FUNCTIONS
+# ======================================================================================================================
+
 def get_map_dataframe() -> pd.DataFrame:
     """
-    Convert properties directly to a DataFrame for st.map.
+    Return the properties as a DataFrame for st.map, built once per catalog version and shared by all callers.
+
+    :return: DataFrame (read-only)
+    """
+    with _cache_lock:
+        _refresh()
+        return _cache["frame"]
+
+@profiled("get_map_pyramid")
+def get_map_pyramid() -> MapPyramid:
+    """
+    Return the clusters of every zoom level for the current catalog, built once per catalog version
+
+    :return: the pyramid
+    """
+    with _cache_lock:
+        _refresh()
+        if _cache["pyramid"] is None:
+            _cache["pyramid"] = MapPyramid(_cache["frame"])
+        return _cache["pyramid"]
+
+def build_map_pyramid() -> MapPyramid:
+    """
+    Precompute the clusters of every zoom level for the catalog on disk, bypassing the cache
+
+    :return: the pyramid
+    """
+    return MapPyramid(_build_frame(load_properties_from_disk()))
+
+def clear_map_cache() -> None:
+    """
+    Drop the cached frame and pyramid. For dev/testing purposes.
 
-    :return: DataFrame
+    :return: None
     """
-    props = load_properties_from_disk()
-    if not props:
-        return pd.DataFrame(columns=["lat", "lon"])
-    return pd.DataFrame(props)[
-        ["lat", "lon", "property_id", "location", "type", "nightly_price", "capacity"]
-    ]
\ No newline at end of file
+    with _cache_lock:
+        _cache.update(fingerprint=None, frame=None, pyramid=None)